@@ -0,0 +1,396 @@
+"""
+Almacenamiento de medidas
+Abstrae la forma en que se guardan las lecturas crudas. El modo se elige con
+MEDIDAS_ALMACENAMIENTO:
+
+- documentos: un documento por lectura en "medidas" (modo original)
+- timeseries: colección de series de tiempo nativa de MongoDB "medidas_ts"
+- buckets: un documento por sensor/campo/hora en "medidas_buckets" con la
+  lista de muestras {t, v}
+
+Todas las lecturas se exponen con la forma plana original
+{_id, sensor_id, campo_id, valor, timestamp} mediante etapas de agregación,
+para que los endpoints no dependan del modo.
+"""
+
+import os
+
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne, DeleteOne
+
+from database import get_db, asegurar_indices
+
+MODOS = ("documentos", "timeseries", "buckets")
+MODO = os.getenv("MEDIDAS_ALMACENAMIENTO", "documentos")
+
+
+def _hora(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def filtro_despues_de(orden, despues_de):
+    """Filtro de paginación por clave (keyset): lecturas posteriores a (timestamp, _id)
+    en el orden dado. El orden de la consulta debe ser {timestamp, _id}."""
+    timestamp, id_medida = despues_de
+    estricto = "$lt" if orden < 0 else "$gt"
+    inclusivo = "$lte" if orden < 0 else "$gte"
+    return {
+        "timestamp": {inclusivo: timestamp},
+        "$or": [{"timestamp": {estricto: timestamp}}, {"_id": {estricto: id_medida}}],
+    }
+
+
+class AlmacenDocumentos:
+    """Un documento por lectura (modo original)."""
+
+    modo = "documentos"
+    nombre_coleccion = "medidas"
+    # Índices declarados (ver indices.py); _id al final de cada índice para
+    # ordenar por (timestamp, _id) sin ordenar en memoria
+    indices = [
+        ([("sensor_id", 1), ("campo_id", 1), ("timestamp", -1), ("_id", -1)], {}),
+        ([("timestamp", -1), ("_id", -1)], {}),
+        ([("sensor_id", 1), ("timestamp", 1), ("_id", 1)], {}),
+    ]
+
+    def coleccion(self):
+        db = get_db()
+        return db[self.nombre_coleccion] if db is not None else None
+
+    def configurar(self, db):
+        """Crea la colección y, si está vacía, los índices que falten. Retorna cuántos índices creó.
+
+        Corre antes de publicar la conexión, así que no construye índices
+        sobre una colección con datos: sería una construcción completa por
+        índice con /ready en 503. En ese caso solo avisa; el cambio de índices
+        se hace con `python mantenimiento.py indices --aplicar`.
+        """
+        coleccion = db[self.nombre_coleccion]
+        if coleccion.estimated_document_count() == 0:
+            return asegurar_indices(coleccion, self.indices)
+        existentes = {tuple((k, int(v) if isinstance(v, float) else v) for k, v in info["key"])
+                      for info in coleccion.index_information().values()}
+        faltantes = [claves for claves, _ in self.indices if tuple(claves) not in existentes]
+        if faltantes:
+            print(f"[WARN] {len(faltantes)} indices de {self.nombre_coleccion} pendientes; "
+                  "ejecute 'python mantenimiento.py indices --aplicar'")
+        return 0
+
+    def insertar(self, documentos):
+        self.coleccion().insert_many(documentos, ordered=False)
+
+    def operaciones_insercion(self, documentos):
+        """Operaciones de escritura equivalentes a insertar(), para bulk_write
+        con cualquier cliente (también AsyncMongoClient)."""
+        return [InsertOne(d) for d in documentos]
+
+    def etapas_consulta(self, filtro, orden=-1, limite=None, despues_de=None):
+        """Etapas que producen lecturas planas que cumplen `filtro`.
+
+        `orden` (1 o -1) ordena por timestamp y _id; None deja el orden sin
+        definir. `limite` y `despues_de` (timestamp, _id de la última lectura de
+        la página anterior) solo se aplican junto con un orden.
+        """
+        if orden and despues_de:
+            filtro = {"$and": [filtro, filtro_despues_de(orden, despues_de)]}
+        etapas = [{"$match": filtro}]
+        if orden:
+            etapas.append({"$sort": {"timestamp": orden, "_id": orden}})
+        if orden and limite:
+            etapas.append({"$limit": limite})
+        return etapas
+
+    def contar(self):
+        return self.coleccion().count_documents({})
+
+    def contar_estimado(self):
+        """Total aproximado desde los metadatos de la colección, sin recorrerla."""
+        return self.coleccion().estimated_document_count()
+
+    def ultimo_timestamp(self):
+        ultima = self.coleccion().find_one({}, {"timestamp": 1}, sort=[("timestamp", -1)])
+        return ultima["timestamp"] if ultima else None
+
+    def primer_timestamp(self):
+        primera = self.coleccion().find_one({}, {"timestamp": 1}, sort=[("timestamp", 1)])
+        return primera["timestamp"] if primera else None
+
+    def borrar_sensor(self, sensor_id):
+        return self.coleccion().delete_many({"sensor_id": sensor_id}).deleted_count
+
+    def sensores_con_medidas(self, hasta):
+        """Ids de sensores con lecturas anteriores a `hasta`."""
+        return self.coleccion().distinct("sensor_id", {"timestamp": {"$lt": hasta}})
+
+    def borrar_ids(self, ids, tam_lote=10000):
+        """Borra exactamente las lecturas indicadas (los _id que devolvió etapas_consulta). Retorna cuántas."""
+        borradas = 0
+        for inicio in range(0, len(ids), tam_lote):
+            borradas += self.coleccion().delete_many({"_id": {"$in": ids[inicio:inicio + tam_lote]}}).deleted_count
+        return borradas
+
+
+class AlmacenTimeSeries(AlmacenDocumentos):
+    """Colección de series de tiempo con sensor/campo como metaField."""
+
+    modo = "timeseries"
+    nombre_coleccion = "medidas_ts"
+    _campos_meta = {"sensor_id": "meta.sensor_id", "campo_id": "meta.campo_id"}
+    indices = [([("meta.sensor_id", 1), ("meta.campo_id", 1), ("timestamp", -1)], {})]
+
+    def configurar(self, db):
+        if self.nombre_coleccion not in db.list_collection_names():
+            db.create_collection(self.nombre_coleccion, timeseries={
+                "timeField": "timestamp",
+                "metaField": "meta",
+                "granularity": "seconds",
+            })
+        return super().configurar(db)
+
+    def _documento(self, d):
+        return {
+            "timestamp": d["timestamp"],
+            "meta": {"sensor_id": d["sensor_id"], "campo_id": d["campo_id"]},
+            "valor": d["valor"],
+        }
+
+    def insertar(self, documentos):
+        self.coleccion().insert_many([self._documento(d) for d in documentos], ordered=False)
+
+    def operaciones_insercion(self, documentos):
+        return [InsertOne(self._documento(d)) for d in documentos]
+
+    def _traducir(self, filtro):
+        return {self._campos_meta.get(k, k): v for k, v in filtro.items()}
+
+    def etapas_consulta(self, filtro, orden=-1, limite=None, despues_de=None):
+        filtro = self._traducir(filtro)
+        if orden and despues_de:
+            filtro = {"$and": [filtro, filtro_despues_de(orden, despues_de)]}
+        etapas = [{"$match": filtro}]
+        if orden:
+            etapas.append({"$sort": {"timestamp": orden, "_id": orden}})
+        if orden and limite:
+            etapas.append({"$limit": limite})
+        etapas.append({"$project": {
+            "_id": 1,
+            "sensor_id": "$meta.sensor_id",
+            "campo_id": "$meta.campo_id",
+            "valor": 1,
+            "timestamp": 1,
+        }})
+        return etapas
+
+    def borrar_sensor(self, sensor_id):
+        return self.coleccion().delete_many({"meta.sensor_id": sensor_id}).deleted_count
+
+    def sensores_con_medidas(self, hasta):
+        return self.coleccion().distinct("meta.sensor_id", {"timestamp": {"$lt": hasta}})
+
+    def borrar_ids(self, ids, tam_lote=10000):
+        # Borrar por _id en series de tiempo requiere MongoDB 7.0+
+        return super().borrar_ids(ids, tam_lote)
+
+
+class AlmacenBuckets(AlmacenDocumentos):
+    """Un documento por sensor/campo/hora con las muestras en un arreglo."""
+
+    modo = "buckets"
+    nombre_coleccion = "medidas_buckets"
+    indices = [
+        ([("sensor_id", 1), ("campo_id", 1), ("hora", -1)], {"unique": True}),
+        ([("hora", -1)], {}),
+    ]
+
+    def insertar(self, documentos):
+        operaciones = self.operaciones_insercion(documentos)
+        if operaciones:
+            self.coleccion().bulk_write(operaciones, ordered=False)
+
+    def operaciones_insercion(self, documentos):
+        grupos = {}
+        for d in documentos:
+            clave = (d["sensor_id"], d["campo_id"], _hora(d["timestamp"]))
+            grupos.setdefault(clave, []).append(d)
+        operaciones = [
+            UpdateOne(
+                {"sensor_id": sensor_id, "campo_id": campo_id, "hora": hora},
+                {
+                    "$push": {"muestras": {"$each": [{"t": d["timestamp"], "v": d["valor"]} for d in docs]}},
+                    "$inc": {"n": len(docs)},
+                    "$min": {"primero": min(d["timestamp"] for d in docs)},
+                    "$max": {"ultimo": max(d["timestamp"] for d in docs)},
+                },
+                upsert=True
+            )
+            for (sensor_id, campo_id, hora), docs in grupos.items()
+        ]
+        return operaciones
+
+    def _filtro_buckets(self, filtro):
+        """Traduce el filtro plano a uno sobre buckets (el rango se amplía a horas completas)."""
+        filtro_buckets = {k: v for k, v in filtro.items() if k != "timestamp"}
+        rango = filtro.get("timestamp")
+        if isinstance(rango, dict):
+            rango_hora = {}
+            for operador in ("$gte", "$gt"):
+                if operador in rango:
+                    rango_hora["$gte"] = _hora(rango[operador])
+            for operador in ("$lte", "$lt"):
+                if operador in rango:
+                    rango_hora["$lte"] = rango[operador]
+            if rango_hora:
+                filtro_buckets["hora"] = rango_hora
+        return filtro_buckets
+
+    def _acotar_por_limite(self, filtro, filtro_buckets, orden, limite):
+        """Restringe los buckets a los necesarios para las primeras `limite` lecturas.
+
+        Cada bucket tiene al menos una muestra, así que las `limite` lecturas más
+        recientes están en buckets con hora >= la del bucket número `limite`.
+        Para contar solo buckets completamente dentro del rango se excluye el
+        bucket del extremo que puede estar recortado por el filtro de tiempo.
+        """
+        rango = filtro.get("timestamp") if isinstance(filtro.get("timestamp"), dict) else {}
+        filtro_corte = dict(filtro_buckets)
+        hora = dict(filtro_corte.get("hora", {}))
+        if orden < 0:
+            extremo = rango.get("$lte", rango.get("$lt"))
+            if extremo is not None:
+                hora.pop("$lte", None)
+                hora["$lt"] = _hora(extremo)
+        else:
+            extremo = rango.get("$gte", rango.get("$gt"))
+            if extremo is not None:
+                hora.pop("$gte", None)
+                hora["$gt"] = _hora(extremo)
+        if hora:
+            filtro_corte["hora"] = hora
+
+        corte = self.coleccion().find(filtro_corte, {"hora": 1}).sort("hora", orden).skip(limite - 1).limit(1)
+        corte = next(iter(corte), None)
+        if corte is None:
+            return filtro_buckets
+        acotado = dict(filtro_buckets)
+        operador = "$gte" if orden < 0 else "$lte"
+        acotado["hora"] = dict(acotado.get("hora", {}), **{operador: corte["hora"]})
+        return acotado
+
+    def etapas_consulta(self, filtro, orden=-1, limite=None, despues_de=None):
+        if orden and despues_de:
+            # Acotar también los buckets por el timestamp de la última lectura
+            rango = dict(filtro["timestamp"]) if isinstance(filtro.get("timestamp"), dict) else {}
+            rango["$lte" if orden < 0 else "$gte"] = despues_de[0]
+            filtro = dict(filtro, timestamp=rango)
+        filtro_buckets = self._filtro_buckets(filtro)
+        if orden and limite:
+            filtro_buckets = self._acotar_por_limite(filtro, filtro_buckets, orden, limite)
+        etapas = [
+            {"$match": filtro_buckets},
+            {"$unwind": {"path": "$muestras", "includeArrayIndex": "indice"}},
+            {"$project": {
+                "_id": {"$concat": [{"$toString": "$_id"}, ":", {"$toString": "$indice"}]},
+                "sensor_id": 1,
+                "campo_id": 1,
+                "valor": "$muestras.v",
+                "timestamp": "$muestras.t",
+            }},
+        ]
+        if "timestamp" in filtro:
+            etapas.append({"$match": {"timestamp": filtro["timestamp"]}})
+        if orden and despues_de:
+            etapas.append({"$match": filtro_despues_de(orden, despues_de)})
+        if orden:
+            etapas.append({"$sort": {"timestamp": orden, "_id": orden}})
+        if orden and limite:
+            etapas.append({"$limit": limite})
+        return etapas
+
+    def contar(self):
+        resultado = list(self.coleccion().aggregate([{"$group": {"_id": None, "total": {"$sum": "$n"}}}]))
+        return resultado[0]["total"] if resultado else 0
+
+    def contar_estimado(self):
+        # Cada documento es un bucket de muchas lecturas: se suman los n
+        return self.contar()
+
+    def ultimo_timestamp(self):
+        ultimo = self.coleccion().find_one({}, {"ultimo": 1}, sort=[("hora", -1), ("ultimo", -1)])
+        return ultimo["ultimo"] if ultimo else None
+
+    def primer_timestamp(self):
+        primero = self.coleccion().find_one({}, {"primero": 1}, sort=[("hora", 1), ("primero", 1)])
+        return primero["primero"] if primero else None
+
+    def borrar_sensor(self, sensor_id):
+        borradas = self.contar_sensor(sensor_id)
+        self.coleccion().delete_many({"sensor_id": sensor_id})
+        return borradas
+
+    def contar_sensor(self, sensor_id, filtro_hora=None):
+        filtro = {"sensor_id": sensor_id}
+        if filtro_hora:
+            filtro["hora"] = filtro_hora
+        resultado = list(self.coleccion().aggregate([
+            {"$match": filtro},
+            {"$group": {"_id": None, "total": {"$sum": "$n"}}},
+        ]))
+        return resultado[0]["total"] if resultado else 0
+
+    def sensores_con_medidas(self, hasta):
+        return self.coleccion().distinct("sensor_id", {"hora": {"$lt": hasta}})
+
+    def borrar_ids(self, ids, tam_lote=1000):
+        """Quita de cada bucket las muestras indicadas ("<bucket>:<índice>"). Retorna cuántas.
+
+        Las muestras se agregan siempre al final del arreglo, así que las leídas
+        de un bucket son sus primeras k: si el bucket recibió muestras nuevas
+        desde la lectura solo se recortan esas k, en lugar de borrarlo entero.
+        """
+        por_bucket = {}
+        for id_muestra in ids:
+            bucket, _, _ = id_muestra.rpartition(":")
+            por_bucket[ObjectId(bucket)] = por_bucket.get(ObjectId(bucket), 0) + 1
+        borradas = 0
+        pendientes = list(por_bucket.items())
+        for inicio in range(0, len(pendientes), tam_lote):
+            lote = pendientes[inicio:inicio + tam_lote]
+            # Buckets sin muestras nuevas: se borran enteros
+            self.coleccion().bulk_write([DeleteOne({"_id": b, "n": k}) for b, k in lote], ordered=False)
+            restantes = {d["_id"] for d in self.coleccion().find({"_id": {"$in": [b for b, _ in lote]}}, {"_id": 1})}
+            # Buckets que crecieron: se recortan sus k primeras muestras
+            operaciones = [
+                UpdateOne({"_id": b, "n": {"$gt": k}}, [
+                    {"$set": {
+                        "muestras": {"$slice": ["$muestras", k, {"$size": "$muestras"}]},
+                        "n": {"$subtract": ["$n", k]},
+                    }},
+                    {"$set": {"primero": {"$min": "$muestras.t"}}},
+                ])
+                for b, k in lote if b in restantes
+            ]
+            borradas += sum(k for b, k in lote if b not in restantes)
+            if operaciones:
+                modificados = self.coleccion().bulk_write(operaciones, ordered=False).modified_count
+                # Si alguno no se pudo recortar no se cuenta nada del grupo: el llamador verá la diferencia
+                if modificados == len(operaciones):
+                    borradas += sum(k for b, k in lote if b in restantes)
+        return borradas
+
+
+_ALMACENES = {
+    "documentos": AlmacenDocumentos,
+    "timeseries": AlmacenTimeSeries,
+    "buckets": AlmacenBuckets,
+}
+
+
+def crear_almacen(modo):
+    """Retorna el almacén del modo indicado."""
+    if modo not in _ALMACENES:
+        raise ValueError(f"Modo de almacenamiento inválido: {modo}. Opciones: {', '.join(MODOS)}")
+    return _ALMACENES[modo]()
+
+
+# Almacén configurado para este proceso
+almacen = crear_almacen(MODO)
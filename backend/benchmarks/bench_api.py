@@ -0,0 +1,356 @@
+"""
+Prueba de carga reproducible de la API completa
+
+1. Levanta servidor.app (python servidor.py o gunicorn) contra un MongoDB
+   local, en una base de datos aparte (--base, por defecto iotdb_bench) que
+   se vacía al empezar y se elimina al terminar.
+2. Siembra a través de la propia API N dispositivos, sensores vinculados a
+   ellos, M lecturas históricas (formato compacto de /guardar) y votos, así
+   las colecciones derivadas quedan igual que en producción.
+3. Durante --duracion segundos, una flota de dispositivos sintéticos envía
+   POST /guardar mientras lectores tipo tablero consultan /medidas,
+   /dispositivo/<n>, /estado y /votaciones/estadisticas, cada uno por su
+   propia conexión persistente.
+4. Reporta peticiones por segundo y latencias p50/p95/p99 por endpoint en JSON.
+   Con --comparar base.json compara contra una corrida anterior y termina con
+   código 1 si el p95 de algún endpoint empeoró más que --tolerancia.
+
+La base de datos por defecto no se usa nunca: --base iotdb se rechaza. Uso:
+
+    python benchmarks/bench_api.py --uri mongodb://localhost:27017 --salida base.json
+    python benchmarks/bench_api.py --uri mongodb://localhost:27017 --servidor gunicorn \\
+        --escritores 100 --lectores 20 --duracion 60 --comparar base.json
+
+Las variables de entorno del proceso (MEDIDAS_ALMACENAMIENTO, MEDIDAS_BUFFER,
+GUNICORN_WORKERS...) se pasan al servidor, así se comparan configuraciones.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+from pymongo import MongoClient
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CAMPOS = [("temperatura", "float"), ("humedad", "float"), ("ph", "float"), ("riego", "boolean")]
+CULTIVOS = ["maiz", "tomate", "yuca", "frijol"]
+
+
+# --- Servidor ---
+
+def levantar_servidor(args):
+    entorno = dict(os.environ, MONGO_URI=args.uri, MONGO_DB=args.base, PORT=str(args.puerto),
+                   BIND_HOST="127.0.0.1", ALLOW_START_WITHOUT_DB="1")
+    if args.servidor == "gunicorn":
+        comando = ["gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"]
+    else:
+        comando = [sys.executable, "servidor.py"]
+    proceso = subprocess.Popen(comando, cwd=BACKEND, env=entorno,
+                               stdout=subprocess.DEVNULL if not args.verbose else None,
+                               stderr=subprocess.DEVNULL if not args.verbose else None)
+    url = f"http://127.0.0.1:{args.puerto}"
+    limite = time.monotonic() + args.espera
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise SystemExit(f"El servidor terminó al arrancar (código {proceso.returncode})")
+        try:
+            with urllib.request.urlopen(f"{url}/ready", timeout=2) as r:
+                if r.status == 200:
+                    return proceso, url
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.2)
+    proceso.terminate()
+    raise SystemExit(f"El servidor no estuvo listo en {args.espera} s (ver /ready)")
+
+
+def _pedir(url, metodo="GET", datos=None):
+    cuerpo = json.dumps(datos).encode("utf-8") if datos is not None else None
+    peticion = urllib.request.Request(url, data=cuerpo, method=metodo,
+                                      headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(peticion, timeout=60) as r:
+        return json.loads(r.read() or b"null")
+
+
+# --- Siembra ---
+
+def sembrar(url, args):
+    """Crea dispositivos, sensores, lecturas históricas y votos a través de la API."""
+    inicio = time.perf_counter()
+    dispositivos = [
+        _pedir(f"{url}/dispositivos", "POST", {"nombre": f"Dispositivo{d + 1}", "ubicacion": "bench"})["id"]
+        for d in range(args.dispositivos)
+    ]
+    for s in range(args.sensores):
+        sensor_id = _pedir(f"{url}/agregar_sensor", "POST", {
+            "sensor": f"Sensor{s}", "tipo_sensor": "bench", "activo": True,
+            "campos": [{"nombre_campo": nombre, "tipo_campo": tipo} for nombre, tipo in CAMPOS],
+        })["sensor_id"]
+        _pedir(f"{url}/sensores/{sensor_id}/vincular", "PUT", {"dispositivo_id": dispositivos[s % len(dispositivos)]})
+    sensores = _pedir(f"{url}/listar_sensores_campos")
+
+    # Lecturas históricas: una fila por sensor cada --intervalo segundos hacia atrás,
+    # en peticiones compactas de unas 5000 lecturas
+    filas_por_sensor = max(1, args.lecturas // (len(sensores) * len(CAMPOS)))
+    ahora = datetime.now(timezone.utc).timestamp()
+    base = ahora - filas_por_sensor * args.intervalo
+    filas_por_lote = max(1, 5000 // (len(sensores) * len(CAMPOS)))
+    sembradas = 0
+    for desde in range(0, filas_por_sensor, filas_por_lote):
+        filas = min(filas_por_lote, filas_por_sensor - desde)
+        lotes = []
+        for sensor in sensores:
+            valores = []
+            for f in range(filas):
+                valores += [20 + random.random() * 10, 40 + random.random() * 40,
+                            5.5 + random.random() * 2, (desde + f) % 2 == 0]
+            lotes.append({
+                "s": sensor["sensor_id"],
+                "c": [c["campo_id"] for c in sensor["campos"]],
+                "v": valores,
+                "dt": [(desde + f) * args.intervalo for f in range(filas)],
+            })
+        _pedir(f"{url}/guardar", "POST", {"t": base, "l": lotes})
+        sembradas += filas * len(CAMPOS) * len(sensores)
+
+    for v in range(args.votos):
+        _pedir(f"{url}/votacion", "POST", {
+            "rating": random.randint(1, 5), "dispositivo": v % args.dispositivos + 1,
+            "cultivo": CULTIVOS[v % len(CULTIVOS)], "medio": "terreno" if v % 2 else "aire",
+        })
+    return {
+        "dispositivos": len(dispositivos),
+        "sensores": len(sensores),
+        "lecturas": sembradas,
+        "votos": args.votos,
+        "segundos": round(time.perf_counter() - inicio, 2),
+    }
+
+
+# --- Carga ---
+
+def _peticion(netloc, metodo, ruta, cuerpo=b""):
+    cabecera = f"{metodo} {ruta} HTTP/1.1\r\nHost: {netloc}\r\n"
+    if cuerpo:
+        cabecera += f"Content-Type: application/json\r\nContent-Length: {len(cuerpo)}\r\n"
+    return (cabecera + "\r\n").encode("latin-1") + cuerpo
+
+
+async def _leer_respuesta(lector):
+    """Lee una respuesta completa. Retorna (status, True si el servidor cierra la conexión)."""
+    cabecera = await lector.readuntil(b"\r\n\r\n")
+    lineas = cabecera.decode("latin-1").split("\r\n")
+    version, status = lineas[0].split(" ")[:2]
+    cabeceras = {}
+    for linea in lineas[1:]:
+        nombre, _, valor = linea.partition(":")
+        cabeceras[nombre.strip().lower()] = valor.strip().lower()
+    cerrar = cabeceras.get("connection") == "close" or (version == "HTTP/1.0" and cabeceras.get("connection") != "keep-alive")
+    if cabeceras.get("transfer-encoding") == "chunked":
+        while True:
+            largo = int((await lector.readuntil(b"\r\n")).split(b";")[0], 16)
+            await lector.readexactly(largo + 2)
+            if largo == 0:
+                break
+    elif "content-length" in cabeceras:
+        await lector.readexactly(int(cabeceras["content-length"]))
+    else:
+        await lector.read()
+        cerrar = True
+    return int(status), cerrar
+
+
+def _percentil(valores, p):
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+async def _cliente(host, puerto, siguiente, hasta, resultados):
+    """Conexión persistente que envía las peticiones de `siguiente()` hasta `hasta`.
+
+    siguiente() retorna (endpoint, bytes de la petición). Reconecta si el
+    servidor cierra la conexión.
+    """
+    while time.perf_counter() < hasta:
+        try:
+            lector, escritor = await asyncio.open_connection(host, puerto)
+        except OSError:
+            errores = resultados.setdefault("conexion", {"latencias": [], "errores": {}})["errores"]
+            errores["rechazada"] = errores.get("rechazada", 0) + 1
+            await asyncio.sleep(0.1)
+            continue
+        try:
+            while time.perf_counter() < hasta:
+                endpoint, peticion = siguiente()
+                datos = resultados.setdefault(endpoint, {"latencias": [], "errores": {}})
+                inicio = time.perf_counter()
+                escritor.write(peticion)
+                await escritor.drain()
+                status, cerrar = await _leer_respuesta(lector)
+                if status == 200:
+                    datos["latencias"].append(time.perf_counter() - inicio)
+                else:
+                    datos["errores"][status] = datos["errores"].get(status, 0) + 1
+                if cerrar:
+                    break
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+
+async def cargar(url, args, sensores):
+    partes = urlsplit(url)
+    netloc = partes.netloc
+    hasta = time.perf_counter() + args.duracion
+    resultados = {}
+
+    def escritor():
+        # Un dispositivo envía todos los campos numéricos de un sensor al azar
+        sensor = random.choice(sensores)
+        measures = {sensor: [{"detail": nombre, "value": round(20 + random.random() * 10, 2)}
+                             for nombre, tipo in CAMPOS if tipo == "float"]}
+        cuerpo = json.dumps({"measures": measures}).encode("utf-8")
+        return "POST /guardar", _peticion(netloc, "POST", "/guardar", cuerpo)
+
+    lecturas_tablero = [
+        ("GET /medidas", f"/medidas?limite={args.limite}"),
+        ("GET /dispositivo/<n>", None),
+        ("GET /estado", "/estado"),
+        ("GET /votaciones/estadisticas", "/votaciones/estadisticas"),
+    ]
+
+    def lector():
+        endpoint, ruta = random.choice(lecturas_tablero)
+        if ruta is None:
+            ruta = f"/dispositivo/{random.randint(1, args.dispositivos)}"
+        return endpoint, _peticion(netloc, "GET", ruta)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(
+        *[_cliente(partes.hostname, partes.port, escritor, hasta, resultados) for _ in range(args.escritores)],
+        *[_cliente(partes.hostname, partes.port, lector, hasta, resultados) for _ in range(args.lectores)],
+    )
+    transcurrido = time.perf_counter() - inicio
+    resumen = {}
+    for endpoint, datos in sorted(resultados.items()):
+        latencias = sorted(datos["latencias"])
+        resumen[endpoint] = {
+            "peticiones": len(latencias),
+            "por_segundo": round(len(latencias) / transcurrido, 1),
+            "p50_ms": round(_percentil(latencias, 0.50) * 1000, 2) if latencias else None,
+            "p95_ms": round(_percentil(latencias, 0.95) * 1000, 2) if latencias else None,
+            "p99_ms": round(_percentil(latencias, 0.99) * 1000, 2) if latencias else None,
+            "errores": {str(k): v for k, v in datos["errores"].items()},
+        }
+    return resumen
+
+
+def comparar(actual, anterior, tolerancia):
+    """Imprime la variación por endpoint. Retorna los endpoints cuyo p95 empeoró más que la tolerancia."""
+    regresiones = []
+    print("\nComparación con la corrida anterior (p95 y pet/s):", file=sys.stderr)
+    for endpoint, datos in actual.items():
+        previo = anterior.get(endpoint)
+        if not previo or not previo.get("p95_ms") or not datos.get("p95_ms"):
+            continue
+        cambio = datos["p95_ms"] / previo["p95_ms"] - 1
+        cambio_rps = datos["por_segundo"] / previo["por_segundo"] - 1 if previo["por_segundo"] else 0
+        marca = ""
+        if cambio > tolerancia:
+            regresiones.append(endpoint)
+            marca = "  <-- REGRESIÓN"
+        print(f"  {endpoint:30} p95 {previo['p95_ms']:8.2f} -> {datos['p95_ms']:8.2f} ms ({cambio:+.0%})"
+              f"   pet/s {cambio_rps:+.0%}{marca}", file=sys.stderr)
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", required=True, help="MongoDB de pruebas, p. ej. mongodb://localhost:27017")
+    parser.add_argument("--base", default="iotdb_bench", help="Base de datos de la prueba (se elimina al terminar)")
+    parser.add_argument("--servidor", choices=["flask", "gunicorn"], default="flask")
+    parser.add_argument("--puerto", type=int, default=8870)
+    parser.add_argument("--espera", type=float, default=60, help="Segundos máximos hasta que /ready responda 200")
+    parser.add_argument("--dispositivos", type=int, default=3)
+    parser.add_argument("--sensores", type=int, default=12)
+    parser.add_argument("--lecturas", type=int, default=100000, help="Lecturas históricas a sembrar")
+    parser.add_argument("--intervalo", type=float, default=60, help="Segundos entre lecturas históricas")
+    parser.add_argument("--votos", type=int, default=200)
+    parser.add_argument("--escritores", type=int, default=50, help="Conexiones de dispositivos en POST /guardar")
+    parser.add_argument("--lectores", type=int, default=10, help="Conexiones de tableros en los GET")
+    parser.add_argument("--limite", type=int, default=100, help="'limite' de GET /medidas")
+    parser.add_argument("--duracion", type=float, default=30, help="Segundos de carga")
+    parser.add_argument("--semilla", type=int, default=1, help="Semilla aleatoria (corridas reproducibles)")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto, la salida estándar)")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Empeoramiento de p95 tolerado (0.2 = 20%%)")
+    parser.add_argument("--conservar", action="store_true", help="No eliminar la base de datos al terminar")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar la salida del servidor")
+    args = parser.parse_args()
+
+    if args.base == "iotdb":
+        raise SystemExit("--base iotdb es la base de datos de la aplicación: use otra")
+    random.seed(args.semilla)
+    mongo = MongoClient(args.uri, serverSelectionTimeoutMS=5000)
+    mongo.drop_database(args.base)
+
+    proceso, url = levantar_servidor(args)
+    try:
+        print(f"Sembrando {args.base} a través de {url}...", file=sys.stderr)
+        semilla = sembrar(url, args)
+        print(f"  {semilla}", file=sys.stderr)
+        sensores = [f"Sensor{s}" for s in range(args.sensores)]
+        print(f"Carga: {args.escritores} escritores, {args.lectores} lectores, {args.duracion:.0f} s", file=sys.stderr)
+        resultados = asyncio.run(cargar(url, args, sensores))
+    finally:
+        proceso.terminate()
+        try:
+            proceso.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proceso.kill()
+        if not args.conservar:
+            mongo.drop_database(args.base)
+
+    for endpoint, r in resultados.items():
+        if r["peticiones"]:
+            print(f"  {endpoint:30} {r['por_segundo']:9.1f} pet/s   p50 {r['p50_ms']:8.2f} ms"
+                  f"   p95 {r['p95_ms']:8.2f} ms   p99 {r['p99_ms']:8.2f} ms   errores {r['errores'] or 0}",
+                  file=sys.stderr)
+        else:
+            print(f"  {endpoint:30} sin respuestas correctas   errores {r['errores']}", file=sys.stderr)
+
+    informe = {
+        "fecha": datetime.now(timezone.utc).isoformat(),
+        "configuracion": {k: v for k, v in vars(args).items() if k not in ("uri", "salida", "comparar", "verbose")},
+        "entorno": {k: os.environ[k] for k in sorted(os.environ)
+                    if k.startswith(("MEDIDAS_", "GUNICORN_", "EVENTOS_", "ETAG_", "CATALOGO_", "JSON_"))},
+        "semilla": semilla,
+        "resultados": resultados,
+    }
+    texto = json.dumps(informe, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            archivo.write(texto + "\n")
+    else:
+        print(texto)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as archivo:
+            anterior = json.load(archivo)["resultados"]
+        if comparar(resultados, anterior, args.tolerancia):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Prueba de carga de la ingesta: Flask (/guardar) contra el servicio asíncrono
+
+Abre N conexiones HTTP/1.1 persistentes por destino y cada una envía POST
+/guardar en bucle durante --duracion segundos. Reporta peticiones por
+segundo, latencia (mediana, p95, p99) y respuestas con error por destino.
+Solo usa la biblioteca estándar (asyncio), así el cliente no es el cuello de
+botella con miles de conexiones.
+
+Los servidores deben estar levantados contra un MongoDB de pruebas y el sensor
+indicado debe existir y estar activo. Uso:
+
+    python servidor.py                          # Flask en :8860
+    uvicorn ingesta_async:app --port 8861       # servicio asíncrono
+    python benchmarks/bench_ingesta.py --sensor Sensor1 --campo temperatura \\
+        --destino flask=http://localhost:8860 --destino async=http://localhost:8861 \\
+        --conexiones 50 500 --duracion 15
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+
+def cuerpo_guardar(sensor, campo, lecturas):
+    measures = {sensor: [{"detail": campo, "value": 20.0 + i / 10} for i in range(lecturas)]}
+    return json.dumps({"measures": measures}).encode("utf-8")
+
+
+async def _leer_respuesta(lector):
+    cabecera = await lector.readuntil(b"\r\n\r\n")
+    lineas = cabecera.decode("latin-1").split("\r\n")
+    status = int(lineas[0].split(" ")[1])
+    largo = 0
+    for linea in lineas[1:]:
+        nombre, _, valor = linea.partition(":")
+        if nombre.strip().lower() == "content-length":
+            largo = int(valor)
+    if largo:
+        await lector.readexactly(largo)
+    return status
+
+
+async def _conexion(host, puerto, peticion, hasta, latencias, errores):
+    # Si el servidor cierra la conexión (p. ej. sin keep-alive) se vuelve a abrir
+    while time.perf_counter() < hasta:
+        try:
+            lector, escritor = await asyncio.open_connection(host, puerto)
+        except OSError:
+            errores["conexion"] = errores.get("conexion", 0) + 1
+            await asyncio.sleep(0.1)
+            continue
+        try:
+            while time.perf_counter() < hasta:
+                inicio = time.perf_counter()
+                escritor.write(peticion)
+                await escritor.drain()
+                status = await _leer_respuesta(lector)
+                if status == 200:
+                    latencias.append(time.perf_counter() - inicio)
+                else:
+                    errores[status] = errores.get(status, 0) + 1
+        except (OSError, asyncio.IncompleteReadError):
+            errores["reconexion"] = errores.get("reconexion", 0) + 1
+        finally:
+            escritor.close()
+
+
+def _percentil(valores, p):
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+async def medir(url, cuerpo, conexiones, duracion):
+    partes = urlsplit(url)
+    ruta = (partes.path.rstrip("/") or "") + "/guardar"
+    peticion = (
+        f"POST {ruta} HTTP/1.1\r\nHost: {partes.netloc}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(cuerpo)}\r\n\r\n"
+    ).encode("latin-1") + cuerpo
+    latencias, errores = [], {}
+    inicio = time.perf_counter()
+    hasta = inicio + duracion
+    await asyncio.gather(*[
+        _conexion(partes.hostname, partes.port or 80, peticion, hasta, latencias, errores)
+        for _ in range(conexiones)
+    ])
+    transcurrido = time.perf_counter() - inicio
+    latencias.sort()
+    return {
+        "peticiones": len(latencias),
+        "por_segundo": len(latencias) / transcurrido,
+        "mediana_ms": statistics.median(latencias) * 1000 if latencias else None,
+        "p95_ms": _percentil(latencias, 0.95) * 1000 if latencias else None,
+        "p99_ms": _percentil(latencias, 0.99) * 1000 if latencias else None,
+        "errores": errores,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--destino", action="append", required=True,
+                        help="nombre=url base del servidor (repetible)")
+    parser.add_argument("--sensor", required=True, help="Nombre de un sensor activo")
+    parser.add_argument("--campo", required=True, help="Nombre de un campo activo de tipo float")
+    parser.add_argument("--lecturas", type=int, default=5, help="Lecturas por petición")
+    parser.add_argument("--conexiones", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--duracion", type=float, default=15, help="Segundos por medición")
+    args = parser.parse_args()
+
+    cuerpo = cuerpo_guardar(args.sensor, args.campo, args.lecturas)
+    destinos = [d.split("=", 1) for d in args.destino]
+    for conexiones in args.conexiones:
+        print(f"\n{conexiones} conexiones, {args.lecturas} lecturas por petición, {args.duracion:.0f} s")
+        for nombre, url in destinos:
+            r = asyncio.run(medir(url, cuerpo, conexiones, args.duracion))
+            if not r["peticiones"]:
+                print(f"  {nombre:8} sin respuestas correctas   errores {r['errores']}")
+                continue
+            print(f"  {nombre:8} {r['por_segundo']:9.1f} pet/s   mediana {r['mediana_ms']:7.1f} ms"
+                  f"   p95 {r['p95_ms']:7.1f} ms   p99 {r['p99_ms']:7.1f} ms   errores {r['errores'] or 0}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Micro-benchmark de serialización JSON de /medidas
+
+Compara, para una respuesta con la forma de /medidas?limite=5000:
+
+- antes: el handler convierte timestamps/booleanos fila por fila, jsonify
+  serializa y el middleware after_request vuelve a leer, recorrer y
+  serializar la respuesta (convert_objectids)
+- despues: jsonify directo con el proveedor JSON de la app (json u orjson)
+
+No necesita MongoDB. Uso:
+
+    python benchmarks/bench_json.py [--filas 5000] [--repeticiones 50]
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from flask import Flask, json, jsonify
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from json_proveedor import ProveedorJSON, ProveedorOrjson, orjson  # noqa: E402
+
+
+def filas_medidas(n):
+    """Filas con la forma que entrega el pipeline de /medidas antes de serializar."""
+    inicio = datetime(2024, 1, 1)
+    return [
+        {
+            "_id": str(ObjectId()),
+            "sensor": f"Sensor{i % 8}",
+            "nombre_campo": ("temperatura", "humedad", "ph", "riego")[i % 4],
+            "valor": (i % 4 == 3) if i % 4 == 3 else 20.0 + (i % 100) / 10,
+            "timestamp": inicio + timedelta(seconds=i),
+        }
+        for i in range(n)
+    ]
+
+
+def convert_objectids(obj):
+    """Copia de la función del middleware anterior de servidor.py."""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    elif isinstance(obj, list):
+        return [convert_objectids(item) for item in obj]
+    elif isinstance(obj, dict):
+        return {key: convert_objectids(value) for key, value in obj.items()}
+    return obj
+
+
+def ruta_antes(app, filas):
+    medidas = [dict(f) for f in filas]
+    for medida in medidas:
+        medida['timestamp'] = medida['timestamp'].isoformat()
+        if isinstance(medida['valor'], bool):
+            medida['valor'] = str(medida['valor']).lower()
+    response = jsonify(medidas)
+    data = response.get_json()
+    response.set_data(json.dumps(convert_objectids(data)))
+    return response.get_data()
+
+
+def ruta_despues(app, filas):
+    return jsonify(filas).get_data()
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+    return {
+        "mediana_ms": round(tiempos[len(tiempos) // 2] * 1000, 3),
+        "min_ms": round(tiempos[0] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=5000)
+    parser.add_argument("--repeticiones", type=int, default=50)
+    args = parser.parse_args()
+
+    filas = filas_medidas(args.filas)
+    resultados = {}
+
+    app_antes = Flask("antes")
+    with app_antes.test_request_context():
+        resultados["antes (jsonify + after_request)"] = medir(lambda: ruta_antes(app_antes, filas), args.repeticiones)
+
+    # En la ruta nueva los booleanos ya llegan como texto desde el $project de MongoDB
+    filas_despues = [dict(f, valor=str(f['valor']).lower()) if isinstance(f['valor'], bool) else f for f in filas]
+    proveedores = [("despues (proveedor json)", ProveedorJSON)]
+    if orjson is not None:
+        proveedores.append(("despues (proveedor orjson)", ProveedorOrjson))
+    for nombre, proveedor in proveedores:
+        app = Flask(nombre)
+        app.json = proveedor(app)
+        with app.test_request_context():
+            resultados[nombre] = medir(lambda: ruta_despues(app, filas_despues), args.repeticiones)
+
+    base = resultados["antes (jsonify + after_request)"]["mediana_ms"]
+    print(f"Respuesta de /medidas con {args.filas} filas, {args.repeticiones} repeticiones")
+    for nombre, r in resultados.items():
+        print(f"  {nombre:<36} mediana {r['mediana_ms']:>9.3f} ms  min {r['min_ms']:>9.3f} ms  x{base / r['mediana_ms']:.1f}")
+    if orjson is None:
+        print("  (instale orjson para comparar también JSON_BACKEND=orjson)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Benchmark de resolución de nombres en /medidas
+
+Compara, leyendo N medidas (10k y 100k por defecto):
+
+- lookup: $lookup a sensores y búsqueda del campo en el pipeline
+  (MEDIDAS_RESOLUCION=lookup)
+- catalogo: proyección mínima sobre medidas y nombres desde un índice en
+  memoria sensor_id -> campos (MEDIDAS_RESOLUCION=catalogo)
+
+Usa las etapas y el nombrado reales de medidas.py (etapas_resolucion,
+nombrar_medidas). Necesita un MongoDB de pruebas: crea una base de datos aparte, la llena con
+datos sintéticos y la elimina al terminar. Uso:
+
+    python benchmarks/bench_lookup.py --uri mongodb://localhost:27017 [--filas 10000 100000]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# Las mismas etapas y el mismo nombrado que GET /medidas
+import medidas  # noqa: E402
+from catalogo import construir_catalogo  # noqa: E402
+
+
+def etapas_resolucion(modo):
+    """medidas.etapas_resolucion() con MEDIDAS_RESOLUCION=modo."""
+    anterior = medidas.MEDIDAS_RESOLUCION
+    medidas.MEDIDAS_RESOLUCION = modo
+    try:
+        return medidas.etapas_resolucion()
+    finally:
+        medidas.MEDIDAS_RESOLUCION = anterior
+
+
+def poblar(db, filas, sensores, campos_por_sensor):
+    db.sensores.drop()
+    db.medidas.drop()
+    lista_sensores = [
+        {
+            "_id": ObjectId(),
+            "nombre": f"Sensor{s}",
+            "activo": True,
+            "campos": [
+                {"_id": ObjectId(), "nombre_campo": f"campo{c}", "tipo_campo": "float", "activo": True}
+                for c in range(campos_por_sensor)
+            ],
+        }
+        for s in range(sensores)
+    ]
+    db.sensores.insert_many(lista_sensores)
+
+    inicio = datetime(2024, 1, 1)
+    lote = []
+    for i in range(filas):
+        sensor = lista_sensores[i % sensores]
+        campo = sensor["campos"][i % campos_por_sensor]
+        lote.append({
+            "sensor_id": sensor["_id"],
+            "campo_id": campo["_id"],
+            "valor": 20.0 + (i % 100) / 10,
+            "timestamp": inicio + timedelta(seconds=i),
+        })
+        if len(lote) == 10000:
+            db.medidas.insert_many(lote, ordered=False)
+            lote = []
+    if lote:
+        db.medidas.insert_many(lote, ordered=False)
+    db.medidas.create_index([("timestamp", -1), ("_id", -1)])
+
+
+def indice_por_id(db):
+    """Índice por id del catálogo (catalogo.construir_catalogo)."""
+    return construir_catalogo(list(db.sensores.find()))[1]
+
+
+def leer_lookup(db, limite, etapas):
+    etapas = [{"$sort": {"timestamp": -1, "_id": -1}}, {"$limit": limite}] + etapas
+    return list(medidas.omitir_sin_nombre(db.medidas.aggregate(etapas, batchSize=1000)))
+
+
+def leer_catalogo(db, limite, nombres, etapas):
+    etapas = [{"$sort": {"timestamp": -1, "_id": -1}}, {"$limit": limite}] + etapas
+    return list(medidas.nombrar_medidas(db.medidas.aggregate(etapas, batchSize=1000), nombres))
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), min(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--base", default="bench_sembrando_lookup", help="Base de datos temporal (se elimina al terminar)")
+    parser.add_argument("--filas", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--sensores", type=int, default=8)
+    parser.add_argument("--campos", type=int, default=6, help="Campos por sensor")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri)
+    db = client[args.base]
+    etapas_lookup = etapas_resolucion("lookup")
+    etapas_catalogo = etapas_resolucion("catalogo")
+    try:
+        for filas in args.filas:
+            poblar(db, filas, args.sensores, args.campos)
+            nombres = indice_por_id(db)
+            assert len(leer_lookup(db, filas, etapas_lookup)) == len(leer_catalogo(db, filas, nombres, etapas_catalogo)) == filas
+
+            print(f"\n{filas} filas, {args.sensores} sensores x {args.campos} campos")
+            lookup = medir(lambda: leer_lookup(db, filas, etapas_lookup), args.repeticiones)
+            catalogo = medir(lambda: leer_catalogo(db, filas, nombres, etapas_catalogo), args.repeticiones)
+            carga = medir(lambda: indice_por_id(db), args.repeticiones)
+            print(f"  lookup:   mediana {lookup[0] * 1000:8.1f} ms   min {lookup[1] * 1000:8.1f} ms")
+            print(f"  catalogo: mediana {catalogo[0] * 1000:8.1f} ms   min {catalogo[1] * 1000:8.1f} ms"
+                  f"   (x{lookup[0] / catalogo[0]:.1f})")
+            print(f"  recarga del catálogo (una vez por TTL): {carga[0] * 1000:.1f} ms")
+    finally:
+        client.drop_database(args.base)
+
+
+if __name__ == "__main__":
+    main()
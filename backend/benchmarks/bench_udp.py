@@ -0,0 +1,101 @@
+"""
+Benchmark del receptor UDP (ingesta_udp.py)
+
+- procesar: mide cuántas lecturas por segundo convierte ReceptorUDP.procesar
+  (decodificación, catálogo y validación de tipo) en un solo núcleo, con un
+  catálogo sintético y sin base de datos.
+- enviar: con --enviar host:puerto, envía datagramas a un receptor en marcha a
+  la tasa indicada; los contadores del receptor muestran cuántos llegaron.
+
+    python benchmarks/bench_udp.py [--sensores 100] [--campos 4] [--lineas 20]
+    python benchmarks/bench_udp.py --enviar 127.0.0.1:8862 --sensor Sensor1 --campo temperatura --tasa 20000
+"""
+
+import argparse
+import os
+import socket
+import sys
+import time
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ingesta_udp import ReceptorUDP  # noqa: E402
+
+
+def catalogo_sintetico(sensores, campos):
+    return {
+        f"Sensor{s}": {
+            "id": ObjectId(),
+            "campos": {f"campo{c}": {"id": ObjectId(), "tipo": "float"} for c in range(campos)},
+        } for s in range(sensores)
+    }
+
+
+def datagramas(sensores, campos, lineas, cantidad):
+    """Genera datagramas de `lineas` líneas, cada una con todos los campos de un sensor."""
+    resultado = []
+    marca = int(time.time())
+    for i in range(cantidad):
+        texto = "\n".join(
+            f"Sensor{(i * lineas + j) % sensores}," + ",".join(f"campo{c}={20 + (j % 50) / 10}" for c in range(campos))
+            + f" {marca}"
+            for j in range(lineas)
+        )
+        resultado.append(texto.encode("utf-8"))
+    return resultado
+
+
+def medir_procesar(args):
+    mapa = catalogo_sintetico(args.sensores, args.campos)
+    paquetes = datagramas(args.sensores, args.campos, args.lineas, 2000)
+    receptor = ReceptorUDP(buffer=None)
+    mejores = []
+    for _ in range(args.repeticiones):
+        inicio = time.perf_counter()
+        lecturas = sum(len(receptor.procesar(p, mapa)) for p in paquetes)
+        mejores.append(lecturas / (time.perf_counter() - inicio))
+    print(f"procesar: {max(mejores):,.0f} lecturas/s en un núcleo "
+          f"({args.lineas} líneas x {args.campos} campos por datagrama)")
+
+
+def enviar(args):
+    host, puerto = args.enviar.rsplit(":", 1)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    lineas_por_paquete = max(1, args.lineas)
+    paquete = "\n".join(f"{args.sensor},{args.campo}={20 + j / 10}" for j in range(lineas_por_paquete)).encode()
+    paquetes_por_segundo = max(1, args.tasa // lineas_por_paquete)
+    enviados = 0
+    inicio = time.perf_counter()
+    while time.perf_counter() - inicio < args.duracion:
+        sock.sendto(paquete, (host, int(puerto)))
+        enviados += 1
+        # Mantener la tasa pedida
+        adelanto = enviados / paquetes_por_segundo - (time.perf_counter() - inicio)
+        if adelanto > 0:
+            time.sleep(adelanto)
+    transcurrido = time.perf_counter() - inicio
+    print(f"enviados {enviados} datagramas ({enviados * lineas_por_paquete / transcurrido:,.0f} lecturas/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sensores", type=int, default=100)
+    parser.add_argument("--campos", type=int, default=4)
+    parser.add_argument("--lineas", type=int, default=20, help="Líneas por datagrama")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--enviar", help="host:puerto de un receptor en marcha")
+    parser.add_argument("--sensor", default="Sensor1")
+    parser.add_argument("--campo", default="temperatura")
+    parser.add_argument("--tasa", type=int, default=20000, help="Lecturas por segundo a enviar")
+    parser.add_argument("--duracion", type=float, default=10)
+    args = parser.parse_args()
+    if args.enviar:
+        enviar(args)
+    else:
+        medir_procesar(args)
+
+
+if __name__ == "__main__":
+    main()
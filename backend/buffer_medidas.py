@@ -0,0 +1,174 @@
+"""
+Buffer de escritura de medidas
+Agrupa las lecturas de muchas peticiones concurrentes y las escribe en lotes
+grandes desde un hilo en segundo plano.
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
+
+from database import log_error
+
+
+class BufferMedidas:
+    """Cola acotada de documentos de medidas con un hilo que los escribe en lote.
+
+    Args:
+        escribir: Función que recibe una lista de documentos y los persiste
+        tam_lote: Número de documentos que dispara una escritura inmediata
+        intervalo: Segundos máximos que un documento espera en la cola
+        capacidad: Máximo de documentos pendientes antes de rechazar nuevos
+        liberar: Función que recibe la clave de un lote (lotes.py) cuyas
+            medidas se descartaron, para que su reintento no sea un duplicado
+    """
+
+    def __init__(self, escribir, tam_lote=1000, intervalo=0.25, capacidad=100000, liberar=None):
+        self._escribir = escribir
+        self._liberar = liberar
+        self.tam_lote = tam_lote
+        self.intervalo = intervalo
+        self.capacidad = capacidad
+        self._pendientes = deque()
+        self._cond = threading.Condition()
+        self._hilo = None
+        self._pid = None
+        self._detenido = False
+        self._contadores = {"encoladas": 0, "escritas": 0, "rechazadas": 0, "descartadas": 0, "lotes": 0}
+
+    def _asegurar_hilo(self):
+        """Arranca el hilo de escritura en el proceso actual (también tras un fork)."""
+        if self._hilo is not None and self._pid == os.getpid() and self._hilo.is_alive():
+            return
+        self._pid = os.getpid()
+        self._hilo = threading.Thread(target=self._bucle, name="buffer-medidas", daemon=True)
+        self._hilo.start()
+
+    def encolar(self, documentos, lote=None):
+        """Encola los documentos del lote indicado (o sin lote). Retorna False si la cola está llena (contrapresión)."""
+        if not documentos:
+            return True
+        with self._cond:
+            if self._detenido:
+                return False
+            if len(self._pendientes) + len(documentos) > self.capacidad:
+                self._contadores["rechazadas"] += len(documentos)
+                return False
+            self._asegurar_hilo()
+            self._pendientes.extend((documento, lote) for documento in documentos)
+            self._contadores["encoladas"] += len(documentos)
+            if len(self._pendientes) >= self.tam_lote:
+                self._cond.notify()
+        return True
+
+    def _tomar_lote(self):
+        n = min(len(self._pendientes), self.tam_lote)
+        return [self._pendientes.popleft() for _ in range(n)]
+
+    def _bucle(self):
+        while True:
+            with self._cond:
+                if not self._pendientes and not self._detenido:
+                    self._cond.wait()
+                if self._detenido and not self._pendientes:
+                    return
+                # Esperar a completar un lote o a que venza el intervalo
+                limite = time.monotonic() + self.intervalo
+                while len(self._pendientes) < self.tam_lote and not self._detenido:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._cond.wait(restante)
+                lote = self._tomar_lote()
+            if lote:
+                self._escribir_lote(lote)
+
+    def _liberar_descartados(self, entradas):
+        """Libera los lotes de ingesta que tenían medidas entre las descartadas."""
+        if self._liberar is None:
+            return
+        for clave in {lote for _, lote in entradas if lote is not None}:
+            try:
+                self._liberar(clave)
+            except Exception as e:
+                log_error(e, "buffer_medidas.liberar")
+
+    def _escribir_lote(self, entradas):
+        documentos = [documento for documento, _ in entradas]
+        try:
+            self._escribir(documentos)
+            self._contadores["escritas"] += len(documentos)
+            self._contadores["lotes"] += 1
+        except BulkWriteError as e:
+            # Errores de documentos individuales: reintentar no los corrige
+            insertadas = e.details.get("nInserted", 0)
+            errores = e.details.get("writeErrors", [])
+            self._contadores["escritas"] += insertadas
+            self._contadores["descartadas"] += len(documentos) - insertadas
+            log_error(e, "buffer_medidas._escribir_lote")
+            if insertadas + len(errores) == len(documentos):
+                # Una operación por documento: los índices de error señalan los descartados
+                self._liberar_descartados([entradas[error["index"]] for error in errores])
+            else:
+                self._liberar_descartados(entradas)
+        except ServerSelectionTimeoutError as e:
+            # Ningún servidor disponible: la escritura no llegó a enviarse y se puede repetir
+            log_error(e, "buffer_medidas._escribir_lote")
+            with self._cond:
+                if self._detenido:
+                    self._contadores["descartadas"] += len(entradas)
+                    descartar = True
+                else:
+                    # Devolver el lote al frente de la cola y esperar antes de reintentar
+                    self._pendientes.extendleft(reversed(entradas))
+                    descartar = False
+            if descartar:
+                self._liberar_descartados(entradas)
+                return
+            time.sleep(min(5.0, max(self.intervalo, 1.0)))
+        except Exception as e:
+            # Falla después de enviar (p. ej. la red cae a mitad de la escritura,
+            # cuando pymongo ya agotó su reintento): parte del lote pudo quedar
+            # guardada y repetirlo la duplicaría junto con agregados y contadores
+            self._contadores["descartadas"] += len(entradas)
+            log_error(e, "buffer_medidas._escribir_lote")
+            self._liberar_descartados(entradas)
+
+    def vaciar(self, timeout=30.0):
+        """Detiene el hilo y escribe todo lo pendiente. Se usa al apagar el proceso."""
+        with self._cond:
+            self._detenido = True
+            self._cond.notify_all()
+        if self._hilo is not None and self._pid == os.getpid():
+            self._hilo.join(timeout)
+        # Lo que quede (hilo caído o proceso hijo sin hilo) se escribe aquí mismo
+        while True:
+            with self._cond:
+                lote = self._tomar_lote()
+            if not lote:
+                break
+            self._escribir_lote(lote)
+
+    def estadisticas(self):
+        """Retorna contadores del buffer y el número de documentos pendientes."""
+        return dict(self._contadores, pendientes=len(self._pendientes), capacidad=self.capacidad)
+
+
+def crear_buffer_desde_entorno(escribir, liberar=None):
+    """Crea el buffer si MEDIDAS_BUFFER=1; de lo contrario retorna None."""
+    if os.getenv("MEDIDAS_BUFFER", "0") != "1":
+        return None
+    buffer = BufferMedidas(
+        escribir,
+        tam_lote=int(os.getenv("MEDIDAS_BUFFER_LOTE", "1000")),
+        intervalo=int(os.getenv("MEDIDAS_BUFFER_INTERVALO_MS", "250")) / 1000.0,
+        capacidad=int(os.getenv("MEDIDAS_BUFFER_CAPACIDAD", "100000")),
+        liberar=liberar,
+    )
+    atexit.register(buffer.vaciar)
+    print(f"[INFO] Buffer de medidas activo (lote={buffer.tam_lote}, intervalo={buffer.intervalo}s, capacidad={buffer.capacidad})")
+    return buffer
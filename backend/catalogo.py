@@ -0,0 +1,162 @@
+"""
+Catálogo de sensores en memoria
+Mantiene una copia versionada de la colección de sensores y sus campos para
+que la ingesta de medidas no tenga que consultar MongoDB en cada petición.
+"""
+
+import os
+import threading
+import time
+
+from database import get_sensores_collection, log_error
+
+# Tiempo máximo (segundos) que una copia del catálogo se considera válida aunque
+# nadie la invalide. Sirve de red de seguridad cuando hay varios procesos.
+CATALOGO_TTL = int(os.getenv("CATALOGO_TTL", "60"))
+
+_lock = threading.Lock()
+_estado = {
+    "version": 0,          # Se incrementa en cada invalidación
+    "version_cargada": -1, # Versión a la que corresponde la copia en memoria
+    "cargado_en": 0.0,
+    "por_nombre": {},
+    "por_id": {},
+    "tipos_por_id": {},
+    "sensores": [],
+}
+_contadores = {"aciertos": 0, "fallos": 0, "recargas": 0}
+
+
+def _construir_mapa_por_nombre(sensores):
+    """Construye el mapa nombre de sensor -> id y campos activos (id, tipo)."""
+    return {
+        s['nombre']: {
+            "id": s['_id'],
+            "campos": {
+                c['nombre_campo']: {
+                    'id': c['_id'],
+                    'tipo': c['tipo_campo']
+                } for c in s.get('campos', []) if c.get('activo')
+            }
+        } for s in sensores if s.get('activo') is True
+    }
+
+
+def _construir_tipos_por_id(sensores):
+    """Construye el mapa sensor_id -> {campo_id: tipo} de sensores y campos activos
+    (ingesta compacta, que identifica sensores y campos por id)."""
+    return {
+        s['_id']: {c['_id']: c['tipo_campo'] for c in s.get('campos', []) if c.get('activo')}
+        for s in sensores if s.get('activo') is True
+    }
+
+
+def _construir_indice_por_id(sensores):
+    """Construye el mapa sensor_id -> nombre, dispositivo y nombres de campos.
+
+    Incluye sensores y campos inactivos: sus medidas históricas siguen
+    necesitando nombre.
+    """
+    return {
+        s['_id']: {
+            "nombre": s.get('nombre'),
+            "dispositivo_id": s.get('dispositivo_id'),
+            "campos": {c['_id']: c.get('nombre_campo') for c in s.get('campos', [])}
+        } for s in sensores
+    }
+
+
+def construir_catalogo(sensores):
+    """Retorna (mapa por nombre, índice por id, tipos por id) a partir de los documentos de sensores.
+
+    Para procesos que leen los sensores por su cuenta (p. ej. con un cliente asíncrono).
+    """
+    return _construir_mapa_por_nombre(sensores), _construir_indice_por_id(sensores), _construir_tipos_por_id(sensores)
+
+
+def _recargar(sensores_collection):
+    """Lee la colección de sensores una sola vez y reconstruye los mapas."""
+    version = _estado["version"]
+    sensores = list(sensores_collection.find())
+    _estado["sensores"] = sensores
+    _estado["por_nombre"], _estado["por_id"], _estado["tipos_por_id"] = construir_catalogo(sensores)
+    _estado["version_cargada"] = version
+    _estado["cargado_en"] = time.monotonic()
+    _contadores["recargas"] += 1
+
+
+def _vigente():
+    if _estado["version_cargada"] != _estado["version"]:
+        return False
+    return time.monotonic() - _estado["cargado_en"] < CATALOGO_TTL
+
+
+def _asegurar_cargado():
+    """Recarga el catálogo si fue invalidado o expiró. Retorna False sin conexión."""
+    if _vigente():
+        _contadores["aciertos"] += 1
+        return True
+    sensores_collection = get_sensores_collection()
+    if sensores_collection is None:
+        return False
+    with _lock:
+        # Otro hilo pudo haber recargado mientras esperábamos el lock
+        if _vigente():
+            _contadores["aciertos"] += 1
+            return True
+        _contadores["fallos"] += 1
+        try:
+            _recargar(sensores_collection)
+        except Exception as e:
+            log_error(e, "catalogo._recargar")
+            return False
+    return True
+
+
+def obtener_mapa_sensores():
+    """Retorna el mapa de sensores activos por nombre usado por la ingesta.
+
+    El diccionario retornado no debe modificarse: es compartido entre hilos y se
+    reemplaza completo en cada recarga. Retorna None si no hay base de datos.
+    """
+    if not _asegurar_cargado():
+        return None
+    return _estado["por_nombre"]
+
+
+def obtener_indice_por_id():
+    """Retorna el mapa sensor_id -> {nombre, dispositivo_id, campos: {campo_id: nombre}}.
+
+    Mismas reglas que obtener_mapa_sensores: no modificar, None sin base de datos.
+    """
+    if not _asegurar_cargado():
+        return None
+    return _estado["por_id"]
+
+
+def obtener_tipos_por_id():
+    """Retorna el mapa sensor_id -> {campo_id: tipo} de sensores y campos activos.
+
+    Mismas reglas que obtener_mapa_sensores: no modificar, None sin base de datos.
+    """
+    if not _asegurar_cargado():
+        return None
+    return _estado["tipos_por_id"]
+
+
+def invalidar_catalogo():
+    """Marca el catálogo como desactualizado; la próxima lectura lo recarga."""
+    with _lock:
+        _estado["version"] += 1
+
+
+def estadisticas_catalogo():
+    """Retorna versión y contadores de aciertos/fallos/recargas del catálogo."""
+    return {
+        "version": _estado["version"],
+        "version_cargada": _estado["version_cargada"],
+        "sensores": len(_estado["sensores"]),
+        "aciertos": _contadores["aciertos"],
+        "fallos": _contadores["fallos"],
+        "recargas": _contadores["recargas"],
+    }
@@ -0,0 +1,182 @@
+"""
+Compatibilidad de cultivos
+Versión en servidor del cálculo de `calculateCropCompatibility` de Home.tsx
+(documentado en frontend/src/doc/compatibilidad_cultivos.md): evalúa todos los
+cultivos contra todos los dispositivos en una sola pasada vectorizada de NumPy.
+
+Por cada parámetro medido se cuenta un chequeo; pasa si el valor está dentro
+del rango del cultivo. Compatibilidad = chequeos que pasan / chequeos * 100,
+con >= 80% compatible, 50-79% revisar y < 50% no compatible. Sin ningún
+chequeo (dispositivo sin parámetros medidos) no hay porcentaje: Home.tsx lo
+muestra como "sin datos", así que el dispositivo se marca con sin_datos y no
+se le ordenan cultivos.
+"""
+
+import numpy as np
+
+# Parámetros en el orden de las columnas: (clave, nombre, unidad, patrones de nombre de campo).
+# Los patrones se prueban en orden y aceptan coincidencia exacta o parcial, igual que
+# findFieldValue en el frontend.
+PARAMETROS = [
+    ("humedad", "Humedad del suelo", "%", ("humedad_suelo", "humedad", "humidity", "hum", "soilhum")),
+    ("ph", "pH del suelo", "pH", ("ph", "soilph")),
+    ("conductividad", "Conductividad eléctrica", "dS/m", ("conductividad", "ec", "soilec", "electric")),
+    ("nitrogeno", "Nitrógeno (N)", "kg/ha", ("nitrogeno", "nitrogen", "n", "nitro")),
+    ("fosforo", "Fósforo (P)", "kg/ha", ("fosforo", "phosphorus", "p", "fosf")),
+    ("potasio", "Potasio (K)", "kg/ha", ("potasio", "potassium", "k", "potas")),
+    ("temperatura_suelo", "Temperatura del suelo", "°C", ("temperatura_suelo", "soiltemp", "tempsuelo", "temp_soil")),
+    ("temperatura_ambiente", "Temperatura ambiente", "°C",
+     ("temperatura_aire", "temperatura_ambiente", "temperatura", "temp", "airtemp", "temperature")),
+]
+
+# Humedad, pH y conductividad se cuentan siempre que estén medidos; el resto
+# solo si el cultivo define un rango para ese parámetro
+SIEMPRE_EVALUADOS = np.array([True, True, True, False, False, False, False, False])
+
+# Rangos por cultivo en el orden de PARAMETROS (mismos valores que cropCompatibility en Home.tsx)
+CULTIVOS = [
+    ("tabaco", "Tabaco", [(60, 80), (5.8, 6.5), (0, 1.5), (80, 150), (40, 80), (100, 150), (18, 28), (20, 30)]),
+    ("millo", "Millo", [(40, 70), (6.0, 7.5), (0, 1.5), (90, 160), (40, 80), (60, 120), (18, 30), (20, 30)]),
+    ("pina", "Piña", [(60, 75), (4.5, 5.5), (0, 1.0), (230, 300), (20, 50), (0.5, 0.8), (22, 26), (20, 30)]),
+    ("maracuya", "Maracuyá", [(60, 80), (5.5, 6.5), (0, 1.5), (153, 153), (30, 30), (200, 200), (22, 28), (20, 30)]),
+    ("melon", "Melón", [(60, 80), (6.0, 7.0), (0, 1.5), (100, 150), (30, 60), (150, 200), (22, 30), (25, 30)]),
+    ("sandia", "Sandía", [(60, 80), (5.8, 7.2), (0, 2.5), (80, 100), (25, 60), (35, 80), (20, 30), (20, 30)]),
+    ("yuca", "Yuca", [(20, 30), (6.0, 6.5), (0, 2.0), (55, 55), (26, 26), (105, 105), (30, 30), (25, 29)]),
+    ("maiz", "Maíz", [(33, 35), (5.6, 6.5), (0, 2.0), (40, 160), (20, 80), (20, 80), (20, 25), (19, 30)]),
+    ("pimenton", "Pimentón", [(20, 30), (6.5, 7.0), (0, 1.5), (390, 920), (200, 330), (640, 1530), (18, 23), (21, 27)]),
+    ("tomate", "Tomate", [(60, 85), (5.8, 6.8), (0, 2.5), (2.2, 2.4), (40, 60), (2.6, 3.6), (16, 20), (18, 27)]),
+    ("habichuela", "Habichuela", [(60, 80), (5.8, 7.2), (1.2, 2.5), (40, 80), (60, 90), (60, 100), (18, 25), (18, 28)]),
+    ("frijol", "Fríjol", [(10, 20), (6.5, 7.5), (0, 2.0), (20, 60), (40, 60), (30, 40), (18, 26), (10, 27)]),
+    ("arveja", "Arveja", [(60, 75), (6.0, 7.0), (0, 2.5), (150, 150), (20, 20), (70, 70), (15, 23), (15, 23)]),
+    ("limon", "Limón", [(85, 90), (6.0, 7.5), (0, 2.0), (200, 200), (0.11, 0.16), (300, 600), (25, 30), (18, 38)]),
+    ("mango", "Mango", [(70, 75), (5.5, 7.0), (0, 1.5), (0, 10), (60, 80), (0.25, 0.40), (27, 27), (27, 27)]),
+    ("naranja", "Naranja", [(35, 80), (5.0, 6.0), (0.5, 6.5), (150, 200), (25, 50), (150, 200), (22, 27), (23, 34)]),
+    ("nopal", "Nopal", [(30, 50), (6.0, 8.0), (2.0, 4.0), (227, 227), (122, 122), (300, 300), (20, 30), (22, 30)]),
+    ("zanahoria", "Zanahoria", [(70, 80), (5.8, 7.0), (0, 2.0), (120, 120), (100, 100), (300, 300), (13, 24), (15, 21)]),
+]
+
+IDS_CULTIVOS = [c[0] for c in CULTIVOS]
+NOMBRES_CULTIVOS = [c[1] for c in CULTIVOS]
+# Matrices cultivos x parámetros; NaN donde el cultivo no define rango
+MINIMOS = np.array([[r[0] if r else np.nan for r in c[2]] for c in CULTIVOS], dtype=float)
+MAXIMOS = np.array([[r[1] if r else np.nan for r in c[2]] for c in CULTIVOS], dtype=float)
+
+UMBRAL_COMPATIBLE = 80
+UMBRAL_REVISAR = 50
+
+
+def _a_numero(valor):
+    if isinstance(valor, bool) or valor is None:
+        return np.nan
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def buscar_valor(datos, patrones):
+    """Primer campo cuyo nombre coincide con algún patrón (exacto o parcial), en orden de patrones.
+
+    Un valor no numérico cuenta como no medido (el frontend lo trataba como NaN).
+    """
+    claves = [(clave, clave.lower()) for clave in datos]
+    for patron in patrones:
+        for clave, clave_min in claves:
+            if clave_min == patron or patron in clave_min:
+                if datos[clave] is not None:
+                    return _a_numero(datos[clave])
+                break
+    return np.nan
+
+
+def matriz_valores(lista_datos):
+    """Convierte los datos {nombre_campo: valor} de cada dispositivo en una matriz dispositivos x parámetros."""
+    return np.array(
+        [[buscar_valor(datos, patrones) for _, _, _, patrones in PARAMETROS] for datos in lista_datos],
+        dtype=float
+    ).reshape(len(lista_datos), len(PARAMETROS))
+
+
+def evaluar(valores):
+    """Evalúa todos los cultivos para todos los dispositivos.
+
+    Args:
+        valores: matriz dispositivos x parámetros (NaN = no medido)
+
+    Returns:
+        (porcentaje, evaluados, en_rango): porcentaje es dispositivos x cultivos
+        (NaN sin parámetros evaluados); evaluados y en_rango son dispositivos x
+        cultivos x parámetros.
+    """
+    v = valores[:, None, :]
+    medido = ~np.isnan(v)
+    con_rango = ~np.isnan(MINIMOS)[None, :, :]
+    evaluados = medido & (con_rango | SIEMPRE_EVALUADOS)
+    with np.errstate(invalid="ignore"):
+        dentro = (v >= MINIMOS) & (v <= MAXIMOS)
+    en_rango = evaluados & (dentro | ~con_rango)
+
+    total = evaluados.sum(axis=2)
+    pasan = en_rango.sum(axis=2)
+    # Math.round de JavaScript (redondeo hacia arriba en .5), sin dividir por cero
+    porcentaje = np.where(total > 0, np.floor(pasan * 100 / np.maximum(total, 1) + 0.5), np.nan)
+    return porcentaje, evaluados, en_rango
+
+
+def estado(porcentaje):
+    if porcentaje >= UMBRAL_COMPATIBLE:
+        return "compatible"
+    if porcentaje >= UMBRAL_REVISAR:
+        return "revisar"
+    return "no-compatible"
+
+
+def recomendaciones(dispositivos):
+    """Calcula la compatibilidad de cada cultivo para cada dispositivo.
+
+    Args:
+        dispositivos: lista de dicts con la forma de /dispositivos/resumen
+            (dispositivo, dispositivo_nombre, datos)
+
+    Returns:
+        Lista por dispositivo con sus cultivos ordenados de más a menos
+        compatible. Un dispositivo sin parámetros medidos trae sin_datos=True y
+        ningún cultivo.
+    """
+    valores = matriz_valores([d.get("datos") or {} for d in dispositivos])
+    porcentaje, evaluados, en_rango = evaluar(valores)
+
+    resultado = []
+    for i, dispositivo in enumerate(dispositivos):
+        cultivos = []
+        sin_datos = bool(np.isnan(porcentaje[i]).all())
+        for j in [] if sin_datos else np.argsort(-porcentaje[i], kind="stable"):
+            if np.isnan(porcentaje[i, j]):
+                continue
+            fuera = np.flatnonzero(evaluados[i, j] & ~en_rango[i, j])
+            cultivos.append({
+                "cultivo": IDS_CULTIVOS[j],
+                "nombre": NOMBRES_CULTIVOS[j],
+                "compatibilidad": int(porcentaje[i, j]),
+                "estado": estado(porcentaje[i, j]),
+                "parametros_evaluados": int(evaluados[i, j].sum()),
+                "parametros_en_rango": int(en_rango[i, j].sum()),
+                "fuera_de_rango": [
+                    {
+                        "parametro": PARAMETROS[k][0],
+                        "nombre": PARAMETROS[k][1],
+                        "unidad": PARAMETROS[k][2],
+                        "valor": float(valores[i, k]),
+                        "min": float(MINIMOS[j, k]),
+                        "max": float(MAXIMOS[j, k]),
+                    } for k in fuera
+                ],
+            })
+        resultado.append({
+            "dispositivo": dispositivo.get("dispositivo"),
+            "dispositivo_nombre": dispositivo.get("dispositivo_nombre"),
+            "parametros_medidos": [PARAMETROS[k][0] for k in np.flatnonzero(~np.isnan(valores[i]))],
+            "sin_datos": sin_datos,
+            "cultivos": cultivos,
+        })
+    return resultado
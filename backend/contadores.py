@@ -0,0 +1,215 @@
+"""
+Contadores de estado del sistema
+Mantiene el total de medidas y el timestamp de la última lectura en un
+documento de la colección "contadores" (uno por modo de almacenamiento),
+actualizado con $inc/$max en cada ingesta y borrado, para que /estado no tenga
+que contar la colección de medidas. Una reconciliación periódica corrige
+cualquier desvío.
+
+Cada proceso arranca un hilo de reconciliación al conectar, pero el recuento
+completo lo hace un solo proceso por periodo: el que toma el turno en el
+documento "reconciliacion.<modo>" de la misma colección (dueño, próxima
+ejecución y plazo de ocupación).
+"""
+
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import al_conectar, get_db, log_error
+from almacen_medidas import almacen
+
+COLECCION = "contadores"
+ID_MEDIDAS = f"medidas.{almacen.modo}"
+ID_RECONCILIACION = f"reconciliacion.{almacen.modo}"
+
+# Segundos que /estado reutiliza la copia en memoria antes de releer el documento compartido
+CONTADORES_TTL = float(os.getenv("CONTADORES_TTL", "5"))
+# Cada cuántos segundos se recalculan los contadores exactos (0 solo inicializa el documento si falta)
+CONTADORES_RECONCILIAR_S = int(os.getenv("CONTADORES_RECONCILIAR_S", "3600"))
+# Plazo máximo de una reconciliación: si su dueño muere, otro proceso la retoma pasado este tiempo
+CONTADORES_RECONCILIAR_MAX_S = int(os.getenv("CONTADORES_RECONCILIAR_MAX_S", "600"))
+# Espera máxima entre reintentos mientras el documento de contadores no existe
+CONTADORES_SEMBRAR_MAX_S = 30
+
+_lock = threading.Lock()
+_estado = {"total": None, "ultima": None, "leido_en": 0.0, "origen": None}
+_hilo = {"hilo": None, "pid": None}
+
+
+def get_contadores_collection():
+    db = get_db()
+    return db[COLECCION] if db is not None else None
+
+
+def _aplicar(doc, origen):
+    with _lock:
+        _estado["total"] = doc.get("total", 0)
+        _estado["ultima"] = doc.get("ultima")
+        _estado["leido_en"] = time.monotonic()
+        _estado["origen"] = origen
+
+
+def incremento_medidas(documentos):
+    """Actualización del documento de contadores para un lote de medidas nuevas."""
+    return {"$inc": {"total": len(documentos)}, "$max": {"ultima": max(d["timestamp"] for d in documentos)}}
+
+
+def registrar_medidas(documentos):
+    """Suma un lote de medidas recién guardadas al contador y a la última lectura.
+
+    No crea el documento: hasta que la primera reconciliación lo inicialice con
+    el total real, /estado usa la estimación.
+    """
+    coleccion = get_contadores_collection()
+    if coleccion is None or not documentos:
+        return
+    doc = coleccion.find_one_and_update(
+        {"_id": ID_MEDIDAS},
+        incremento_medidas(documentos),
+        return_document=ReturnDocument.AFTER
+    )
+    if doc is not None:
+        _aplicar(doc, "contador")
+
+
+def registrar_borrado_medidas(cantidad):
+    """Resta medidas borradas del contador (la última lectura se corrige al reconciliar)."""
+    coleccion = get_contadores_collection()
+    if coleccion is None or not cantidad:
+        return
+    doc = coleccion.find_one_and_update(
+        {"_id": ID_MEDIDAS},
+        {"$inc": {"total": -cantidad}},
+        return_document=ReturnDocument.AFTER
+    )
+    if doc is not None:
+        _aplicar(doc, "contador")
+
+
+def reconciliar():
+    """Recalcula el total exacto y la última lectura desde el almacén de medidas.
+
+    Las ingestas que ocurran mientras se cuenta pueden quedar fuera o contarse
+    dos veces; la siguiente reconciliación lo corrige.
+    """
+    coleccion = get_contadores_collection()
+    if coleccion is None:
+        raise RuntimeError("Conexión a la base de datos no disponible")
+    doc = {"total": almacen.contar(), "ultima": almacen.ultimo_timestamp()}
+    coleccion.replace_one({"_id": ID_MEDIDAS}, doc, upsert=True)
+    _aplicar(doc, "reconciliado")
+    return doc
+
+
+def _identidad():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _tomar_turno(coleccion, sembrar=False):
+    """Reclama la reconciliación para este proceso; retorna True si le toca.
+
+    Toca si nadie la está ejecutando (o su plazo venció) y, salvo al sembrar
+    el documento, si ya pasó la próxima ejecución programada. Si otro proceso
+    tiene el turno, el upsert choca con su _id y retorna False.
+    """
+    ahora = datetime.utcnow()
+    condicion = {
+        "_id": ID_RECONCILIACION,
+        "$or": [{"ocupado_hasta": {"$exists": False}}, {"ocupado_hasta": {"$lt": ahora}}],
+    }
+    if not sembrar:
+        condicion["proxima"] = {"$lte": ahora}
+    try:
+        coleccion.find_one_and_update(condicion, {"$set": {
+            "dueno": _identidad(),
+            "ocupado_hasta": ahora + timedelta(seconds=CONTADORES_RECONCILIAR_MAX_S),
+            "proxima": ahora + timedelta(seconds=max(CONTADORES_RECONCILIAR_S, 0)),
+        }}, upsert=True)
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def _reconciliar_con_turno(coleccion):
+    try:
+        reconciliar()
+    finally:
+        coleccion.update_one({"_id": ID_RECONCILIACION, "dueno": _identidad()}, {"$unset": {"ocupado_hasta": ""}})
+
+
+def _sembrar():
+    """Espera hasta que el documento de contadores exista, creándolo si le toca a este proceso."""
+    espera = 1
+    while True:
+        try:
+            coleccion = get_contadores_collection()
+            if coleccion is not None:
+                if coleccion.find_one({"_id": ID_MEDIDAS}, {"_id": 1}) is not None:
+                    return
+                if _tomar_turno(coleccion, sembrar=True):
+                    _reconciliar_con_turno(coleccion)
+                    return
+        except Exception as e:
+            log_error(e, "contadores.sembrar")
+        # Sin conexión todavía, o el documento lo está creando otro proceso
+        time.sleep(espera)
+        espera = min(espera * 2, CONTADORES_SEMBRAR_MAX_S)
+
+
+def _bucle_reconciliacion():
+    # Inicializar el documento si todavía no existe (primer arranque o cambio de modo)
+    _sembrar()
+    while CONTADORES_RECONCILIAR_S > 0:
+        # Se revisa con más frecuencia que el periodo para retomar el turno de un proceso caído
+        time.sleep(min(CONTADORES_RECONCILIAR_S, 60))
+        try:
+            coleccion = get_contadores_collection()
+            if coleccion is not None and _tomar_turno(coleccion):
+                _reconciliar_con_turno(coleccion)
+        except Exception as e:
+            log_error(e, "contadores.reconciliar")
+
+
+def _asegurar_reconciliacion():
+    """Arranca el hilo de reconciliación una vez por proceso (también tras un fork)."""
+    if _hilo["pid"] == os.getpid():
+        return
+    with _lock:
+        if _hilo["pid"] == os.getpid():
+            return
+        _hilo["pid"] = os.getpid()
+        _hilo["hilo"] = threading.Thread(target=_bucle_reconciliacion, name="reconciliar-contadores", daemon=True)
+        _hilo["hilo"].start()
+
+
+@al_conectar
+def iniciar_reconciliacion(db):
+    """Arranca el hilo al conectar, sin esperar a la primera consulta de /estado."""
+    _asegurar_reconciliacion()
+
+
+def obtener_contadores():
+    """Retorna {total, ultima, origen} de las medidas sin recorrer la colección.
+
+    Usa la copia en memoria si tiene menos de CONTADORES_TTL segundos; si no,
+    relee el documento de contadores. Si el documento aún no existe, estima el
+    total con los metadatos de la colección (origen "estimado").
+    """
+    _asegurar_reconciliacion()
+    if _estado["total"] is not None and time.monotonic() - _estado["leido_en"] < CONTADORES_TTL:
+        return {"total": _estado["total"], "ultima": _estado["ultima"], "origen": _estado["origen"]}
+    coleccion = get_contadores_collection()
+    if coleccion is None:
+        return {"total": 0, "ultima": None, "origen": None}
+    doc = coleccion.find_one({"_id": ID_MEDIDAS})
+    if doc is not None:
+        _aplicar(doc, "contador")
+    else:
+        _aplicar({"total": almacen.contar_estimado(), "ultima": almacen.ultimo_timestamp()}, "estimado")
+    return {"total": _estado["total"], "ultima": _estado["ultima"], "origen": _estado["origen"]}
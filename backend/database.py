@@ -1,35 +1,45 @@
 # database.py
-from pymongo import MongoClient
+from pymongo import MongoClient, IndexModel
 from pymongo.server_api import ServerApi
 from bson import ObjectId
 import os
 from dotenv import load_dotenv
 from pathlib import Path
 import ssl
+import threading
 import time
 
 # Parámetros de reintentos configurables vía entorno
 RETRY_ATTEMPTS = int(os.getenv("DB_RETRY_ATTEMPTS", "5"))  # Número de reintentos antes de rendirse
 RETRY_DELAY = int(os.getenv("DB_RETRY_DELAY", "5"))        # Segundos entre reintentos
 ALLOW_START_WITHOUT_DB = os.getenv("ALLOW_START_WITHOUT_DB", "1") == "1"  # Permitir que el servidor arranque aunque no conecte
+DB_PING_S = int(os.getenv("DB_PING_S", "10"))              # Segundos entre pings del supervisor con conexión
 
 # Cargar variables de entorno
 env_path = Path(__file__).parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 MONGO_URI = os.getenv("MONGO_URI")
+# Base de datos de la aplicación (otra para pruebas de carga, ver benchmarks/bench_api.py)
+MONGO_DB = os.getenv("MONGO_DB", "iotdb")
 
-# Variables globales de la base de datos
+# Variables globales de la base de datos (válidas solo en el proceso _pid_conexion)
 client = None
 db = None
 sensores_collection = None
 medidas_collection = None
+_pid_conexion = None
+_lock_conexion = threading.Lock()
+# Hilo supervisor del proceso actual y estado de la conexión que expone /ready
+_supervisor = {"pid": None, "detener": None}
+_estado = {"conectado_desde": None, "ultimo_ping": None, "ping_ok": False, "error": None, "intentos": 0}
+_al_conectar = []
 
 
-def _intento_conectar(uri: str):
-    """Realiza un intento de conexión normal y alternativa; retorna True si tuvo éxito."""
-    global client, db, sensores_collection, medidas_collection
+def _crear_cliente(uri: str):
+    """Realiza un intento de conexión normal y alternativa; retorna el cliente o None."""
+    cliente = None
     try:
-        client = MongoClient(
+        cliente = MongoClient(
             uri,
             server_api=ServerApi('1'),
             tls=True,
@@ -39,14 +49,14 @@ def _intento_conectar(uri: str):
             serverSelectionTimeoutMS=30000,
             retryWrites=True
         )
-        client.admin.command('ping')
+        cliente.admin.command('ping')
         print("✅ Conexión a MongoDB Atlas exitosa.")
-        db = client.iotdb
-        sensores_collection = db.sensores
-        medidas_collection = db.medidas
-        return True
+        return cliente
     except Exception as e:
         print(f"❌ Error al conectar a MongoDB (modo TLS): {e}")
+        if cliente is not None:
+            cliente.close()
+        cliente = None
         # Intentar alternativa sin TLS
         try:
             if uri and "@" in uri:
@@ -55,26 +65,181 @@ def _intento_conectar(uri: str):
                 cluster_info = partes[1]
                 alt_uri = f"mongodb://{credenciales}@{cluster_info}&ssl=false"
                 print("⚠️  Intentando conexión alternativa sin SSL...")
-                client = MongoClient(
+                cliente = MongoClient(
                     alt_uri,
                     server_api=ServerApi('1'),
                     connectTimeoutMS=30000,
                     socketTimeoutMS=30000
                 )
-                client.admin.command('ping')
+                cliente.admin.command('ping')
                 print("✅ Conexión alternativa exitosa (sin SSL).")
-                db = client.iotdb
-                sensores_collection = db.sensores
-                medidas_collection = db.medidas
-                return True
+                return cliente
         except Exception as alt_e:
             print(f"❌ Error en conexión alternativa: {alt_e}")
+            if cliente is not None:
+                cliente.close()
+        return None
+
+
+def al_conectar(funcion):
+    """Registra funcion(db), que se ejecuta tras cada conexión nueva y antes de publicarla.
+
+    Sirve para crear colecciones e índices: mientras no termina, los getters
+    siguen retornando None y /ready responde 503.
+    """
+    _al_conectar.append(funcion)
+    return funcion
+
+
+def _intento_conectar(uri: str):
+    """Conecta, ejecuta los ganchos de al_conectar y publica la conexión; retorna True si tuvo éxito."""
+    global client, db, sensores_collection, medidas_collection, _pid_conexion
+    cliente = _crear_cliente(uri)
+    if cliente is None:
+        _estado["error"] = "sin conexión"
         return False
+    base = cliente[MONGO_DB]
+    for funcion in _al_conectar:
+        try:
+            funcion(base)
+        except Exception as e:
+            log_error(e, f"al_conectar.{getattr(funcion, '__name__', funcion)}")
+    with _lock_conexion:
+        client, db = cliente, base
+        sensores_collection = db.sensores
+        medidas_collection = db.medidas
+        _pid_conexion = os.getpid()
+    _estado.update(conectado_desde=time.time(), ultimo_ping=time.time(), ping_ok=True, error=None)
+    return True
+
+def _descartar_heredada():
+    """Olvida el cliente y el supervisor creados por otro proceso (el padre antes de un fork).
+
+    Un MongoClient no sobrevive a un fork: sus sockets y sus hilos de monitoreo
+    pertenecen al proceso padre. No se cierra para no tocar esos sockets; el
+    hijo simplemente crea el suyo.
+    """
+    global client, db, sensores_collection, medidas_collection, _pid_conexion
+    if _pid_conexion is not None and _pid_conexion != os.getpid():
+        client = db = sensores_collection = medidas_collection = None
+        _pid_conexion = None
+    if _supervisor["pid"] is not None and _supervisor["pid"] != os.getpid():
+        _supervisor.update(pid=None, detener=None)
+        _estado.update(conectado_desde=None, ultimo_ping=None, ping_ok=False, error=None, intentos=0)
+
+
+def _supervisar(detener):
+    """Hilo supervisor: conecta en segundo plano y luego vigila la conexión con un ping.
+
+    Mientras no hay conexión reintenta cada RETRY_DELAY segundos, sin límite de
+    intentos. Con conexión hace ping cada DB_PING_S segundos; si falla solo lo
+    registra (el MongoClient reconecta por su cuenta) y /ready responde 503
+    hasta que un ping vuelva a responder.
+    """
+    while not detener.is_set():
+        if db is None:
+            _estado["intentos"] += 1
+            print(f"🔗 Conectando a MongoDB en el proceso {os.getpid()} (intento {_estado['intentos']})...")
+            if _intento_conectar(MONGO_URI):
+                continue
+            detener.wait(RETRY_DELAY)
+            continue
+        detener.wait(DB_PING_S)
+        if detener.is_set():
+            break
+        cliente = client
+        if cliente is None:
+            continue
+        try:
+            cliente.admin.command('ping')
+            if not _estado["ping_ok"]:
+                print("✅ MongoDB vuelve a responder.")
+            _estado.update(ultimo_ping=time.time(), ping_ok=True, error=None)
+        except Exception as e:
+            if _estado["ping_ok"]:
+                log_error(e, "supervisor.ping")
+            _estado.update(ping_ok=False, error=str(e))
+
+
+def iniciar_supervisor():
+    """Arranca el hilo supervisor de este proceso si no está corriendo. No bloquea."""
+    if _supervisor["pid"] == os.getpid() or not MONGO_URI:
+        return
+    with _lock_conexion:
+        _descartar_heredada()
+        if _supervisor["pid"] == os.getpid():
+            return
+        detener = threading.Event()
+        _supervisor.update(pid=os.getpid(), detener=detener)
+    threading.Thread(target=_supervisar, args=(detener,), name="supervisor-mongodb", daemon=True).start()
+
+
+def _asegurar_conexion():
+    """Garantiza que este proceso tenga un supervisor conectando en segundo plano.
+
+    Nunca espera a MongoDB: sin conexión los getters retornan None y los
+    endpoints responden 503 hasta que el supervisor conecte.
+    """
+    if db is not None and _pid_conexion == os.getpid():
+        return
+    iniciar_supervisor()
+
+
+def esperar_conexion(timeout=None):
+    """Espera a que el supervisor conecte. Retorna True si hay conexión.
+
+    Sin timeout espera lo mismo que duraban los reintentos del arranque
+    bloqueante: RETRY_ATTEMPTS x (30 s de timeout + RETRY_DELAY).
+    """
+    if timeout is None:
+        timeout = RETRY_ATTEMPTS * (30 + RETRY_DELAY)
+    iniciar_supervisor()
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if db is not None and _pid_conexion == os.getpid():
+            return True
+        time.sleep(0.1)
+    return db is not None and _pid_conexion == os.getpid()
+
+
+def estado_conexion():
+    """Estado de la conexión de este proceso para /ready."""
+    conectado = db is not None and _pid_conexion == os.getpid()
+    return {
+        "listo": conectado and _estado["ping_ok"],
+        "conectado": conectado,
+        "ping_ok": _estado["ping_ok"],
+        "ultimo_ping": _estado["ultimo_ping"],
+        "conectado_desde": _estado["conectado_desde"],
+        "intentos": _estado["intentos"],
+        "error": _estado["error"],
+        "uri_configurada": bool(MONGO_URI),
+    }
+
+
+def cerrar_conexion():
+    """Detiene el supervisor y cierra el cliente de este proceso (p. ej. en el maestro de gunicorn antes de crear workers)."""
+    global client, db, sensores_collection, medidas_collection, _pid_conexion
+    with _lock_conexion:
+        if _supervisor["pid"] == os.getpid():
+            _supervisor["detener"].set()
+        _supervisor.update(pid=None, detener=None)
+        if client is not None and _pid_conexion == os.getpid():
+            client.close()
+        client = db = sensores_collection = medidas_collection = None
+        _pid_conexion = None
+        _estado.update(conectado_desde=None, ultimo_ping=None, ping_ok=False, error=None, intentos=0)
 
 def inicializar_base_datos():
-    """Inicializa la conexión con reintentos. No aborta el proceso inmediatamente.
+    """Conecta de forma bloqueante con reintentos (scripts de línea de comandos).
+
+    El servidor no la usa: arranca sin esperar y conecta con iniciar_supervisor().
     Retorna True si logró conectar, False si agotó reintentos.
     """
+    with _lock_conexion:
+        _descartar_heredada()
+    if db is not None and _pid_conexion == os.getpid():
+        return True
     objetivo = None
     if MONGO_URI and "@" in MONGO_URI:
         try:
@@ -105,26 +270,49 @@ def inicializar_base_datos():
         # No forzamos exit aquí para que NSSM vea un proceso 'vivo' si se maneja arriba.
     return False
 
+# Los getters nunca bloquean: si este proceso no tiene conexión arrancan el
+# supervisor y retornan None. Los módulos deben pedirlos en cada uso y no
+# guardar el resultado al importarse, para que cada worker (tras el fork) use
+# su propio cliente y el servidor salga del modo degradado al reconectar.
 def get_sensores_collection():
     """Retorna la colección de sensores si está conectada, de lo contrario None."""
-    return sensores_collection if sensores_collection is not None else None
+    _asegurar_conexion()
+    return sensores_collection if _pid_conexion == os.getpid() else None
 
 def get_medidas_collection():
     """Retorna la colección de medidas si está conectada, de lo contrario None."""
-    return medidas_collection if medidas_collection is not None else None
+    _asegurar_conexion()
+    return medidas_collection if _pid_conexion == os.getpid() else None
 
 def get_db():
     """Retorna la base de datos si está conectada, de lo contrario None."""
-    return db if db is not None else None
+    _asegurar_conexion()
+    return db if _pid_conexion == os.getpid() else None
 
 def get_client():
     """Retorna el cliente de MongoDB si está conectado, de lo contrario None."""
-    return client if client is not None else None
+    _asegurar_conexion()
+    return client if _pid_conexion == os.getpid() else None
+
+
+def asegurar_indices(coleccion, indices):
+    """Crea solo los índices que faltan en la colección.
+
+    Args:
+        indices: lista de (claves, opciones), p. ej. ([("nombre", 1)], {"unique": True})
+
+    Lee los índices existentes con una sola consulta y compara por claves; si
+    ya están todos no envía ningún create_index. Retorna cuántos creó.
+    """
+    existentes = {tuple((k, int(v) if isinstance(v, float) else v) for k, v in info["key"])
+                  for info in coleccion.index_information().values()}
+    faltantes = [IndexModel(claves, **opciones) for claves, opciones in indices
+                 if tuple(claves) not in existentes]
+    if faltantes:
+        coleccion.create_indexes(faltantes)
+    return len(faltantes)
 
 # Helper function para logs de error
 def log_error(e, contexto=""):
     """Registra un error en la consola con el contexto proporcionado."""
-    print(f"❌ ERROR {contexto}: {e}")
-
-# Inicializar la base de datos al importar el módulo
-inicializar_base_datos()
\ No newline at end of file
+    print(f"❌ ERROR {contexto}: {e}")
\ No newline at end of file
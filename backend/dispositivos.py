@@ -3,6 +3,9 @@ from flask import Blueprint, request, jsonify
 from bson import ObjectId
 from datetime import datetime
 from database import get_db, log_error
+from catalogo import invalidar_catalogo
+from versiones import condicional, marcar_cambio
+from json_proveedor import fechas_http
 
 dispositivos_bp = Blueprint('dispositivos', __name__)
 
@@ -15,6 +18,7 @@ def get_sensores_collection():
     return db.sensores if db is not None else None
 
 @dispositivos_bp.route('/dispositivos', methods=['GET'])
+@condicional("dispositivos")
 def listar_dispositivos():
     """Lista todos los dispositivos disponibles."""
     dispositivos_collection = get_dispositivos_collection()
@@ -24,6 +28,7 @@ def listar_dispositivos():
         dispositivos = list(dispositivos_collection.find())
         for d in dispositivos:
             d['_id'] = str(d['_id'])
+            fechas_http(d, 'created_at', 'updated_at')
         return jsonify(dispositivos)
     except Exception as e:
         log_error(e, "listar_dispositivos")
@@ -49,6 +54,7 @@ def crear_dispositivo():
             "created_at": datetime.utcnow()
         }
         result = dispositivos_collection.insert_one(nuevo_dispositivo)
+        marcar_cambio("dispositivos")
         return jsonify({"mensaje": "Dispositivo creado", "id": str(result.inserted_id)}), 201
     except Exception as e:
         log_error(e, "crear_dispositivo")
@@ -71,6 +77,8 @@ def vincular_sensor(sensor_id):
             {"_id": ObjectId(sensor_id)},
             {"$set": {"dispositivo_id": ObjectId(dispositivo_id), "updated_at": datetime.utcnow()}}
         )
+        invalidar_catalogo()
+        marcar_cambio("sensores")
         return jsonify({"mensaje": "Sensor vinculado correctamente"})
     except Exception as e:
         log_error(e, "vincular_sensor")
@@ -87,6 +95,8 @@ def desvincular_sensor(sensor_id):
             {"_id": ObjectId(sensor_id)},
             {"$unset": {"dispositivo_id": ""}, "$set": {"updated_at": datetime.utcnow()}}
         )
+        invalidar_catalogo()
+        marcar_cambio("sensores")
         return jsonify({"mensaje": "Sensor desvinculado correctamente"})
     except Exception as e:
         log_error(e, "desvincular_sensor")
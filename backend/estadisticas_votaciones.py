@@ -0,0 +1,135 @@
+"""
+Estadísticas pre-agregadas de votaciones
+Mantiene un único documento en "votaciones_estadisticas" con el total, la suma
+y la distribución de ratings, globales y desglosados por cultivo, medio y
+dispositivo. Cada voto nuevo o borrado lo ajusta con $inc, así que leer las
+estadísticas es una sola lectura de documento sin importar cuántos votos haya.
+
+Las claves de los desgloses salen de valores enviados por el cliente, así que
+solo se aceptan los conocidos (ids de cultivo de compatibilidad.py, medios del
+frontend, números de dispositivo hasta DISPOSITIVO_MAX); cualquier otro valor
+se cuenta en "otro" para que el documento no crezca sin límite.
+"""
+
+from database import get_db
+from compatibilidad import IDS_CULTIVOS
+
+COLECCION = "votaciones_estadisticas"
+ID_ESTADISTICAS = "global"
+DESGLOSES = {"cultivo": "por_cultivo", "medio": "por_medio", "dispositivo": "por_dispositivo"}
+RATINGS = ("1", "2", "3", "4", "5")
+MEDIOS = ("terreno", "aire")
+DISPOSITIVO_MAX = 100
+VALORES = {"cultivo": set(IDS_CULTIVOS), "medio": set(MEDIOS)}
+
+
+def get_estadisticas_collection():
+    db = get_db()
+    return db[COLECCION] if db is not None else None
+
+
+def _clave(campo, valor):
+    """Nombre de campo del desglose para un valor: el propio valor si es conocido, si no "otro"."""
+    if valor is None or valor == "":
+        return "sin_dato"
+    if campo == "dispositivo":
+        if isinstance(valor, str) and valor.strip().isdigit():
+            valor = int(valor)
+        if isinstance(valor, int) and not isinstance(valor, bool) and 0 < valor <= DISPOSITIVO_MAX:
+            return str(valor)
+        return "otro"
+    valor = str(valor).strip().lower()
+    return valor if valor in VALORES[campo] else "otro"
+
+
+def _incrementos(votacion, signo):
+    rating = votacion["rating"]
+    incrementos = {"total": signo, "suma": signo * rating, f"rating.{rating}": signo}
+    for campo, desglose in DESGLOSES.items():
+        prefijo = f"{desglose}.{_clave(campo, votacion.get(campo))}"
+        incrementos[f"{prefijo}.total"] = signo
+        incrementos[f"{prefijo}.suma"] = signo * rating
+        incrementos[f"{prefijo}.rating.{rating}"] = signo
+    return incrementos
+
+
+def registrar_voto(votacion, signo=1):
+    """Suma (signo=1) o resta (signo=-1) un voto de las estadísticas.
+
+    No crea el documento: si aún no existe, la siguiente lectura lo reconstruye
+    desde la colección de votaciones, que ya incluye este voto.
+    """
+    coleccion = get_estadisticas_collection()
+    if coleccion is None:
+        return
+    coleccion.update_one({"_id": ID_ESTADISTICAS}, {"$inc": _incrementos(votacion, signo)})
+
+
+def reiniciar_estadisticas():
+    """Deja las estadísticas en cero (tras borrar todas las votaciones)."""
+    coleccion = get_estadisticas_collection()
+    if coleccion is None:
+        return
+    coleccion.replace_one({"_id": ID_ESTADISTICAS}, _vacio(), upsert=True)
+
+
+def _vacio():
+    return {"total": 0, "suma": 0, "rating": {}, **{desglose: {} for desglose in DESGLOSES.values()}}
+
+
+def reconstruir_estadisticas():
+    """Recalcula el documento de estadísticas desde la colección de votaciones.
+
+    Agrupa en MongoDB por (rating, cultivo, medio, dispositivo), así que solo
+    viajan las combinaciones distintas y no cada voto.
+    """
+    db = get_db()
+    if db is None:
+        raise RuntimeError("Conexión a la base de datos no disponible")
+    grupos = db["votaciones"].aggregate([
+        {"$match": {"rating": {"$in": [1, 2, 3, 4, 5]}}},
+        {"$group": {
+            "_id": {"rating": "$rating", "cultivo": "$cultivo", "medio": "$medio", "dispositivo": "$dispositivo"},
+            "n": {"$sum": 1},
+        }},
+    ])
+    estadisticas = _vacio()
+    for grupo in grupos:
+        clave, n = grupo["_id"], grupo["n"]
+        rating = clave["rating"]
+        destinos = [estadisticas] + [
+            estadisticas[desglose].setdefault(_clave(campo, clave.get(campo)), {"total": 0, "suma": 0, "rating": {}})
+            for campo, desglose in DESGLOSES.items()
+        ]
+        for destino in destinos:
+            destino["total"] += n
+            destino["suma"] += n * rating
+            destino["rating"][str(rating)] = destino["rating"].get(str(rating), 0) + n
+    db[COLECCION].replace_one({"_id": ID_ESTADISTICAS}, estadisticas, upsert=True)
+    return estadisticas
+
+
+def _resumen(datos):
+    total = datos.get("total", 0)
+    rating = datos.get("rating", {})
+    return {
+        "total_votaciones": total,
+        "promedio_rating": round(datos.get("suma", 0) / total, 2) if total else 0,
+        "distribucion": {r: rating.get(r, 0) for r in RATINGS},
+    }
+
+
+def obtener_estadisticas():
+    """Retorna las estadísticas globales y los desgloses con la forma de /votaciones/estadisticas."""
+    coleccion = get_estadisticas_collection()
+    estadisticas = coleccion.find_one({"_id": ID_ESTADISTICAS})
+    if estadisticas is None:
+        estadisticas = reconstruir_estadisticas()
+    resultado = _resumen(estadisticas)
+    for desglose in DESGLOSES.values():
+        resultado[desglose] = {
+            clave: _resumen(datos)
+            for clave, datos in estadisticas.get(desglose, {}).items()
+            if datos.get("total", 0) > 0
+        }
+    return resultado
@@ -0,0 +1,246 @@
+"""
+Eventos en vivo de medidas (Server-Sent Events)
+Centro de publicación/suscripción en memoria: la ingesta publica cada lectura
+una sola vez y se reparte a todas las conexiones SSE suscritas, en lugar de
+que cada navegador consulte MongoDB periódicamente.
+
+Con varios procesos (gunicorn) cada uno tiene su propio centro. Con
+EVENTOS_DIFUSION=mongo la ingesta no publica directamente: escribe cada lote en
+la colección limitada (capped) "eventos_medidas" y cada proceso con conexiones
+SSE la sigue con un cursor tailable, de modo que todas las conexiones reciben
+las lecturas sin importar qué worker las ingirió.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from pymongo import CursorType
+
+from database import get_db, log_error
+
+# Eventos pendientes por conexión; si un cliente lento la llena se descartan sus eventos más antiguos
+EVENTOS_CAPACIDAD = int(os.getenv("EVENTOS_CAPACIDAD", "1000"))
+# Segundos sin eventos tras los que se envía un comentario para mantener viva la conexión
+EVENTOS_LATIDO_S = float(os.getenv("EVENTOS_LATIDO_S", "15"))
+# "local" reparte en el proceso que ingiere; "mongo" difunde entre procesos vía MongoDB
+EVENTOS_DIFUSION = os.getenv("EVENTOS_DIFUSION", "local")
+# Tamaño de la colección limitada de difusión (solo cuenta lo no leído por los seguidores)
+EVENTOS_DIFUSION_MB = int(os.getenv("EVENTOS_DIFUSION_MB", "16"))
+
+COLECCION_DIFUSION = "eventos_medidas"
+# Eventos por documento de difusión (lotes grandes se parten en varios documentos)
+EVENTOS_POR_DOCUMENTO = 1000
+
+_difusion = {"configurada": False}
+
+TEMA_TODAS = ("todas",)
+
+
+def tema_sensor(sensor_id):
+    return ("sensor", str(sensor_id))
+
+
+def tema_dispositivo(dispositivo_id):
+    return ("dispositivo", str(dispositivo_id))
+
+
+class Suscripcion:
+    """Cola de eventos de una conexión SSE."""
+
+    def __init__(self, temas, capacidad):
+        self.temas = tuple(temas)
+        self.cola = queue.Queue(maxsize=capacidad)
+        self.descartados = 0
+
+    def entregar(self, mensaje):
+        while True:
+            try:
+                self.cola.put_nowait(mensaje)
+                return
+            except queue.Full:
+                try:
+                    self.cola.get_nowait()
+                    self.descartados += 1
+                except queue.Empty:
+                    pass
+
+    def mensajes(self, latido):
+        """Generador de texto SSE: un bloque por evento o un latido si no hay eventos."""
+        while True:
+            try:
+                yield self.cola.get(timeout=latido)
+            except queue.Empty:
+                yield ": latido\n\n"
+
+
+class CentroEventos:
+    """Reparte eventos por tema a las suscripciones activas de este proceso."""
+
+    def __init__(self, capacidad=EVENTOS_CAPACIDAD):
+        self.capacidad = capacidad
+        self._lock = threading.Lock()
+        self._suscripciones = {}
+        self._publicados = 0
+
+    def suscribir(self, temas):
+        suscripcion = Suscripcion(temas, self.capacidad)
+        with self._lock:
+            for tema in suscripcion.temas:
+                self._suscripciones.setdefault(tema, set()).add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            for tema in suscripcion.temas:
+                suscritas = self._suscripciones.get(tema)
+                if suscritas is not None:
+                    suscritas.discard(suscripcion)
+                    if not suscritas:
+                        del self._suscripciones[tema]
+
+    def hay_suscriptores(self):
+        return bool(self._suscripciones)
+
+    def publicar(self, temas, evento, tipo="medida"):
+        """Serializa el evento una vez y lo entrega a cada suscripción de cualquiera de los temas."""
+        with self._lock:
+            destinos = set()
+            for tema in temas:
+                destinos.update(self._suscripciones.get(tema, ()))
+            self._publicados += 1
+        if not destinos:
+            return 0
+        mensaje = f"event: {tipo}\ndata: {json.dumps(evento, default=str)}\n\n"
+        for suscripcion in destinos:
+            suscripcion.entregar(mensaje)
+        return len(destinos)
+
+    def estadisticas(self):
+        with self._lock:
+            suscripciones = set()
+            for suscritas in self._suscripciones.values():
+                suscripciones.update(suscritas)
+            return {
+                "conexiones": len(suscripciones),
+                "temas": len(self._suscripciones),
+                "publicados": self._publicados,
+                "descartados": sum(s.descartados for s in suscripciones),
+                "difusion": EVENTOS_DIFUSION,
+            }
+
+
+# Centro de eventos de este proceso
+centro_eventos = CentroEventos()
+
+
+def _evento(doc, nombres):
+    sensor = nombres.get(doc["sensor_id"]) if nombres else None
+    valor = doc["valor"]
+    return {
+        "sensor_id": str(doc["sensor_id"]),
+        "sensor": sensor["nombre"] if sensor else None,
+        "campo_id": str(doc["campo_id"]),
+        "nombre_campo": sensor["campos"].get(doc["campo_id"]) if sensor else None,
+        "dispositivo_id": str(sensor["dispositivo_id"]) if sensor and sensor["dispositivo_id"] else None,
+        "valor": str(valor).lower() if isinstance(valor, bool) else valor,
+        "timestamp": doc["timestamp"].isoformat(),
+    }
+
+
+def _repartir(eventos):
+    for evento in eventos:
+        temas = [TEMA_TODAS, tema_sensor(evento["sensor_id"])]
+        if evento["dispositivo_id"]:
+            temas.append(tema_dispositivo(evento["dispositivo_id"]))
+        centro_eventos.publicar(temas, evento)
+
+
+def publicar_medidas(documentos, nombres):
+    """Publica cada lectura nueva a los temas todas, sensor y dispositivo.
+
+    `nombres` es el índice por id del catálogo (sensor_id -> nombre, dispositivo
+    y nombres de campos); las lecturas se publican con la forma de /medidas.
+    """
+    if EVENTOS_DIFUSION == "mongo":
+        # Otros procesos pueden tener suscriptores: siempre se difunde
+        db = get_db()
+        if db is None or not documentos:
+            return
+        if not _difusion["configurada"]:
+            # Si el arranque fue sin conexión, crear la colección limitada antes de la primera escritura
+            configurar_difusion(db)
+        db[COLECCION_DIFUSION].insert_many(documentos_difusion(documentos, nombres))
+        return
+    if not centro_eventos.hay_suscriptores():
+        return
+    _repartir(_evento(doc, nombres) for doc in documentos)
+
+
+def documentos_difusion(documentos, nombres):
+    """Documentos a escribir en la colección de difusión para un lote de medidas."""
+    eventos = [_evento(doc, nombres) for doc in documentos]
+    return [
+        {"en": datetime.utcnow(), "eventos": eventos[i:i + EVENTOS_POR_DOCUMENTO]}
+        for i in range(0, len(eventos), EVENTOS_POR_DOCUMENTO)
+    ]
+
+
+def configurar_difusion(db):
+    """Crea la colección limitada de difusión si EVENTOS_DIFUSION=mongo."""
+    if EVENTOS_DIFUSION != "mongo":
+        return
+    if COLECCION_DIFUSION not in db.list_collection_names():
+        db.create_collection(COLECCION_DIFUSION, capped=True, size=EVENTOS_DIFUSION_MB * 1024 * 1024)
+        # Un cursor tailable sobre una colección vacía termina de inmediato
+        db[COLECCION_DIFUSION].insert_one({"en": datetime.utcnow(), "eventos": []})
+    _difusion["configurada"] = True
+
+
+class SeguidorDifusion:
+    """Hilo que sigue la colección de difusión y reparte sus eventos en este proceso.
+
+    Arranca con la primera conexión SSE del proceso (también tras un fork).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def asegurar(self):
+        if EVENTOS_DIFUSION != "mongo" or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._bucle, name="difusion-eventos", daemon=True).start()
+
+    def _bucle(self):
+        # Solo se reparten los lotes escritos desde que arrancó el seguidor; el
+        # filtro es por hora de escritura porque los _id de distintos procesos
+        # no siguen el orden de inserción
+        desde = datetime.utcnow()
+        while True:
+            try:
+                db = get_db()
+                if db is None:
+                    time.sleep(EVENTOS_LATIDO_S)
+                    continue
+                cursor = db[COLECCION_DIFUSION].find(
+                    {"en": {"$gt": desde}}, cursor_type=CursorType.TAILABLE_AWAIT
+                ).max_await_time_ms(1000)
+                while cursor.alive:
+                    for doc in cursor:
+                        desde = doc["en"]
+                        _repartir(doc["eventos"])
+            except Exception as e:
+                log_error(e, "eventos.difusion")
+            # Cursor cerrado (colección vacía o reciclada) o error: reintentar
+            time.sleep(1)
+
+
+seguidor_difusion = SeguidorDifusion()
@@ -0,0 +1,165 @@
+"""
+Exportación masiva de medidas
+Genera CSV, Parquet o Arrow IPC por bloques directamente desde el cursor de
+MongoDB, para exportar temporadas completas con memoria acotada.
+"""
+
+import csv
+import io
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: solo se necesita para parquet/arrow
+    pa = None
+    pq = None
+
+FORMATOS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+COLUMNAS = ["timestamp", "sensor_id", "sensor", "campo_id", "nombre_campo", "valor"]
+
+
+def formato_disponible(formato):
+    """Indica si el formato puede generarse con las dependencias instaladas."""
+    return formato == "csv" or pa is not None
+
+
+def _filas(cursor, nombres):
+    """Convierte lecturas planas en filas con los nombres ya resueltos."""
+    for medida in cursor:
+        sensor = nombres.get(medida["sensor_id"])
+        yield (
+            medida["timestamp"],
+            str(medida["sensor_id"]),
+            sensor["nombre"] if sensor else None,
+            str(medida["campo_id"]),
+            sensor["campos"].get(medida["campo_id"]) if sensor else None,
+            medida["valor"],
+        )
+
+
+def _bloques(filas, tam_bloque):
+    bloque = []
+    for fila in filas:
+        bloque.append(fila)
+        if len(bloque) >= tam_bloque:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def generar_csv(cursor, nombres, tam_bloque):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(COLUMNAS)
+    for bloque in _bloques(_filas(cursor, nombres), tam_bloque):
+        for timestamp, sensor_id, sensor, campo_id, nombre_campo, valor in bloque:
+            if isinstance(valor, bool):
+                valor = str(valor).lower()
+            escritor.writerow([timestamp.isoformat(), sensor_id, sensor, campo_id, nombre_campo, valor])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Encabezado de una exportación vacía
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _SumideroFlujo:
+    """Archivo de solo escritura que acumula bytes para entregarlos por partes."""
+
+    def __init__(self):
+        self._partes = []
+        self._posicion = 0
+        self.closed = False
+
+    def write(self, datos):
+        datos = bytes(datos)
+        self._partes.append(datos)
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self._posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def tomar(self):
+        datos = b"".join(self._partes)
+        self._partes = []
+        return datos
+
+
+def _esquema():
+    return pa.schema([
+        ("timestamp", pa.timestamp("ms")),
+        ("sensor_id", pa.string()),
+        ("sensor", pa.string()),
+        ("campo_id", pa.string()),
+        ("nombre_campo", pa.string()),
+        # Columnar: los valores numéricos (y booleanos como 0/1) van en `valor`
+        # y los que no son números en `valor_texto`
+        ("valor", pa.float64()),
+        ("valor_texto", pa.string()),
+    ])
+
+
+def _tabla(bloque, esquema):
+    timestamps, sensor_ids, sensores, campo_ids, nombres_campo, valores, textos = ([] for _ in range(7))
+    for timestamp, sensor_id, sensor, campo_id, nombre_campo, valor in bloque:
+        timestamps.append(timestamp)
+        sensor_ids.append(sensor_id)
+        sensores.append(sensor)
+        campo_ids.append(campo_id)
+        nombres_campo.append(nombre_campo)
+        if isinstance(valor, (int, float)):
+            valores.append(float(valor))
+            textos.append(None)
+        else:
+            valores.append(None)
+            textos.append(None if valor is None else str(valor))
+    columnas = [timestamps, sensor_ids, sensores, campo_ids, nombres_campo, valores, textos]
+    return pa.Table.from_arrays(
+        [pa.array(columna, type=campo.type) for columna, campo in zip(columnas, esquema)],
+        schema=esquema
+    )
+
+
+def generar_parquet(cursor, nombres, tam_bloque):
+    esquema = _esquema()
+    sumidero = _SumideroFlujo()
+    escritor = pq.ParquetWriter(sumidero, esquema, compression="zstd")
+    for bloque in _bloques(_filas(cursor, nombres), tam_bloque):
+        escritor.write_table(_tabla(bloque, esquema))
+        yield sumidero.tomar()
+    escritor.close()
+    yield sumidero.tomar()
+
+
+def generar_arrow(cursor, nombres, tam_bloque):
+    esquema = _esquema()
+    sumidero = _SumideroFlujo()
+    escritor = pa.ipc.new_stream(sumidero, esquema)
+    for bloque in _bloques(_filas(cursor, nombres), tam_bloque):
+        escritor.write_table(_tabla(bloque, esquema))
+        yield sumidero.tomar()
+    escritor.close()
+    yield sumidero.tomar()
+
+
+GENERADORES = {
+    "csv": generar_csv,
+    "parquet": generar_parquet,
+    "arrow": generar_arrow,
+}
@@ -0,0 +1,76 @@
+"""
+Configuración de gunicorn para producción en Linux
+
+    cd backend
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Varios procesos (workers) con varios hilos cada uno (worker gthread). Todo se
+ajusta por variables de entorno, también desde el .env del proyecto:
+
+    GUNICORN_WORKERS   procesos (por defecto 2 x núcleos + 1, máximo 8)
+    GUNICORN_THREADS   hilos por proceso (por defecto 8)
+    GUNICORN_TIMEOUT   segundos sin señal de vida antes de reiniciar un worker (60)
+    GUNICORN_PRELOAD   1 = importar la app en el maestro antes del fork (por defecto 1)
+    BIND_HOST / PORT   dirección de escucha (0.0.0.0:8860)
+
+Cada conexión SSE abierta (/eventos) ocupa un hilo mientras dura, así que
+GUNICORN_WORKERS x GUNICORN_THREADS debe cubrir los navegadores conectados más
+las peticiones normales.
+
+MongoDB: el maestro no conecta (salvo con ALLOW_START_WITHOUT_DB=0, para
+comprobar la conexión, y la cierra antes de crear los workers). Cada worker
+arranca al nacer su propio supervisor, que conecta en segundo plano, crea los
+índices que falten y reconecta si MongoDB cae; /ready indica cuándo está listo.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Leer el .env antes de calcular los valores por defecto (no pisa el entorno real)
+load_dotenv(dotenv_path=Path(__file__).parent.parent / ".env")
+
+bind = f"{os.getenv('BIND_HOST', '0.0.0.0')}:{os.getenv('PORT', '8860')}"
+workers = int(os.getenv("GUNICORN_WORKERS", str(min(multiprocessing.cpu_count() * 2 + 1, 8))))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+worker_class = "gthread"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+accesslog = "-" if os.getenv("GUNICORN_ACCESSLOG", "0") == "1" else None
+errorlog = "-"
+
+# Con varios procesos el estado en memoria de cada uno no ve las escrituras de
+# los demás. Valores por defecto seguros (un valor explícito en el entorno manda):
+#   - eventos en vivo difundidos entre procesos a través de MongoDB
+#   - catálogo de sensores releído cada 10 s
+#   - /metrics suma las métricas de todos los workers (directorio compartido,
+#     vaciado en cada arranque para no arrastrar procesos de otra ejecución)
+# (los ETag ya siguen las escrituras de otros workers: ver versiones.py)
+if workers > 1:
+    os.environ.setdefault("EVENTOS_DIFUSION", "mongo")
+    os.environ.setdefault("CATALOGO_TTL", "10")
+    os.environ.setdefault(
+        "METRICAS_DIR", os.path.join(tempfile.gettempdir(), f"sembrandobits-metricas-{os.getenv('PORT', '8860')}")
+    )
+    shutil.rmtree(os.environ["METRICAS_DIR"], ignore_errors=True)
+    os.makedirs(os.environ["METRICAS_DIR"], exist_ok=True)
+
+
+def when_ready(server):
+    # Se ejecuta en el maestro antes de crear los workers: su cliente no debe heredarse
+    if server.cfg.preload_app:
+        from database import cerrar_conexion
+        cerrar_conexion()
+
+
+def post_worker_init(worker):
+    # El supervisor es un hilo: se arranca ya en el worker, no en el maestro
+    from database import iniciar_supervisor
+    iniciar_supervisor()
+    worker.log.info("Worker %s iniciado; conectando a MongoDB en segundo plano", worker.pid)
@@ -0,0 +1,374 @@
+"""
+Índices declarados y auditoría de planes de consulta
+Un solo lugar con los índices que necesita cada colección, derivados de las
+consultas que hacen los blueprints:
+
+- sensores: nombre (único, alta/edición por nombre) y dispositivo_id + activo
+  (sensores de un dispositivo en /dispositivo/<n> y /dispositivos/resumen).
+  Los índices antiguos activo+tipo_sensor (el campo guardado es "tipo" y
+  ninguna consulta filtra por él) y campos.nombre_campo (solo se busca junto
+  con _id) quedan obsoletos.
+- medidas crudas: los del modo de almacenamiento (almacen_medidas.py).
+- ultimas_medidas, medidas_minuto/hora/dia, votaciones y lotes_ingeridos
+  (único por origen y lote, más el TTL de lotes.py).
+
+`migrar_indices` lleva una base existente al conjunto declarado: crea los que
+faltan y elimina los obsoletos y los redundantes (un índice cuyas claves son
+prefijo de otro declarado, como los timestamp, sensor_id+timestamp y
+sensor_id+campo_id+timestamp sin _id de versiones anteriores). Cada índice
+sobrante encarece cada inserción en la colección.
+
+`configurar_base_datos` crea la colección de medidas del modo actual, los
+índices declarados que falten y la colección de difusión. La ejecuta cada
+proceso que escribe al conectar: el servidor Flask, ingesta_async e
+ingesta_udp.
+
+`auditar_consultas` ejecuta explain() sobre cada forma de consulta de la API y
+señala recorridos completos (COLLSCAN), ordenamientos en memoria (SORT) e
+índices sin uso ($indexStats), con una sugerencia de índice en cada caso.
+Se ejecuta con `python mantenimiento.py auditar` e `indices`.
+"""
+
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from database import asegurar_indices, log_error
+from almacen_medidas import almacen
+from eventos import configurar_difusion
+from lotes import COLECCION as COLECCION_LOTES, indices_lotes
+
+INDICES = {
+    "sensores": [
+        ([("nombre", 1)], {"unique": True}),
+        ([("dispositivo_id", 1), ("activo", 1)], {}),
+    ],
+    "ultimas_medidas": [([("sensor_id", 1), ("campo_id", 1)], {"unique": True})],
+    "medidas_minuto": [([("sensor_id", 1), ("campo_id", 1), ("inicio", 1)], {"unique": True})],
+    "medidas_hora": [([("sensor_id", 1), ("campo_id", 1), ("inicio", 1)], {"unique": True})],
+    "medidas_dia": [([("sensor_id", 1), ("campo_id", 1), ("inicio", 1)], {"unique": True})],
+    "votaciones": [([("fecha", -1)], {})],
+    COLECCION_LOTES: indices_lotes(),
+}
+
+# Índices creados por versiones anteriores que ninguna consulta usa
+OBSOLETOS = {
+    "sensores": [[("activo", 1), ("tipo_sensor", 1)], [("campos.nombre_campo", 1)]],
+}
+
+# Colecciones de menos documentos que esto: un COLLSCAN o SORT en memoria es barato
+DOCUMENTOS_POCOS = 1000
+
+
+def indices_declarados():
+    """{colección: [(claves, opciones), ...]} para el modo de almacenamiento actual."""
+    return {almacen.nombre_coleccion: almacen.indices, **INDICES}
+
+
+def configurar_base_datos(db):
+    """Configura colecciones e índices para optimizar consultas.
+
+    Se ejecuta tras cada conexión nueva. Solo crea los índices que faltan, así
+    que con la base ya configurada cuesta una lectura de índices por colección.
+    Los obsoletos no se eliminan aquí: para eso está
+    `python mantenimiento.py indices --aplicar`.
+    """
+    try:
+        # Coleccion e indices de medidas segun el modo de almacenamiento
+        creados = almacen.configurar(db)
+        for coleccion, declarados in indices_declarados().items():
+            if coleccion != almacen.nombre_coleccion:
+                creados += asegurar_indices(db[coleccion], declarados)
+        # Colección limitada para difundir eventos en vivo entre procesos (EVENTOS_DIFUSION=mongo)
+        configurar_difusion(db)
+        if creados:
+            print(f"[OK] Indices de la base de datos creados correctamente ({creados} nuevos)")
+        else:
+            print("[OK] Indices de la base de datos ya existentes")
+    except Exception as e:
+        print(f"[WARN] Error al configurar indices: {e}. La app funcionara pero con rendimiento reducido.")
+
+
+def _claves(info):
+    return tuple((k, int(v) if isinstance(v, float) else v) for k, v in info["key"])
+
+
+def _invertir(claves):
+    return tuple((k, -v if isinstance(v, int) else v) for k, v in claves)
+
+
+def _es_prefijo(corto, largo):
+    """True si `corto` es prefijo de `largo` (o de `largo` recorrido al revés)."""
+    if len(corto) >= len(largo):
+        return False
+    return largo[:len(corto)] in (corto, _invertir(corto))
+
+
+def planificar_indices(coleccion, declarados):
+    """Compara los índices existentes con los declarados.
+
+    Retorna {"crear": [(claves, opciones)], "eliminar": [(nombre, claves, motivo)],
+    "no_declarados": [(nombre, claves)]}. Nunca elimina _id_ ni índices únicos
+    no declarados (pueden sostener una restricción).
+    """
+    existentes = {nombre: info for nombre, info in coleccion.index_information().items() if nombre != "_id_"}
+    claves_existentes = {_claves(info) for info in existentes.values()}
+    claves_declaradas = [tuple(claves) for claves, _ in declarados]
+    obsoletos = [tuple(c) for c in OBSOLETOS.get(coleccion.name, [])]
+    plan = {
+        "crear": [(claves, opciones) for claves, opciones in declarados if tuple(claves) not in claves_existentes],
+        "eliminar": [],
+        "no_declarados": [],
+    }
+    for nombre, info in sorted(existentes.items()):
+        claves = _claves(info)
+        if claves in claves_declaradas:
+            continue
+        if claves in obsoletos:
+            plan["eliminar"].append((nombre, claves, "obsoleto"))
+        elif info.get("unique"):
+            plan["no_declarados"].append((nombre, claves))
+        elif any(_es_prefijo(claves, declarado) for declarado in claves_declaradas):
+            plan["eliminar"].append((nombre, claves, "redundante"))
+        else:
+            plan["no_declarados"].append((nombre, claves))
+    return plan
+
+
+def migrar_indices(db, aplicar=False, estricto=False):
+    """Lleva los índices de la base al conjunto declarado.
+
+    Sin `aplicar` solo informa. Con `estricto` también elimina los índices no
+    declarados que no son únicos. Retorna {colección: plan} (ver planificar_indices).
+    """
+    existentes = set(db.list_collection_names())
+    planes = {}
+    for nombre, declarados in indices_declarados().items():
+        if nombre not in existentes:
+            continue
+        coleccion = db[nombre]
+        plan = planificar_indices(coleccion, declarados)
+        if estricto:
+            plan["eliminar"] += [(n, c, "no declarado") for n, c in plan["no_declarados"]]
+            plan["no_declarados"] = []
+        planes[nombre] = plan
+        if not aplicar:
+            continue
+        # Crear antes de eliminar: las consultas nunca se quedan sin índice
+        asegurar_indices(coleccion, plan["crear"])
+        for indice, _, _ in plan["eliminar"]:
+            coleccion.drop_index(indice)
+    return planes
+
+
+# --- Auditoría de consultas ---
+
+def _muestra(db):
+    """Ids y fechas reales para las consultas de la auditoría (o valores nuevos si la base está vacía)."""
+    ultima = db.ultimas_medidas.find_one({}, sort=[("timestamp", -1)]) or {}
+    sensor = db.sensores.find_one({"dispositivo_id": {"$exists": True}}) or {}
+    hasta = ultima.get("timestamp") or datetime.utcnow()
+    return {
+        "sensor_id": ultima.get("sensor_id") or ObjectId(),
+        "campo_id": ultima.get("campo_id") or ObjectId(),
+        "dispositivo_id": sensor.get("dispositivo_id") or ObjectId(),
+        "nombre": sensor.get("nombre") or "sensor",
+        "desde": hasta - timedelta(days=1),
+        "hasta": hasta,
+    }
+
+
+def _consulta_medidas(descripcion, filtro, orden=-1, limite=100, despues_de=None):
+    etapas = almacen.etapas_consulta(filtro, orden=orden, limite=limite, despues_de=despues_de)
+    return descripcion, almacen.nombre_coleccion, {"aggregate": almacen.nombre_coleccion, "pipeline": etapas, "cursor": {}}
+
+
+def _find(descripcion, coleccion, filtro, orden=None, limite=None, proyeccion=None):
+    comando = {"find": coleccion, "filter": filtro}
+    if orden:
+        comando["sort"] = orden
+    if limite:
+        comando["limit"] = limite
+    if proyeccion:
+        comando["projection"] = proyeccion
+    return descripcion, coleccion, comando
+
+
+def consultas_api(m):
+    """Formas de consulta que emiten los endpoints: [(descripción, colección, comando)]."""
+    campo_tiempo = "hora" if almacen.modo == "buckets" else "timestamp"
+    orden_ultimo = {"hora": -1, "ultimo": -1} if almacen.modo == "buckets" else {"timestamp": -1}
+    campo_sensor = "meta.sensor_id" if almacen.modo == "timeseries" else "sensor_id"
+    return [
+        _consulta_medidas("GET /medidas", {}),
+        _consulta_medidas("GET /medidas?sensor_id", {"sensor_id": m["sensor_id"]}),
+        _consulta_medidas("GET /medidas?sensor_id&campo_id", {"sensor_id": m["sensor_id"], "campo_id": m["campo_id"]}),
+        _consulta_medidas("GET /medidas?desde&hasta", {"timestamp": {"$gte": m["desde"], "$lte": m["hasta"]}}),
+        _consulta_medidas("GET /medidas?cursor (página siguiente)", {}, despues_de=(m["hasta"], ObjectId())),
+        _consulta_medidas("GET /medidas/exportar?sensor_id&desde", {
+            "sensor_id": {"$in": [m["sensor_id"]]}, "timestamp": {"$gte": m["desde"]}}, orden=1, limite=None),
+        _find("GET /estado sin contadores (última lectura)", almacen.nombre_coleccion, {}, orden_ultimo, 1),
+        ("retención (sensores con lecturas antiguas)", almacen.nombre_coleccion,
+         {"distinct": almacen.nombre_coleccion, "key": campo_sensor, "query": {campo_tiempo: {"$lt": m["desde"]}}}),
+        _find("GET /dispositivo/<n> (sensores vinculados)", "sensores",
+              {"dispositivo_id": m["dispositivo_id"], "activo": True}),
+        _find("GET /dispositivos/resumen (sensores vinculados)", "sensores",
+              {"dispositivo_id": {"$in": [m["dispositivo_id"]]}, "activo": True}),
+        _find("POST /agregar_sensor (por nombre)", "sensores", {"nombre": m["nombre"]}, limite=1),
+        _find("GET /dispositivo/<n> (últimos valores)", "ultimas_medidas",
+              {"sensor_id": {"$in": [m["sensor_id"]]}},
+              proyeccion={"_id": 0, "sensor_id": 1, "campo_id": 1, "valor": 1, "timestamp": 1}),
+        _find("GET /medidas/serie", "medidas_hora",
+              {"sensor_id": m["sensor_id"], "campo_id": m["campo_id"], "inicio": {"$gte": m["desde"], "$lte": m["hasta"]}},
+              {"inicio": 1}, proyeccion={"_id": 0, "inicio": 1, "count": 1, "suma": 1, "min": 1, "max": 1, "ultimo": 1}),
+        _find("GET /votaciones", "votaciones", {}, {"fecha": -1}, 100),
+        _find("GET /votaciones?cultivo", "votaciones", {"cultivo": "maiz"}, {"fecha": -1}, 100),
+        _find("GET /dispositivos (orden de creación)", "dispositivos", {}, {"created_at": 1},
+              proyeccion={"nombre": 1, "created_at": 1}),
+    ]
+
+
+def _buscar(nodo, clave):
+    """Primer valor de `clave` en una estructura anidada de dicts y listas."""
+    if isinstance(nodo, dict):
+        if clave in nodo:
+            return nodo[clave]
+        hijos = nodo.values()
+    elif isinstance(nodo, list):
+        hijos = nodo
+    else:
+        return None
+    for hijo in hijos:
+        encontrado = _buscar(hijo, clave)
+        if encontrado is not None:
+            return encontrado
+    return None
+
+
+def _etapas(plan):
+    """(etapa, índice) de cada nodo del plan ganador, de la raíz a las hojas."""
+    if not isinstance(plan, dict):
+        return []
+    plan = plan.get("queryPlan", plan)
+    etapas = [(plan.get("stage"), plan.get("indexName"))]
+    for clave in ("inputStage", "outerStage", "innerStage"):
+        etapas += _etapas(plan.get(clave))
+    for hijo in plan.get("inputStages", []):
+        etapas += _etapas(hijo)
+    return etapas
+
+
+def _campos_filtro(filtro):
+    """(igualdades, rangos) del filtro, en orden."""
+    igualdades, rangos = [], []
+    for campo, valor in filtro.items():
+        if campo.startswith("$"):
+            continue
+        if isinstance(valor, dict) and any(k in valor for k in ("$gt", "$gte", "$lt", "$lte")):
+            rangos.append(campo)
+        else:
+            igualdades.append(campo)
+    return igualdades, rangos
+
+
+def _sugerir(comando, etapas):
+    """Sugerencias de índice a partir de la forma de la consulta y su plan."""
+    if "find" in comando:
+        filtro, orden, proyeccion = comando.get("filter", {}), comando.get("sort", {}), comando.get("projection")
+    elif "distinct" in comando:
+        filtro, orden, proyeccion = comando.get("query", {}), {}, None
+    else:
+        primera = comando["pipeline"][0].get("$match", {}) if comando["pipeline"] else {}
+        filtro = primera if "$and" not in primera else primera["$and"][0]
+        orden = next((e["$sort"] for e in comando["pipeline"] if "$sort" in e), {})
+        proyeccion = None
+    igualdades, rangos = _campos_filtro(filtro)
+    # Regla igualdad -> orden -> rango
+    claves = [(c, 1) for c in igualdades] + [(c, d) for c, d in orden.items() if c not in igualdades]
+    claves += [(c, 1) for c in rangos if c not in dict(claves)]
+    nombres = [n for n, _ in etapas]
+    sugerencias = []
+    if claves and ("COLLSCAN" in nombres or "SORT" in nombres):
+        sugerencias.append(f"índice {claves}")
+        # Un filtro fijo como activo: True cabe en un índice parcial más pequeño
+        booleanos = {c: v for c, v in filtro.items() if isinstance(v, bool)}
+        if booleanos and len(booleanos) < len(claves):
+            sugerencias.append(f"índice parcial {[c for c in claves if c[0] not in booleanos]} "
+                               f"con partialFilterExpression={booleanos}")
+    if proyeccion and "FETCH" in nombres and "IXSCAN" in nombres:
+        campos = [c for c, v in proyeccion.items() if v and c != "_id"]
+        faltantes = [c for c in campos if c not in dict(claves)]
+        if faltantes and proyeccion.get("_id") == 0:
+            sugerencias.append(f"índice cubriente {claves + [(c, 1) for c in faltantes]} (evita FETCH)")
+    return sugerencias
+
+
+def auditar_consulta(db, descripcion, coleccion, comando):
+    """explain() de una consulta con su diagnóstico."""
+    explicacion = db.command({"explain": comando, "verbosity": "executionStats"})
+    planificador = _buscar(explicacion, "queryPlanner") or {}
+    estadisticas = _buscar(explicacion, "executionStats") or {}
+    etapas = _etapas(planificador.get("winningPlan"))
+    nombres = [n for n, _ in etapas]
+    # $sort que no se resolvió con un índice queda como etapa propia de la agregación
+    sort_agregacion = any("$sort" in e for e in explicacion.get("stages", []) if isinstance(e, dict))
+    problemas = []
+    if "COLLSCAN" in nombres:
+        problemas.append("COLLSCAN")
+    if "SORT" in nombres or sort_agregacion:
+        problemas.append("SORT en memoria")
+    documentos = db[coleccion].estimated_document_count()
+    return {
+        "consulta": descripcion,
+        "coleccion": coleccion,
+        "documentos": documentos,
+        "plan": " <- ".join(n for n in nombres if n),
+        "indices": sorted({i for _, i in etapas if i}),
+        "claves_examinadas": estadisticas.get("totalKeysExamined"),
+        "documentos_examinados": estadisticas.get("totalDocsExamined"),
+        "devueltos": estadisticas.get("nReturned"),
+        "ms": estadisticas.get("executionTimeMillis"),
+        "problemas": problemas,
+        "gravedad": "baja" if problemas and documentos < DOCUMENTOS_POCOS else ("alta" if problemas else None),
+        "sugerencias": _sugerir(comando, etapas) if problemas or "FETCH" in nombres else [],
+    }
+
+
+def indices_sin_uso(db):
+    """Índices sin operaciones desde el último reinicio del servidor ($indexStats).
+
+    Los contadores son por nodo y se reinician con mongod: conviene revisarlos
+    tras un período de uso normal.
+    """
+    existentes = set(db.list_collection_names())
+    sin_uso = []
+    for nombre in indices_declarados():
+        if nombre not in existentes:
+            continue
+        for estadistica in db[nombre].aggregate([{"$indexStats": {}}]):
+            if estadistica["name"] != "_id_" and estadistica["accesses"]["ops"] == 0:
+                sin_uso.append({
+                    "coleccion": nombre,
+                    "indice": estadistica["name"],
+                    "desde": estadistica["accesses"]["since"],
+                })
+    return sin_uso
+
+
+def auditar_consultas(db):
+    """Audita todas las formas de consulta de la API. Retorna {"consultas": [...], "indices_sin_uso": [...]}."""
+    muestra = _muestra(db)
+    resultados = []
+    for descripcion, coleccion, comando in consultas_api(muestra):
+        try:
+            resultados.append(auditar_consulta(db, descripcion, coleccion, comando))
+        except Exception as e:
+            log_error(e, f"auditar_consultas.{descripcion}")
+            resultados.append({"consulta": descripcion, "coleccion": coleccion, "error": str(e)})
+    try:
+        sin_uso = indices_sin_uso(db)
+    except Exception as e:
+        # $indexStats necesita permisos de clusterMonitor en algunos despliegues
+        log_error(e, "auditar_consultas.indices_sin_uso")
+        sin_uso = []
+    return {"consultas": resultados, "indices_sin_uso": sin_uso}
@@ -0,0 +1,281 @@
+"""
+Validación y escritura de lecturas para la ingesta
+Lógica compartida por todas las vías de ingesta (POST /guardar en Flask, el
+servicio asíncrono de ingesta_async.py, el receptor UDP de ingesta_udp.py):
+convierte las lecturas recibidas por nombre de sensor y de campo en documentos
+de medidas, usando el catálogo de sensores y el tipo de cada campo, y los
+escribe junto con las colecciones derivadas.
+
+Además del JSON por nombres, /guardar acepta un formato compacto pensado para
+enlaces lentos: sensores y campos por id, una marca de tiempo base y los
+valores en un arreglo por columnas, codificado en JSON, MessagePack
+(application/msgpack) o CBOR (application/cbor):
+
+    {"t": 1718000000,                       # opcional: segundos Unix (UTC) de la primera fila
+     "l": [{"s": <sensor_id>,               # ObjectId: 12 bytes binarios o 24 caracteres hex
+            "c": [<campo_id>, <campo_id>],  # columnas
+            "v": [25.1, 60, 25.3, 61],      # valores fila por fila (filas x columnas)
+            "dt": [0, 30]}]}                # opcional: segundos desde t de cada fila
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from database import log_error
+from catalogo import obtener_indice_por_id
+from almacen_medidas import almacen
+from ultimas_medidas import actualizar_ultimas
+from rollups import actualizar_rollups
+from contadores import registrar_medidas
+from versiones import marcar_cambio
+from eventos import publicar_medidas
+from metricas import (INGESTA_ACEPTADAS, INGESTA_RECHAZADAS, INGESTA_SENSORES_DESCONOCIDOS,
+                      INGESTA_CAMPOS_DESCONOCIDOS)
+
+try:
+    import msgpack
+except ImportError:  # msgpack es opcional: solo se necesita para application/msgpack
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # cbor2 es opcional: solo se necesita para application/cbor
+    cbor2 = None
+
+# Content-Type -> formato binario aceptado por /guardar
+FORMATOS_BINARIOS = {
+    "application/msgpack": "msgpack",
+    "application/x-msgpack": "msgpack",
+    "application/vnd.msgpack": "msgpack",
+    "application/cbor": "cbor",
+}
+PAQUETES = {"msgpack": "msgpack", "cbor": "cbor2"}
+
+# Segundos que una marca de tiempo enviada por el dispositivo puede adelantarse
+# a la hora del servidor (desfase de reloj tolerado). Una lectura en el futuro
+# quedaría como la última de su campo hasta que el tiempo real la alcance.
+INGESTA_FUTURO_MAX_S = float(os.getenv("INGESTA_FUTURO_MAX_S", "300"))
+
+# Tipo de campo -> tipo de Python que ya es válido sin convertir (atajo de la validación)
+_TIPOS_YA_VALIDOS = {"float": float, "double": float, "integer": int, "int": int}
+
+
+def validar_valor_por_tipo(valor, tipo_campo, nombre_campo):
+    """
+    Valida y convierte un valor según el tipo de campo definido.
+    
+    Args:
+        valor: Valor a validar
+        tipo_campo: Tipo de campo ('boolean', 'float', 'integer', etc.)
+        nombre_campo: Nombre del campo para mensajes de error
+    
+    Returns:
+        tuple: (valor_convertido, mensaje_error)
+        Si hay error, el primer elemento es None
+    """
+    if valor is None:
+        return None, None
+    
+    if tipo_campo.lower() == 'boolean':
+        # Usar la misma lógica de validación que en sensores.py
+        if isinstance(valor, bool):
+            return valor, None
+        elif isinstance(valor, str):
+            valor_lower = valor.lower()
+            if valor_lower in ['true', '1', 'yes', 'on']:
+                return True, None
+            elif valor_lower in ['false', '0', 'no', 'off']:
+                return False, None
+            else:
+                return None, f"El campo '{nombre_campo}' debe ser un booleano válido (true/false)"
+        elif isinstance(valor, int):
+            return bool(valor), None
+        else:
+            return None, f"El campo '{nombre_campo}' debe ser un booleano válido"
+    elif tipo_campo.lower() in ['float', 'double']:
+        try:
+            return float(valor), None
+        except (ValueError, TypeError):
+            return None, f"El campo '{nombre_campo}' debe ser un número decimal válido"
+    elif tipo_campo.lower() in ['integer', 'int']:
+        try:
+            return int(valor), None
+        except (ValueError, TypeError):
+            return None, f"El campo '{nombre_campo}' debe ser un número entero válido"
+    else:
+        # Para otros tipos, devolver el valor tal como está
+        return valor, None
+
+
+def preparar_medidas(measures, mapa_sensores):
+    """Convierte el objeto 'measures' de /guardar en documentos de medidas.
+
+    Args:
+        measures: {nombre_sensor: [{"detail": nombre_campo, "value": valor}, ...]}
+        mapa_sensores: mapa de sensores activos por nombre (catalogo.obtener_mapa_sensores)
+
+    Returns:
+        tuple: (documentos, mensaje_error). Los sensores y campos desconocidos o
+        inactivos se ignoran; un valor inválido aborta el lote completo.
+    """
+    documentos = []
+    for sensor_name, lecturas in measures.items():
+        if sensor_name not in mapa_sensores:
+            INGESTA_SENSORES_DESCONOCIDOS.inc()
+            continue
+        sensor_info = mapa_sensores[sensor_name]
+        sensor_id = sensor_info['id']
+        for lectura in lecturas:
+            detalle = lectura.get("detail")
+            if detalle not in sensor_info['campos']:
+                INGESTA_CAMPOS_DESCONOCIDOS.inc()
+                continue
+            campo_info = sensor_info['campos'][detalle]
+
+            # Validar y convertir el valor según el tipo de campo
+            valor_validado, error_validacion = validar_valor_por_tipo(
+                lectura.get("value"), campo_info['tipo'], detalle
+            )
+            if error_validacion:
+                INGESTA_RECHAZADAS.inc("tipo")
+                return None, f"Sensor '{sensor_name}', campo '{detalle}': {error_validacion}"
+
+            documentos.append({
+                "sensor_id": sensor_id,
+                "campo_id": campo_info['id'],
+                "valor": valor_validado,
+                "timestamp": datetime.utcnow()
+            })
+    INGESTA_ACEPTADAS.inc(n=len(documentos))
+    return documentos, None
+
+
+def limite_futuro():
+    """Marca de tiempo máxima aceptada para una lectura que trae la suya."""
+    return datetime.utcnow() + timedelta(seconds=INGESTA_FUTURO_MAX_S)
+
+
+def persistir_medidas(medidas_a_insertar):
+    """Escribe un lote de documentos de medidas y actualiza las colecciones derivadas."""
+    almacen.insertar(medidas_a_insertar)
+    marcar_cambio("medidas", compartir=False)
+    for actualizar in (actualizar_ultimas, actualizar_rollups, registrar_medidas):
+        try:
+            actualizar(medidas_a_insertar)
+        except Exception as e:
+            # Las medidas ya quedaron guardadas; las colecciones derivadas se pueden reconstruir
+            log_error(e, f"persistir_medidas.{actualizar.__name__}")
+    try:
+        publicar_medidas(medidas_a_insertar, obtener_indice_por_id())
+    except Exception as e:
+        log_error(e, "persistir_medidas.publicar_medidas")
+
+
+def formato_binario(tipo_contenido):
+    """Formato binario ("msgpack" o "cbor") del Content-Type, o None si no es binario."""
+    return FORMATOS_BINARIOS.get((tipo_contenido or "").split(";")[0].strip().lower())
+
+
+def formato_disponible(formato):
+    """Indica si el formato binario puede decodificarse con las dependencias instaladas."""
+    return (msgpack if formato == "msgpack" else cbor2) is not None
+
+
+def decodificar(formato, cuerpo):
+    """Decodifica un cuerpo MessagePack o CBOR. Lanza ValueError si está mal formado."""
+    try:
+        if formato == "msgpack":
+            return msgpack.unpackb(cuerpo, raw=False)
+        return cbor2.loads(cuerpo)
+    except Exception as e:
+        raise ValueError(f"Cuerpo {formato} inválido: {e}") from e
+
+
+def _id(valor):
+    if isinstance(valor, (bytes, bytearray)):
+        return ObjectId(bytes(valor))
+    return ObjectId(valor)
+
+
+def preparar_medidas_compactas(datos, tipos_por_id):
+    """Convierte el formato compacto ({"t", "l": [...]}) en documentos de medidas.
+
+    Args:
+        datos: cuerpo decodificado con la forma descrita al inicio del módulo
+        tipos_por_id: sensor_id -> {campo_id: tipo} (catalogo.obtener_tipos_por_id)
+
+    Returns:
+        tuple: (documentos, mensaje_error). Igual que preparar_medidas, los
+        sensores y campos desconocidos o inactivos se ignoran y un valor
+        inválido aborta el lote completo, igual que una marca de tiempo más de
+        INGESTA_FUTURO_MAX_S segundos en el futuro.
+    """
+    lotes = datos.get("l")
+    if not isinstance(lotes, list):
+        return None, "'l' debe ser una lista de lotes por sensor"
+    if datos.get("t") is not None:
+        try:
+            base = datetime.fromtimestamp(float(datos["t"]), timezone.utc).replace(tzinfo=None)
+        except (TypeError, ValueError, OverflowError, OSError):
+            return None, "'t' debe ser una marca de tiempo Unix en segundos"
+    else:
+        base = datetime.utcnow()
+    limite = limite_futuro()
+
+    documentos = []
+    for i, lote in enumerate(lotes):
+        try:
+            sensor_id = _id(lote["s"])
+            campo_ids = [_id(c) for c in lote["c"]]
+        except (KeyError, TypeError, InvalidId):
+            return None, f"Lote {i}: 's' y 'c' deben ser ids de sensor y campos (12 bytes o 24 hex)"
+        valores = lote.get("v")
+        columnas = len(campo_ids)
+        if not isinstance(valores, list) or not columnas or len(valores) % columnas:
+            return None, f"Lote {i}: 'v' debe tener filas x {columnas} valores"
+        filas = len(valores) // columnas
+        desfases = lote.get("dt")
+        if desfases is not None and (not isinstance(desfases, list) or len(desfases) != filas):
+            return None, f"Lote {i}: 'dt' debe tener un valor por fila ({filas})"
+
+        tipos = tipos_por_id.get(sensor_id)
+        if tipos is None:
+            INGESTA_SENSORES_DESCONOCIDOS.inc()
+            continue
+        try:
+            marcas = [base + timedelta(seconds=float(d)) for d in desfases] if desfases else [base] * filas
+        except (TypeError, ValueError, OverflowError):
+            return None, f"Lote {i}: 'dt' debe contener segundos numéricos"
+        futuras = sum(1 for marca in marcas if marca > limite)
+        if futuras:
+            INGESTA_RECHAZADAS.inc("timestamp", n=futuras * columnas)
+            return None, (f"Lote {i}: {futuras} filas con marca de tiempo más de "
+                          f"{INGESTA_FUTURO_MAX_S:g} s en el futuro (revise el reloj del dispositivo)")
+
+        # Validar columna por columna: el tipo se resuelve una vez por campo y los
+        # valores que ya llegan con el tipo de Python correcto no se convierten
+        for j, campo_id in enumerate(campo_ids):
+            tipo = tipos.get(campo_id)
+            if tipo is None:
+                INGESTA_CAMPOS_DESCONOCIDOS.inc()
+                continue
+            ya_valido = _TIPOS_YA_VALIDOS.get(tipo.lower())
+            nombre = str(campo_id)
+            for fila in range(filas):
+                valor = valores[fila * columnas + j]
+                if type(valor) is not ya_valido:
+                    valor, error = validar_valor_por_tipo(valor, tipo, nombre)
+                    if error:
+                        INGESTA_RECHAZADAS.inc("tipo")
+                        return None, f"Sensor '{sensor_id}', campo '{nombre}': {error}"
+                documentos.append({
+                    "sensor_id": sensor_id,
+                    "campo_id": campo_id,
+                    "valor": valor,
+                    "timestamp": marcas[fila],
+                })
+    INGESTA_ACEPTADAS.inc(n=len(documentos))
+    return documentos, None
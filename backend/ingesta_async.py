@@ -0,0 +1,326 @@
+"""
+Servicio de ingesta asíncrono (ASGI)
+Alternativa opcional a POST /guardar de Flask para muchos dispositivos
+conectados a la vez: un solo proceso asyncio mantiene miles de conexiones
+abiertas sin un hilo por petición, y usa AsyncMongoClient de pymongo para
+escribir. Las escrituras simultáneas a MongoDB se limitan a
+INGESTA_ESCRITURAS_MAX; el resto de peticiones espera su turno hasta
+INGESTA_ESPERA_S segundos y luego recibe 503 con Retry-After.
+
+Valida igual que Flask (ingesta.preparar_medidas), descarta los lotes
+repetidos igual que Flask (lotes.py, misma colección lotes_ingeridos) y
+actualiza las mismas colecciones derivadas (últimos valores, agregados,
+contadores). Uso:
+
+    pip install uvicorn
+    uvicorn ingesta_async:app --host 0.0.0.0 --port 8861 [--workers N]
+    # o: python ingesta_async.py
+
+Endpoints: POST /guardar (mismos formatos y respuestas que Flask), GET /estado
+(contadores del servicio) y GET /metrics (ver metricas.py). Al ser otro proceso, el servidor Flask no ve sus
+escrituras en memoria: los ETag las detectan por los contadores compartidos
+(versiones.py) y, para los eventos en vivo, conviene EVENTOS_DIFUSION=mongo en
+ambos.
+"""
+
+import asyncio
+import json
+import os
+import time
+
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo.errors import DuplicateKeyError
+from pymongo.server_api import ServerApi
+
+from database import MONGO_URI, MONGO_DB, log_error
+from ingesta import preparar_medidas, preparar_medidas_compactas, formato_binario, formato_disponible, decodificar, PAQUETES
+from catalogo import construir_catalogo, CATALOGO_TTL
+from almacen_medidas import almacen
+from ultimas_medidas import operaciones_ultimas, COLECCION as COLECCION_ULTIMAS
+from rollups import operaciones_rollups
+from contadores import incremento_medidas, COLECCION as COLECCION_CONTADORES, ID_MEDIDAS
+from eventos import EVENTOS_DIFUSION, COLECCION_DIFUSION, documentos_difusion
+from indices import configurar_base_datos
+from lotes import (clave_lote, lote_reciente, documento_lote, lote_nuevo, lote_duplicado, lote_reutilizado,
+                   olvidar_lote, filtro_lote, filtro_reutilizado, estadisticas_lotes, RESPUESTA_DUPLICADO, COLECCION as COLECCION_LOTES)
+from metricas import (METRICAS, TIPO_CONTENIDO, HTTP_PETICIONES, HTTP_DURACION, HTTP_EN_CURSO, exponer,
+                      registrar_escucha_mongo, asegurar_volcado)
+
+# Escrituras a MongoDB en curso como máximo (también el tamaño del pool de conexiones)
+INGESTA_ESCRITURAS_MAX = int(os.getenv("INGESTA_ESCRITURAS_MAX", "32"))
+# Segundos que una petición espera turno de escritura antes de responder 503
+INGESTA_ESPERA_S = float(os.getenv("INGESTA_ESPERA_S", "5"))
+# Tamaño máximo del cuerpo de una petición
+INGESTA_MAX_BYTES = int(os.getenv("INGESTA_MAX_BYTES", str(1024 * 1024)))
+INGESTA_PORT = int(os.getenv("INGESTA_PORT", "8861"))
+
+
+def _configurar_base_datos():
+    """Misma configuración que hace Flask al conectar (indices.configurar_base_datos).
+
+    Usa un cliente síncrono de corta vida: sin ella, la colección de medidas del
+    modo timeseries se crearía como una colección normal con la primera
+    inserción, y lotes_ingeridos no tendría su índice único.
+    """
+    cliente = MongoClient(MONGO_URI, server_api=ServerApi('1'), connectTimeoutMS=30000, serverSelectionTimeoutMS=30000)
+    try:
+        configurar_base_datos(cliente[MONGO_DB])
+    finally:
+        cliente.close()
+
+
+class ServicioIngesta:
+    """Cliente asíncrono, catálogo de sensores y límite de escrituras de un proceso."""
+
+    def __init__(self):
+        self.client = None
+        self.db = None
+        self.semaforo = None
+        self._lock_catalogo = None
+        self._catalogo = {"por_nombre": None, "por_id": None, "tipos_por_id": None, "cargado_en": 0.0}
+        self.contadores = {
+            "peticiones": 0, "medidas": 0, "rechazadas": 0,
+            "sobrecarga": 0, "errores": 0, "en_vuelo": 0, "esperando": 0,
+        }
+
+    async def iniciar(self):
+        # Se llama en el arranque de cada worker, después del fork: el cliente es de este proceso
+        self.semaforo = asyncio.Semaphore(INGESTA_ESCRITURAS_MAX)
+        asegurar_volcado()
+        self._lock_catalogo = asyncio.Lock()
+        if not MONGO_URI:
+            print("⚠️  MONGO_URI no definida. El servicio de ingesta responderá 503.")
+            return
+        registrar_escucha_mongo()
+        self.client = AsyncMongoClient(
+            MONGO_URI,
+            server_api=ServerApi('1'),
+            maxPoolSize=INGESTA_ESCRITURAS_MAX,
+            connectTimeoutMS=30000,
+            serverSelectionTimeoutMS=30000,
+            retryWrites=True
+        )
+        self.db = self.client[MONGO_DB]
+        try:
+            await asyncio.to_thread(_configurar_base_datos)
+        except Exception as e:
+            log_error(e, "ingesta_async.configurar_base_datos")
+        print(f"[OK] Servicio de ingesta asíncrono listo (escrituras máx. {INGESTA_ESCRITURAS_MAX})")
+
+    async def cerrar(self):
+        if self.client is not None:
+            await self.client.close()
+
+    async def catalogo(self):
+        """Mapas del catálogo de sensores (ver catalogo.construir_catalogo), releídos cada CATALOGO_TTL segundos."""
+        if time.monotonic() - self._catalogo["cargado_en"] >= CATALOGO_TTL:
+            async with self._lock_catalogo:
+                if time.monotonic() - self._catalogo["cargado_en"] >= CATALOGO_TTL:
+                    sensores = await self.db.sensores.find().to_list()
+                    (self._catalogo["por_nombre"], self._catalogo["por_id"],
+                     self._catalogo["tipos_por_id"]) = construir_catalogo(sensores)
+                    self._catalogo["cargado_en"] = time.monotonic()
+        return self._catalogo
+
+    async def persistir(self, documentos, nombres):
+        """Versión asíncrona de ingesta.persistir_medidas."""
+        await self.db[almacen.nombre_coleccion].bulk_write(almacen.operaciones_insercion(documentos), ordered=False)
+        derivadas = [(COLECCION_ULTIMAS, operaciones_ultimas(documentos))]
+        derivadas += list(operaciones_rollups(documentos).items())
+        for coleccion, operaciones in derivadas:
+            try:
+                await self.db[coleccion].bulk_write(operaciones, ordered=False)
+            except Exception as e:
+                # Las medidas ya quedaron guardadas; las colecciones derivadas se pueden reconstruir
+                log_error(e, f"ingesta_async.persistir.{coleccion}")
+        try:
+            await self.db[COLECCION_CONTADORES].update_one({"_id": ID_MEDIDAS}, incremento_medidas(documentos))
+        except Exception as e:
+            log_error(e, "ingesta_async.persistir.contadores")
+        if EVENTOS_DIFUSION == "mongo":
+            try:
+                await self.db[COLECCION_DIFUSION].insert_many(documentos_difusion(documentos, nombres))
+            except Exception as e:
+                log_error(e, "ingesta_async.persistir.difusion")
+
+    async def reclamar_lote(self, lote, medidas):
+        """Versión asíncrona de lotes.reclamar_lote."""
+        try:
+            await self.db[COLECCION_LOTES].insert_one(documento_lote(lote, medidas))
+        except DuplicateKeyError:
+            if await self.db[COLECCION_LOTES].find_one_and_update(
+                    filtro_reutilizado(lote), {"$set": documento_lote(lote, medidas)}):
+                lote_reutilizado(lote)
+                return True
+            lote_duplicado(lote)
+            return False
+        lote_nuevo(lote)
+        return True
+
+    async def liberar_lote(self, lote):
+        """Versión asíncrona de lotes.liberar_lote."""
+        olvidar_lote(lote)
+        try:
+            await self.db[COLECCION_LOTES].delete_one(filtro_lote(lote))
+        except Exception as e:
+            log_error(e, "ingesta_async.liberar_lote")
+
+    async def guardar(self, cuerpo, tipo_contenido=None):
+        """Procesa un POST /guardar. Retorna (status, cuerpo de respuesta, cabeceras extra)."""
+        if self.db is None:
+            return 503, {"error": "Conexión a la base de datos no disponible"}, []
+        formato = formato_binario(tipo_contenido)
+        if formato is not None and not formato_disponible(formato):
+            return 415, {"error": f"Formato {formato} no disponible: instale el paquete {PAQUETES[formato]}"}, []
+        try:
+            if formato is None:
+                data = json.loads(cuerpo) if cuerpo else None
+            else:
+                data = decodificar(formato, cuerpo)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict) or ("measures" not in data and "l" not in data):
+            self.contadores["rechazadas"] += 1
+            return 400, {"error": "El cuerpo debe contener 'measures' o 'l'"}, []
+        lote, error = clave_lote(data, cuerpo)
+        if error:
+            self.contadores["rechazadas"] += 1
+            return 400, {"error": error}, []
+        if lote is not None and lote_reciente(lote):
+            return 200, RESPUESTA_DUPLICADO, []
+        catalogo = await self.catalogo()
+        nombres = catalogo["por_id"]
+        if "measures" in data:
+            documentos, error = preparar_medidas(data["measures"], catalogo["por_nombre"])
+        else:
+            documentos, error = preparar_medidas_compactas(data, catalogo["tipos_por_id"])
+        if error:
+            self.contadores["rechazadas"] += 1
+            return 400, {"error": error}, []
+        if documentos:
+            self.contadores["esperando"] += 1
+            try:
+                await asyncio.wait_for(self.semaforo.acquire(), INGESTA_ESPERA_S)
+            except asyncio.TimeoutError:
+                self.contadores["sobrecarga"] += 1
+                return 503, {"error": "Demasiadas escrituras en curso, reintente más tarde"}, [(b"retry-after", b"1")]
+            finally:
+                self.contadores["esperando"] -= 1
+            self.contadores["en_vuelo"] += 1
+            try:
+                if lote is not None and not await self.reclamar_lote(lote, len(documentos)):
+                    return 200, RESPUESTA_DUPLICADO, []
+                try:
+                    await self.persistir(documentos, nombres)
+                except Exception:
+                    if lote is not None:
+                        await self.liberar_lote(lote)
+                    raise
+            finally:
+                self.contadores["en_vuelo"] -= 1
+                self.semaforo.release()
+            self.contadores["medidas"] += len(documentos)
+        return 200, {"status": "ok", "mensaje": "Medidas procesadas correctamente"}, []
+
+    def estado(self):
+        return {
+            "estado": "conectado" if self.db is not None else "desconectado",
+            "almacenamiento": almacen.modo,
+            "escrituras_max": INGESTA_ESCRITURAS_MAX,
+            **self.contadores,
+            "lotes": estadisticas_lotes(),
+        }
+
+
+servicio = ServicioIngesta()
+
+
+async def _leer_cuerpo(receive):
+    """Lee el cuerpo completo. Retorna None si supera INGESTA_MAX_BYTES o el cliente se desconecta."""
+    partes = []
+    total = 0
+    while True:
+        mensaje = await receive()
+        if mensaje["type"] == "http.disconnect":
+            return None
+        parte = mensaje.get("body", b"")
+        total += len(parte)
+        if total > INGESTA_MAX_BYTES:
+            return None
+        partes.append(parte)
+        if not mensaje.get("more_body"):
+            return b"".join(partes)
+
+
+async def _responder(send, status, datos, cabeceras=(), tipo=b"application/json"):
+    cuerpo = datos if isinstance(datos, bytes) else json.dumps(datos).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", tipo), (b"content-length", str(len(cuerpo)).encode())] + list(cabeceras),
+    })
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+async def _ciclo_de_vida(receive, send):
+    while True:
+        mensaje = await receive()
+        if mensaje["type"] == "lifespan.startup":
+            await servicio.iniciar()
+            await send({"type": "lifespan.startup.complete"})
+        elif mensaje["type"] == "lifespan.shutdown":
+            await servicio.cerrar()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def _guardar(scope, receive):
+    cuerpo = await _leer_cuerpo(receive)
+    if cuerpo is None:
+        return 413, {"error": f"Cuerpo mayor que {INGESTA_MAX_BYTES} bytes"}, []
+    try:
+        tipo_contenido = dict(scope["headers"]).get(b"content-type", b"").decode("latin-1")
+        return await servicio.guardar(cuerpo, tipo_contenido)
+    except Exception as e:
+        servicio.contadores["errores"] += 1
+        log_error(e, "ingesta_async.guardar")
+        return 500, {"error": str(e)}, []
+
+
+async def app(scope, receive, send):
+    """Aplicación ASGI del servicio de ingesta."""
+    if scope["type"] == "lifespan":
+        await _ciclo_de_vida(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    ruta, metodo = scope["path"], scope["method"]
+    if ruta == "/guardar" and metodo == "POST":
+        servicio.contadores["peticiones"] += 1
+        inicio = time.perf_counter()
+        HTTP_EN_CURSO.inc("ingesta_async", ruta)
+        try:
+            status, datos, cabeceras = await _guardar(scope, receive)
+        finally:
+            HTTP_EN_CURSO.dec("ingesta_async", ruta)
+        HTTP_PETICIONES.inc("ingesta_async", ruta, metodo, str(status))
+        HTTP_DURACION.observar(time.perf_counter() - inicio, "ingesta_async", ruta, metodo)
+        await _responder(send, status, datos, cabeceras)
+    elif ruta == "/estado" and metodo == "GET":
+        await _responder(send, 200, servicio.estado())
+    elif ruta == "/metrics" and metodo == "GET" and METRICAS:
+        await _responder(send, 200, exponer().encode("utf-8"), tipo=TIPO_CONTENIDO.encode())
+    else:
+        await _responder(send, 404, {"error": "Ruta no encontrada"})
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        "ingesta_async:app",
+        host=os.getenv("BIND_HOST", "0.0.0.0"),
+        port=INGESTA_PORT,
+        workers=int(os.getenv("INGESTA_WORKERS", "1")),
+        log_level="warning",
+    )
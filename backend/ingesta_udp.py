@@ -0,0 +1,220 @@
+"""
+Ingesta por UDP con protocolo de líneas
+Receptor independiente para gateways que solo pueden enviar datagramas sin
+esperar respuesta. Cada datagrama trae una o más líneas:
+
+    <sensor>,<campo>=<valor>[,<campo>=<valor>...] [timestamp]
+
+    Sensor1,temperatura=25.3,humedad=61 1718000000
+    Sensor2,riego=true
+
+El timestamp es opcional, en segundos Unix (UTC, admite decimales); sin él se
+usa la hora de llegada del datagrama. Una línea con timestamp más de
+INGESTA_FUTURO_MAX_S segundos en el futuro (reloj del gateway adelantado) se
+descarta. Los nombres de sensor y campo no pueden
+contener espacios, comas ni "=".
+
+Valida con el mismo catálogo y las mismas reglas de tipo que POST /guardar,
+pero línea a línea: una lectura inválida o de un sensor/campo desconocido se
+descarta sin afectar al resto del datagrama. Las lecturas válidas se acumulan
+en un BufferMedidas y se escriben en lotes con ingesta.persistir_medidas. Uso:
+
+    python ingesta_udp.py
+"""
+
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from database import al_conectar, inicializar_base_datos, log_error
+from catalogo import obtener_mapa_sensores
+from buffer_medidas import BufferMedidas
+from ingesta import validar_valor_por_tipo, persistir_medidas, limite_futuro
+from indices import configurar_base_datos
+from metricas import INGESTA_ACEPTADAS, INGESTA_RECHAZADAS, INGESTA_CAMPOS_DESCONOCIDOS
+
+UDP_HOST = os.getenv("UDP_HOST", "0.0.0.0")
+UDP_PORT = int(os.getenv("UDP_PORT", "8862"))
+# Búfer de recepción del socket: absorbe ráfagas mientras el hilo principal procesa
+UDP_RCVBUF = int(os.getenv("UDP_RCVBUF", str(4 * 1024 * 1024)))
+UDP_LOTE = int(os.getenv("UDP_LOTE", "5000"))
+UDP_INTERVALO_MS = int(os.getenv("UDP_INTERVALO_MS", "200"))
+UDP_CAPACIDAD = int(os.getenv("UDP_CAPACIDAD", "200000"))
+# Cada cuántos segundos se imprimen los contadores (0 = nunca)
+UDP_ESTADISTICAS_S = int(os.getenv("UDP_ESTADISTICAS_S", "60"))
+
+TAM_DATAGRAMA = 65535
+
+
+class ReceptorUDP:
+    """Convierte datagramas en documentos de medidas y los entrega al buffer.
+
+    Contadores de paquetes: aceptados (al menos una lectura válida), rechazados
+    (ninguna lectura válida) y descartados (sin catálogo o con el buffer lleno).
+    Las lecturas se cuentan aparte: aceptadas, rechazadas (formato o valor
+    inválido) y desconocidas (sensor o campo inexistente o inactivo).
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self._mapa = None
+        self._claves = {}
+        self.contadores = {
+            "paquetes": 0,
+            "paquetes_aceptados": 0,
+            "paquetes_rechazados": 0,
+            "paquetes_descartados": 0,
+            "lecturas_aceptadas": 0,
+            "lecturas_rechazadas": 0,
+            "lecturas_desconocidas": 0,
+        }
+
+    def _clave(self, mapa, sensor, campo):
+        """(sensor_id, campo_id, tipo) de un par de nombres, o None si no existe.
+
+        Se memoriza por copia del catálogo: cada par se busca una vez hasta que
+        el catálogo se recarga.
+        """
+        if mapa is not self._mapa:
+            self._mapa = mapa
+            self._claves = {}
+        par = (sensor, campo)
+        if par not in self._claves:
+            sensor_info = mapa.get(sensor)
+            campo_info = sensor_info["campos"].get(campo) if sensor_info else None
+            self._claves[par] = (sensor_info["id"], campo_info["id"], campo_info["tipo"]) if campo_info else None
+        return self._claves[par]
+
+    def procesar(self, datos, mapa):
+        """Retorna los documentos de medidas válidos de un datagrama."""
+        documentos = []
+        ahora = datetime.utcnow()
+        limite = limite_futuro()
+        rechazadas = invalidas = desconocidas = futuras = 0
+        for linea in datos.decode("utf-8", "replace").splitlines():
+            linea = linea.strip()
+            if not linea or linea[0] == "#":
+                continue
+            cuerpo, _, marca = linea.partition(" ")
+            sensor, _, pares = cuerpo.partition(",")
+            try:
+                timestamp = datetime.fromtimestamp(float(marca), timezone.utc).replace(tzinfo=None) if marca else ahora
+            except (ValueError, OverflowError, OSError):
+                rechazadas += 1
+                continue
+            if timestamp > limite:
+                # Reloj del gateway adelantado: fijaría la última lectura en el futuro
+                futuras += 1
+                continue
+            if not pares:
+                rechazadas += 1
+                continue
+            for par in pares.split(","):
+                campo, igual, texto = par.partition("=")
+                if not igual:
+                    rechazadas += 1
+                    continue
+                clave = self._clave(mapa, sensor, campo)
+                if clave is None:
+                    desconocidas += 1
+                    continue
+                if len(texto) > 1 and texto[0] == texto[-1] == '"':
+                    texto = texto[1:-1]
+                valor, error = validar_valor_por_tipo(texto, clave[2], campo)
+                if error:
+                    invalidas += 1
+                    continue
+                documentos.append({
+                    "sensor_id": clave[0],
+                    "campo_id": clave[1],
+                    "valor": valor,
+                    "timestamp": timestamp,
+                })
+        self.contadores["lecturas_rechazadas"] += rechazadas + invalidas + futuras
+        self.contadores["lecturas_desconocidas"] += desconocidas
+        # Métricas del proceso: un incremento por datagrama, no por lectura
+        if rechazadas:
+            INGESTA_RECHAZADAS.inc("formato", n=rechazadas)
+        if invalidas:
+            INGESTA_RECHAZADAS.inc("tipo", n=invalidas)
+        if futuras:
+            INGESTA_RECHAZADAS.inc("timestamp", n=futuras)
+        if desconocidas:
+            INGESTA_CAMPOS_DESCONOCIDOS.inc(n=desconocidas)
+        if documentos:
+            INGESTA_ACEPTADAS.inc(n=len(documentos))
+        return documentos
+
+    def recibir(self, datos):
+        """Procesa un datagrama y encola sus lecturas válidas."""
+        self.contadores["paquetes"] += 1
+        mapa = obtener_mapa_sensores()
+        if mapa is None:
+            self.contadores["paquetes_descartados"] += 1
+            return
+        documentos = self.procesar(datos, mapa)
+        if not documentos:
+            self.contadores["paquetes_rechazados"] += 1
+        elif not self.buffer.encolar(documentos):
+            self.contadores["paquetes_descartados"] += 1
+        else:
+            self.contadores["paquetes_aceptados"] += 1
+            self.contadores["lecturas_aceptadas"] += len(documentos)
+
+    def estadisticas(self):
+        return dict(self.contadores, buffer=self.buffer.estadisticas())
+
+
+def _informar(receptor):
+    while True:
+        time.sleep(UDP_ESTADISTICAS_S)
+        print(f"[INFO] ingesta_udp {receptor.estadisticas()}")
+
+
+def escuchar(receptor, host=UDP_HOST, puerto=UDP_PORT):
+    """Bucle principal: recibe datagramas hasta que el proceso se detiene."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RCVBUF)
+    sock.bind((host, puerto))
+    print(f"[INFO] Receptor UDP escuchando en {host}:{puerto} (lote={UDP_LOTE}, capacidad={UDP_CAPACIDAD})")
+    while True:
+        datos, _ = sock.recvfrom(TAM_DATAGRAMA)
+        try:
+            receptor.recibir(datos)
+        except Exception as e:
+            receptor.contadores["paquetes_descartados"] += 1
+            log_error(e, "ingesta_udp.recibir")
+
+
+def main():
+    # Colecciones e índices como en el servidor Flask, antes de la primera escritura
+    al_conectar(configurar_base_datos)
+    inicializar_base_datos()
+    buffer = BufferMedidas(
+        persistir_medidas,
+        tam_lote=UDP_LOTE,
+        intervalo=UDP_INTERVALO_MS / 1000.0,
+        capacidad=UDP_CAPACIDAD,
+    )
+    receptor = ReceptorUDP(buffer)
+    if UDP_ESTADISTICAS_S > 0:
+        threading.Thread(target=_informar, args=(receptor,), name="estadisticas-udp", daemon=True).start()
+    # SIGTERM (systemd, docker stop) termina igual que Ctrl+C: escribiendo lo pendiente
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        escuchar(receptor)
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        print("[INFO] Deteniendo receptor UDP, escribiendo lecturas pendientes...")
+        buffer.vaciar()
+        print(f"[INFO] ingesta_udp {receptor.estadisticas()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
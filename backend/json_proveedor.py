@@ -0,0 +1,65 @@
+"""
+Serialización JSON de la API
+Proveedor JSON de Flask que convierte ObjectId y datetime en una sola pasada,
+en lugar de serializar, volver a leer y reserializar cada respuesta.
+
+Las fechas salen en ISO 8601, como ya las entregaban /medidas y /sensores.
+/dispositivos (created_at, updated_at) y /votaciones (fecha) las entregaban en
+RFC 822, el formato por defecto de Flask; esos endpoints las formatean con
+fechas_http para no cambiar su contrato.
+"""
+
+import os
+from datetime import date, datetime
+
+from bson import ObjectId
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: solo acelera la serialización
+    orjson = None
+
+
+def _convertir(o):
+    """Convierte los tipos de MongoDB/Python que JSON no soporta directamente."""
+    if isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    return DefaultJSONProvider.default(o)
+
+
+def fechas_http(documento, *campos):
+    """Formatea en RFC 822 ("Mon, 01 Jan 2024 12:00:00 GMT") los campos de fecha indicados."""
+    for campo in campos:
+        if isinstance(documento.get(campo), (datetime, date)):
+            documento[campo] = http_date(documento[campo])
+    return documento
+
+
+class ProveedorJSON(DefaultJSONProvider):
+    """Proveedor estándar: ObjectId -> str y fechas -> ISO 8601."""
+
+    default = staticmethod(_convertir)
+
+
+class ProveedorOrjson(ProveedorJSON):
+    """Proveedor basado en orjson (mucho más rápido para respuestas grandes)."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_convertir, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def crear_proveedor(app):
+    """Crea el proveedor según JSON_BACKEND (json u orjson)."""
+    backend = os.getenv("JSON_BACKEND", "json")
+    if backend == "orjson":
+        if orjson is not None:
+            return ProveedorOrjson(app)
+        print("[WARN] JSON_BACKEND=orjson pero orjson no esta instalado; usando json estandar")
+    return ProveedorJSON(app)
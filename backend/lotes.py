@@ -0,0 +1,201 @@
+"""
+Lotes ingeridos (ingesta idempotente)
+Los dispositivos con enlaces inestables reintentan POST /guardar cuando no
+reciben respuesta, y cada reintento guardaba el lote completo otra vez con un
+timestamp nuevo. Un dispositivo puede enviar un id de lote o número de
+secuencia en el cuerpo ("lote", opcionalmente con "origen" = nombre del
+dispositivo) en cualquiera de los formatos de /guardar:
+
+    {"lote": 1532, "origen": "finca-norte-1", "measures": {...}}
+    {"lote": "a7f3c2", "t": 1718000000, "l": [...]}
+
+Un lote ya recibido se responde 200 con "duplicado": true sin escribir nada.
+Solo es un reintento si además trae el mismo cuerpo (se guarda su huella
+SHA-1): un dispositivo que reinicia su numeración tras un reinicio vuelve a
+enviar "lote": 1 con otras lecturas, y ese envío reemplaza el registro
+anterior y se guarda en lugar de descartarse como duplicado.
+La detección tiene dos niveles:
+
+- una LRU en memoria de los últimos LOTES_LRU_MAX lotes del proceso, que
+  resuelve los reintentos sin consultar MongoDB ni validar el cuerpo;
+- la colección "lotes_ingeridos" con un índice único (origen, lote), que
+  cubre los reintentos que llegan a otro worker o tras un reinicio. Cada
+  lote se registra antes de escribir sus medidas y se libera si la escritura
+  falla, para que el reintento pueda guardarlo. Un índice TTL borra los
+  registros tras LOTES_TTL_S segundos.
+
+Sin "origen", el lote se identifica por los sensores que trae (un
+dispositivo envía siempre los mismos), de modo que dos dispositivos que
+numeran sus lotes desde 1 no se pisan.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from pymongo.errors import DuplicateKeyError
+
+from database import get_db, log_error
+from metricas import INGESTA_LOTES_DUPLICADOS
+
+COLECCION = "lotes_ingeridos"
+
+# Lotes recordados en memoria por proceso (0 desactiva la LRU; queda la colección)
+LOTES_LRU_MAX = int(os.getenv("LOTES_LRU_MAX", "10000"))
+# Segundos que se conserva el registro de un lote en MongoDB (0 = sin expiración)
+LOTES_TTL_S = int(os.getenv("LOTES_TTL_S", str(7 * 24 * 3600)))
+LOTE_MAX_CARACTERES = 128
+
+RESPUESTA_DUPLICADO = {"status": "ok", "mensaje": "Lote ya recibido", "duplicado": True}
+
+_lock = threading.Lock()
+_recientes = OrderedDict()
+_contadores = {"nuevos": 0, "reutilizados": 0, "duplicados_memoria": 0, "duplicados_base": 0}
+
+
+def indices_lotes():
+    """Índices de la colección de lotes (declarados en indices.py)."""
+    indices = [([("origen", 1), ("lote", 1)], {"unique": True})]
+    if LOTES_TTL_S > 0:
+        indices.append(([("recibido", 1)], {"expireAfterSeconds": LOTES_TTL_S}))
+    return indices
+
+
+def _origen_por_sensores(data):
+    if "measures" in data:
+        sensores = data["measures"].keys() if isinstance(data["measures"], dict) else []
+    else:
+        sensores = [lote.get("s") for lote in data.get("l") or [] if isinstance(lote, dict)]
+    # Ids binarios (12 bytes) y texto hex se normalizan al mismo valor
+    nombres = sorted(s.hex() if isinstance(s, (bytes, bytearray)) else str(s).lower() for s in sensores)
+    return "sensores:" + hashlib.sha1(",".join(nombres).encode("utf-8")).hexdigest()[:20]
+
+
+def clave_lote(data, cuerpo):
+    """(origen, lote, huella) del cuerpo de /guardar, o None si no trae "lote".
+
+    Args:
+        data: Cuerpo decodificado
+        cuerpo: Cuerpo en bytes tal como llegó (su SHA-1 es la huella)
+
+    Returns:
+        tuple: (clave, mensaje_error)
+    """
+    lote = data.get("lote")
+    if lote is None:
+        return None, None
+    if isinstance(lote, bool) or not isinstance(lote, (str, int)) or \
+            (isinstance(lote, str) and not 0 < len(lote) <= LOTE_MAX_CARACTERES):
+        return None, f"'lote' debe ser un entero o un texto de hasta {LOTE_MAX_CARACTERES} caracteres"
+    origen = data.get("origen")
+    if origen is None:
+        origen = _origen_por_sensores(data)
+    elif not isinstance(origen, str) or not 0 < len(origen) <= LOTE_MAX_CARACTERES:
+        return None, f"'origen' debe ser un texto de hasta {LOTE_MAX_CARACTERES} caracteres"
+    return (origen, lote, hashlib.sha1(cuerpo).hexdigest()[:20]), None
+
+
+def lote_reciente(clave):
+    """True si el lote ya pasó por este proceso (LRU en memoria)."""
+    with _lock:
+        if clave not in _recientes:
+            return False
+        _recientes.move_to_end(clave)
+        _contadores["duplicados_memoria"] += 1
+    INGESTA_LOTES_DUPLICADOS.inc("memoria")
+    return True
+
+
+def recordar_lote(clave):
+    if LOTES_LRU_MAX <= 0:
+        return
+    with _lock:
+        _recientes[clave] = True
+        _recientes.move_to_end(clave)
+        while len(_recientes) > LOTES_LRU_MAX:
+            _recientes.popitem(last=False)
+
+
+def olvidar_lote(clave):
+    with _lock:
+        _recientes.pop(clave, None)
+
+
+def filtro_lote(clave):
+    """Registro de este lote con este mismo cuerpo."""
+    origen, lote, huella = clave
+    return {"origen": origen, "lote": lote, "huella": huella}
+
+
+def filtro_reutilizado(clave):
+    """Registro del mismo (origen, lote) con otro cuerpo: la numeración se reinició."""
+    origen, lote, huella = clave
+    return {"origen": origen, "lote": lote, "huella": {"$ne": huella}}
+
+
+def documento_lote(clave, medidas):
+    return {**filtro_lote(clave), "medidas": medidas, "recibido": datetime.utcnow()}
+
+
+def lote_nuevo(clave):
+    """Cuenta un lote registrado por primera vez y lo recuerda en memoria."""
+    recordar_lote(clave)
+    with _lock:
+        _contadores["nuevos"] += 1
+
+
+def lote_reutilizado(clave):
+    """Cuenta un lote cuyo número ya estaba registrado con otro cuerpo."""
+    recordar_lote(clave)
+    with _lock:
+        _contadores["reutilizados"] += 1
+
+
+def lote_duplicado(clave):
+    """Cuenta un lote rechazado por el índice único y lo recuerda en memoria."""
+    recordar_lote(clave)
+    with _lock:
+        _contadores["duplicados_base"] += 1
+    INGESTA_LOTES_DUPLICADOS.inc("base")
+
+
+def reclamar_lote(clave, medidas):
+    """Registra el lote antes de escribir sus medidas.
+
+    Returns:
+        bool: False si otro envío del mismo lote ya lo registró (duplicado).
+    """
+    coleccion = get_db()[COLECCION]
+    try:
+        coleccion.insert_one(documento_lote(clave, medidas))
+    except DuplicateKeyError:
+        # El mismo número con otro cuerpo no es un reintento: se toma el registro
+        if coleccion.find_one_and_update(filtro_reutilizado(clave), {"$set": documento_lote(clave, medidas)}):
+            lote_reutilizado(clave)
+            return True
+        lote_duplicado(clave)
+        return False
+    lote_nuevo(clave)
+    return True
+
+
+def liberar_lote(clave):
+    """Deshace reclamar_lote cuando las medidas no se pudieron escribir, para aceptar el reintento."""
+    olvidar_lote(clave)
+    db = get_db()
+    if db is None:
+        return
+    try:
+        # Solo el registro propio: si otro cuerpo ya lo reemplazó, se conserva
+        db[COLECCION].delete_one(filtro_lote(clave))
+    except Exception as e:
+        # El reintento se tomará como duplicado hasta que expire el registro
+        log_error(e, "liberar_lote")
+
+
+def estadisticas_lotes():
+    """Lotes en la LRU del proceso y contadores de lotes nuevos y duplicados."""
+    with _lock:
+        return {"en_memoria": len(_recientes), "lru_max": LOTES_LRU_MAX, **_contadores}
@@ -0,0 +1,232 @@
+"""
+Tareas de mantenimiento de la base de datos
+Se ejecutan desde la línea de comandos, por ejemplo:
+
+    python mantenimiento.py ultimas
+    python mantenimiento.py rollups --desde 2024-01-01
+    python mantenimiento.py migrar-almacenamiento --destino buckets
+    python mantenimiento.py contadores
+    python mantenimiento.py votaciones
+    python mantenimiento.py retencion --dias 180
+    python mantenimiento.py leer-archivo --sensor <id> --desde 2023-01-01 --hasta 2023-02-01
+    python mantenimiento.py auditar [--json]
+    python mantenimiento.py indices [--aplicar] [--estricto]
+"""
+
+import argparse
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+
+from database import get_db, inicializar_base_datos
+from versiones import marcar_cambio
+
+
+def comando_ultimas(args):
+    """Reconstruye la colección de últimos valores a partir de las medidas."""
+    from ultimas_medidas import reconstruir_ultimas
+    escritos = reconstruir_ultimas()
+    print(f"[OK] ultimas_medidas reconstruida: {escritos} pares sensor/campo")
+    # Los servidores en marcha invalidan sus ETag (ver versiones.py)
+    marcar_cambio("medidas")
+
+
+def comando_rollups(args):
+    """Recalcula los agregados por minuto, hora y día a partir de las medidas."""
+    from rollups import reconstruir_rollups
+    desde = datetime.fromisoformat(args.desde) if args.desde else None
+    hasta = datetime.fromisoformat(args.hasta) if args.hasta else None
+    resultado = reconstruir_rollups(desde, hasta)
+    for resolucion, escritos in resultado.items():
+        print(f"[OK] agregados por {resolucion}: {escritos} documentos")
+    marcar_cambio("medidas")
+
+
+def comando_contadores(args):
+    """Recalcula los contadores de /estado (total de medidas y última lectura)."""
+    from contadores import reconciliar
+    doc = reconciliar()
+    ultima = doc["ultima"].isoformat() if doc["ultima"] else "-"
+    print(f"[OK] contadores reconciliados: {doc['total']} medidas, ultima {ultima}")
+
+
+def comando_votaciones(args):
+    """Reconstruye el documento de estadísticas de votaciones."""
+    from estadisticas_votaciones import reconstruir_estadisticas
+    estadisticas = reconstruir_estadisticas()
+    print(f"[OK] estadisticas de votaciones reconstruidas: {estadisticas['total']} votos, "
+          f"{len(estadisticas['por_cultivo'])} cultivos")
+    marcar_cambio("votaciones")
+
+
+def comando_retencion(args):
+    """Archiva y borra de MongoDB las lecturas crudas más antiguas que --dias."""
+    from retencion import aplicar_retencion
+    resultado = aplicar_retencion(args.dias, args.compresion, args.simular)
+    prefijo = "[SIMULACION] " if args.simular else "[OK] "
+    print(f"{prefijo}lecturas anteriores a {resultado['corte'].isoformat()}: "
+          f"{resultado['archivadas']} archivadas, {resultado['borradas']} borradas "
+          f"({resultado['sensores']} sensores)")
+    if not args.simular:
+        marcar_cambio("medidas")
+
+
+def comando_leer_archivo(args):
+    """Escribe en la salida estándar, como NDJSON, las lecturas archivadas de un sensor."""
+    import json
+    from retencion import leer_archivo
+    for medida in leer_archivo(args.sensor, datetime.fromisoformat(args.desde), datetime.fromisoformat(args.hasta),
+                               args.campo):
+        print(json.dumps(medida, default=str))
+
+
+def comando_migrar_almacenamiento(args):
+    """Copia las medidas de un modo de almacenamiento a otro, en orden cronológico.
+
+    La colección de origen no se modifica. Cada lote escrito informa el
+    argumento --reanudar (timestamp y _id de su última medida): una migración
+    interrumpida sigue estrictamente después de esa medida, sin copiar dos
+    veces las del mismo instante.
+    """
+    from almacen_medidas import crear_almacen
+    origen = crear_almacen(args.origen)
+    destino = crear_almacen(args.destino)
+    if origen.modo == destino.modo:
+        print("[ERROR] El origen y el destino son el mismo modo")
+        return
+
+    destino.configurar(get_db())
+    filtro = {"timestamp": {"$gte": datetime.fromisoformat(args.desde)}} if args.desde else {}
+    despues_de = None
+    if args.reanudar:
+        timestamp, id_medida = args.reanudar.rsplit(",", 1)
+        # En modo buckets el _id de cada lectura es un texto sintético
+        despues_de = (datetime.fromisoformat(timestamp),
+                      id_medida if origen.modo == "buckets" else ObjectId(id_medida))
+    cursor = origen.coleccion().aggregate(origen.etapas_consulta(filtro, orden=1, despues_de=despues_de),
+                                          allowDiskUse=True)
+
+    copiadas = 0
+    lote = []
+    ultima = None
+    for medida in cursor:
+        lote.append({
+            "sensor_id": medida["sensor_id"],
+            "campo_id": medida["campo_id"],
+            "valor": medida["valor"],
+            "timestamp": medida["timestamp"],
+        })
+        ultima = medida
+        if len(lote) >= args.lote:
+            destino.insertar(lote)
+            copiadas += len(lote)
+            print(f"[INFO] {copiadas} medidas copiadas "
+                  f"(para reanudar: --reanudar {ultima['timestamp'].isoformat()},{ultima['_id']})")
+            lote = []
+    if lote:
+        destino.insertar(lote)
+        copiadas += len(lote)
+    print(f"[OK] Migracion {origen.modo} -> {destino.modo} completa: {copiadas} medidas")
+    print(f"[INFO] Configure MEDIDAS_ALMACENAMIENTO={destino.modo} y reinicie el servidor")
+
+
+def comando_auditar(args):
+    """Ejecuta explain() sobre las consultas de la API y reporta planes sin índice e índices sin uso."""
+    import json
+    from indices import auditar_consultas
+    reporte = auditar_consultas(get_db())
+    if args.json:
+        print(json.dumps(reporte, default=str, indent=2, ensure_ascii=False))
+        return
+    for r in reporte["consultas"]:
+        if "error" in r:
+            print(f"[ERROR] {r['consulta']}: {r['error']}")
+            continue
+        prefijo = "[OK]  " if not r["problemas"] else ("[INFO]" if r["gravedad"] == "baja" else "[WARN]")
+        print(f"{prefijo} {r['consulta']} ({r['coleccion']}, {r['documentos']} docs): {r['plan']}"
+              f" | claves {r['claves_examinadas']}, docs {r['documentos_examinados']}, devueltos {r['devueltos']}"
+              f", {r['ms']} ms")
+        for problema in r["problemas"]:
+            print(f"         problema: {problema}")
+        for sugerencia in r["sugerencias"]:
+            print(f"         sugerencia: {sugerencia}")
+    for indice in reporte["indices_sin_uso"]:
+        print(f"[INFO] indice sin uso desde {indice['desde']}: {indice['coleccion']}.{indice['indice']}")
+
+
+def comando_indices(args):
+    """Compara los índices existentes con los declarados en indices.py y, con --aplicar, los migra."""
+    from indices import migrar_indices
+    planes = migrar_indices(get_db(), aplicar=args.aplicar, estricto=args.estricto)
+    prefijo = "[OK] " if args.aplicar else "[SIMULACION] "
+    for coleccion, plan in planes.items():
+        for claves, opciones in plan["crear"]:
+            print(f"{prefijo}{coleccion}: crear {claves} {opciones or ''}")
+        for nombre, claves, motivo in plan["eliminar"]:
+            print(f"{prefijo}{coleccion}: eliminar {nombre} {list(claves)} ({motivo})")
+        for nombre, claves in plan["no_declarados"]:
+            print(f"[INFO] {coleccion}: {nombre} {list(claves)} no declarado (se conserva)")
+    if not any(plan["crear"] or plan["eliminar"] for plan in planes.values()):
+        print("[OK] Los indices coinciden con los declarados")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tareas de mantenimiento de SembrandoBits")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    sub = subparsers.add_parser("ultimas", help="Reconstruir la colección ultimas_medidas")
+    sub.set_defaults(funcion=comando_ultimas)
+
+    sub = subparsers.add_parser("rollups", help="Reconstruir los agregados por minuto/hora/día")
+    sub.add_argument("--desde", help="Fecha ISO desde la que recalcular (se redondea al día)")
+    sub.add_argument("--hasta", help="Fecha ISO hasta la que recalcular (se redondea al día siguiente)")
+    sub.set_defaults(funcion=comando_rollups)
+
+    sub = subparsers.add_parser("contadores", help="Recalcular los contadores de /estado")
+    sub.set_defaults(funcion=comando_contadores)
+
+    sub = subparsers.add_parser("votaciones", help="Reconstruir las estadísticas de votaciones")
+    sub.set_defaults(funcion=comando_votaciones)
+
+    sub = subparsers.add_parser("retencion", help="Archivar y borrar las lecturas crudas antiguas")
+    sub.add_argument("--dias", type=int, help="Días a conservar en MongoDB (por defecto RETENCION_DIAS)")
+    sub.add_argument("--compresion", default=None, choices=["gzip", "zstd"],
+                     help="Compresión de los archivos (por defecto ARCHIVO_COMPRESION)")
+    sub.add_argument("--simular", action="store_true", help="Solo contar lo que se archivaría")
+    sub.set_defaults(funcion=comando_retencion)
+
+    sub = subparsers.add_parser("leer-archivo", help="Leer lecturas archivadas de un sensor")
+    sub.add_argument("--sensor", required=True, help="sensor_id")
+    sub.add_argument("--campo", help="campo_id (opcional)")
+    sub.add_argument("--desde", required=True, help="Fecha ISO (UTC)")
+    sub.add_argument("--hasta", required=True, help="Fecha ISO (UTC), inclusiva")
+    sub.set_defaults(funcion=comando_leer_archivo)
+
+    sub = subparsers.add_parser("migrar-almacenamiento", help="Copiar las medidas a otro modo de almacenamiento")
+    sub.add_argument("--origen", default="documentos", choices=["documentos", "timeseries", "buckets"])
+    sub.add_argument("--destino", required=True, choices=["documentos", "timeseries", "buckets"])
+    sub.add_argument("--desde", help="Timestamp ISO desde el que copiar")
+    sub.add_argument("--reanudar", help="'<timestamp ISO>,<_id>' de la última medida copiada (lo informa cada lote)")
+    sub.add_argument("--lote", type=int, default=5000, help="Medidas por escritura")
+    sub.set_defaults(funcion=comando_migrar_almacenamiento)
+
+    sub = subparsers.add_parser("auditar", help="Revisar los planes de consulta de la API con explain()")
+    sub.add_argument("--json", action="store_true", help="Reporte completo en JSON")
+    sub.set_defaults(funcion=comando_auditar)
+
+    sub = subparsers.add_parser("indices", help="Crear los índices faltantes y eliminar los redundantes")
+    sub.add_argument("--aplicar", action="store_true", help="Aplicar los cambios (por defecto solo se muestran)")
+    sub.add_argument("--estricto", action="store_true", help="Eliminar también los índices no declarados que no son únicos")
+    sub.set_defaults(funcion=comando_indices)
+
+    args = parser.parse_args(argv)
+    if not inicializar_base_datos():
+        print("[ERROR] No hay conexion a la base de datos")
+        return 1
+    args.funcion(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
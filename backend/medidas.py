@@ -1,147 +1,168 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context, current_app
 from bson import ObjectId
-from datetime import datetime
+from bson.errors import InvalidId
+import base64
+import json
+import os
+from datetime import datetime, timedelta, timezone
 
 # Importar desde database en lugar de servidor (EVITA CIRCULAR IMPORT)
 from database import get_medidas_collection, get_sensores_collection, get_db, log_error
+from catalogo import obtener_mapa_sensores, obtener_indice_por_id, obtener_tipos_por_id, estadisticas_catalogo
+from buffer_medidas import crear_buffer_desde_entorno
+from ultimas_medidas import obtener_ultimas
+from almacen_medidas import almacen
+from exportacion import FORMATOS, GENERADORES, formato_disponible
+from rollups import elegir_resolucion, obtener_serie, RESOLUCIONES
+from versiones import condicional, estadisticas_versiones, etiqueta
+from compatibilidad import recomendaciones, IDS_CULTIVOS
+from retencion import leer_archivo
+from contadores import obtener_contadores
+from ingesta import (
+    validar_valor_por_tipo, preparar_medidas, persistir_medidas, preparar_medidas_compactas,
+    formato_binario, decodificar, PAQUETES, formato_disponible as formato_disponible_ingesta
+)
+from lotes import clave_lote, lote_reciente, reclamar_lote, liberar_lote, estadisticas_lotes, RESPUESTA_DUPLICADO
+from eventos import centro_eventos, seguidor_difusion, TEMA_TODAS, tema_sensor, tema_dispositivo, EVENTOS_LATIDO_S
 
-def validar_valor_por_tipo(valor, tipo_campo, nombre_campo):
-    """
-    Valida y convierte un valor según el tipo de campo definido.
-    
-    Args:
-        valor: Valor a validar
-        tipo_campo: Tipo de campo ('boolean', 'float', 'integer', etc.)
-        nombre_campo: Nombre del campo para mensajes de error
-    
-    Returns:
-        tuple: (valor_convertido, mensaje_error)
-        Si hay error, el primer elemento es None
-    """
-    if valor is None:
-        return None, None
-    
-    if tipo_campo.lower() == 'boolean':
-        # Usar la misma lógica de validación que en sensores.py
-        if isinstance(valor, bool):
-            return valor, None
-        elif isinstance(valor, str):
-            valor_lower = valor.lower()
-            if valor_lower in ['true', '1', 'yes', 'on']:
-                return True, None
-            elif valor_lower in ['false', '0', 'no', 'off']:
-                return False, None
-            else:
-                return None, f"El campo '{nombre_campo}' debe ser un booleano válido (true/false)"
-        elif isinstance(valor, int):
-            return bool(valor), None
-        else:
-            return None, f"El campo '{nombre_campo}' debe ser un booleano válido"
-    elif tipo_campo.lower() in ['float', 'double']:
-        try:
-            return float(valor), None
-        except (ValueError, TypeError):
-            return None, f"El campo '{nombre_campo}' debe ser un número decimal válido"
-    elif tipo_campo.lower() in ['integer', 'int']:
-        try:
-            return int(valor), None
-        except (ValueError, TypeError):
-            return None, f"El campo '{nombre_campo}' debe ser un número entero válido"
-    else:
-        # Para otros tipos, devolver el valor tal como está
-        return valor, None
+def parsear_fecha_utc(texto):
+    """Convierte una fecha ISO a datetime UTC sin zona (como se guardan en MongoDB)."""
+    fecha = datetime.fromisoformat(texto.replace('Z', '+00:00'))
+    if fecha.tzinfo is not None:
+        fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+    return fecha
 
 medidas_bp = Blueprint('medidas', __name__)
 
-# Obtener colecciones desde database
-medidas_collection = get_medidas_collection()
-sensores_collection = get_sensores_collection()
-db = get_db()
+# Resolución de nombres en /medidas: "catalogo" (en memoria) o "lookup" ($lookup en MongoDB)
+MEDIDAS_RESOLUCION = os.getenv("MEDIDAS_RESOLUCION", "catalogo")
+
+# Buffer opcional de escritura (MEDIDAS_BUFFER=1); None si la ingesta es directa
+buffer_medidas = crear_buffer_desde_entorno(persistir_medidas, liberar=liberar_lote)
 
 @medidas_bp.route('/guardar', methods=['POST'])
 def guardar_medidas():
-    """Guarda medidas de sensores en la base de datos. Espera un JSON con 'measures'."""
+    """Guarda medidas de sensores en la base de datos.
+
+    Espera un JSON con 'measures' (lecturas por nombre de sensor y campo) o el
+    formato compacto por ids con 'l' (ver ingesta.py), este último también en
+    MessagePack (application/msgpack) o CBOR (application/cbor). Con "lote"
+    (id o número de secuencia del dispositivo) los reintentos de un lote ya
+    guardado responden "duplicado": true sin escribir (ver lotes.py).
+    """
+    medidas_collection = get_medidas_collection()
     if medidas_collection is None:
         return jsonify({"error": "Conexión a la base de datos no disponible"}), 503
     try:
-        data = request.get_json()
-        if not data or "measures" not in data:
-            return jsonify({"error": "El JSON debe contener 'measures'"}), 400
-        measures = data["measures"]
-        medidas_a_insertar = []
-        sensores_activos = list(sensores_collection.find({"activo": True}))
-        mapa_sensores = {
-            s['nombre']: {
-                "id": s['_id'],
-                "campos": {
-                    c['nombre_campo']: {
-                        'id': c['_id'],
-                        'tipo': c['tipo_campo']
-                    } for c in s.get('campos', []) if c.get('activo')
-                }
-            } for s in sensores_activos
-        }
-        for sensor_name, lecturas in measures.items():
-            if sensor_name not in mapa_sensores:
-                continue
-            sensor_info = mapa_sensores[sensor_name]
-            sensor_id = sensor_info['id']
-            for lectura in lecturas:
-                detalle = lectura.get("detail")
-                valor_raw = lectura.get("value")
-                
-                if detalle in sensor_info['campos']:
-                    campo_info = sensor_info['campos'][detalle]
-                    campo_id = campo_info['id']
-                    tipo_campo = campo_info['tipo']
-                    
-                    # Validar y convertir el valor según el tipo de campo
-                    valor_validado, error_validacion = validar_valor_por_tipo(
-                        valor_raw, tipo_campo, detalle
-                    )
-                    
-                    if error_validacion:
-                        return jsonify({"error": f"Sensor '{sensor_name}', campo '{detalle}': {error_validacion}"}), 400
-                    
-                    medidas_a_insertar.append({
-                        "sensor_id": sensor_id,
-                        "campo_id": campo_id,
-                        "valor": valor_validado,
-                        "timestamp": datetime.utcnow()
-                    })
+        formato = formato_binario(request.mimetype)
+        if formato is None:
+            data = request.get_json()
+        elif not formato_disponible_ingesta(formato):
+            return jsonify({"error": f"Formato {formato} no disponible: instale el paquete {PAQUETES[formato]}"}), 415
+        else:
+            try:
+                data = decodificar(formato, request.get_data())
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        if not isinstance(data, dict) or ("measures" not in data and "l" not in data):
+            return jsonify({"error": "El cuerpo debe contener 'measures' o 'l'"}), 400
+        # Reintento de un lote ya recibido: se responde sin validar ni escribir (ver lotes.py)
+        lote, error = clave_lote(data, request.get_data())
+        if error:
+            return jsonify({"error": error}), 400
+        if lote is not None and lote_reciente(lote):
+            return jsonify(RESPUESTA_DUPLICADO)
+        if "measures" in data:
+            mapa_sensores = obtener_mapa_sensores()
+            if mapa_sensores is None:
+                return jsonify({"error": "Catálogo de sensores no disponible"}), 503
+            medidas_a_insertar, error = preparar_medidas(data["measures"], mapa_sensores)
+        else:
+            tipos_por_id = obtener_tipos_por_id()
+            if tipos_por_id is None:
+                return jsonify({"error": "Catálogo de sensores no disponible"}), 503
+            medidas_a_insertar, error = preparar_medidas_compactas(data, tipos_por_id)
+        if error:
+            return jsonify({"error": error}), 400
+        if lote is not None and medidas_a_insertar and not reclamar_lote(lote, len(medidas_a_insertar)):
+            return jsonify(RESPUESTA_DUPLICADO)
+        if buffer_medidas is not None:
+            if not buffer_medidas.encolar(medidas_a_insertar, lote):
+                if lote is not None:
+                    liberar_lote(lote)
+                respuesta = jsonify({"error": "Cola de ingesta llena, reintente más tarde"})
+                respuesta.headers["Retry-After"] = "1"
+                return respuesta, 503
+            return jsonify({
+                "status": "ok",
+                "mensaje": "Medidas encoladas correctamente",
+                "encoladas": len(medidas_a_insertar)
+            })
         if medidas_a_insertar:
-            medidas_collection.insert_many(medidas_a_insertar)
+            try:
+                persistir_medidas(medidas_a_insertar)
+            except Exception:
+                if lote is not None:
+                    liberar_lote(lote)
+                raise
         return jsonify({"status": "ok", "mensaje": "Medidas procesadas correctamente"})
     except Exception as e:
         log_error(e, "guardar_medidas")
         return jsonify({"error": str(e)}), 500
 
-@medidas_bp.route('/medidas', methods=['GET'])
-def obtener_medidas():
-    """Obtiene medidas filtradas por parámetros opcionales: limite, sensor_id, campo_id, desde, hasta."""
-    if medidas_collection is None:
-        return jsonify({"error": "Conexión a la base de datos no disponible"}), 503
+def codificar_cursor(timestamp, id_medida):
+    """Cursor opaco de paginación a partir de la última lectura de una página."""
+    contenido = json.dumps({"t": timestamp.isoformat(), "i": str(id_medida)})
+    return base64.urlsafe_b64encode(contenido.encode()).decode()
+
+def decodificar_cursor(cursor):
+    """Retorna (timestamp, _id) a partir de un cursor generado por codificar_cursor.
+
+    Lanza ValueError si el cursor está mal formado o alterado.
+    """
     try:
-        limite = int(request.args.get('limite', 100))
-        sensor_id = request.args.get('sensor_id')
-        campo_id = request.args.get('campo_id')
-        desde = request.args.get('desde')
-        hasta = request.args.get('hasta')
-        query = {}
-        if sensor_id:
-            query["sensor_id"] = ObjectId(sensor_id)
-        if campo_id:
-            query["campo_id"] = ObjectId(campo_id)
-        if desde or hasta:
-            query["timestamp"] = {}
-            if desde:
-                query["timestamp"]["$gte"] = datetime.fromisoformat(desde.replace('Z', '+00:00'))
-            if hasta:
-                query["timestamp"]["$lte"] = datetime.fromisoformat(hasta.replace('Z', '+00:00'))
-        pipeline = [
-            {"$match": query},
-            {"$sort": {"timestamp": -1}},
-            {"$limit": limite},
+        contenido = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        timestamp = datetime.fromisoformat(contenido["t"])
+        id_medida = contenido["i"]
+        # En modo buckets el _id de cada lectura es un texto sintético
+        if almacen.modo != "buckets":
+            id_medida = ObjectId(id_medida)
+        elif not isinstance(id_medida, str):
+            raise ValueError("_id sintético inválido")
+    except (ValueError, TypeError, KeyError, InvalidId) as e:
+        raise ValueError("'cursor' inválido") from e
+    return timestamp, id_medida
+
+def filtro_medidas(args):
+    """Construye el filtro plano de medidas a partir de sensor_id, campo_id, desde y hasta."""
+    query = {}
+    if args.get('sensor_id'):
+        query["sensor_id"] = ObjectId(args['sensor_id'])
+    if args.get('campo_id'):
+        query["campo_id"] = ObjectId(args['campo_id'])
+    if args.get('desde') or args.get('hasta'):
+        query["timestamp"] = {}
+        if args.get('desde'):
+            query["timestamp"]["$gte"] = parsear_fecha_utc(args['desde'])
+        if args.get('hasta'):
+            query["timestamp"]["$lte"] = parsear_fecha_utc(args['hasta'])
+    return query
+
+# Booleanos como "true"/"false" para que el frontend los muestre correctamente
+VALOR_COMO_TEXTO = {"$cond": [{"$eq": [{"$type": "$valor"}, "bool"]}, {"$toString": "$valor"}, "$valor"]}
+
+def etapas_resolucion():
+    """Etapas finales de /medidas según MEDIDAS_RESOLUCION.
+
+    - catalogo: proyección mínima; sensor y nombre_campo se agregan en la app
+      desde el catálogo en memoria (nombrar_medidas)
+    - lookup: $lookup a sensores y búsqueda del campo en MongoDB (camino
+      original). Conserva las lecturas de sensores o campos que ya no existen,
+      sin sensor ni nombre_campo, para que cuenten en el cursor de página;
+      omitir_sin_nombre las descarta después.
+    """
+    if MEDIDAS_RESOLUCION == 'lookup':
+        return [
             {
                 "$lookup": {
                     "from": "sensores",
@@ -150,40 +171,308 @@ def obtener_medidas():
                     "as": "sensor_info"
                 }
             },
-            {"$unwind": "$sensor_info"},
-            {"$unwind": "$sensor_info.campos"},
-            {
-                "$match": {
-                    "$expr": {"$eq": ["$campo_id", "$sensor_info.campos._id"]}
-                }
-            },
             {
                 "$project": {
                     "_id": {"$toString": "$_id"},  # Convertir ObjectId a string
-                    "sensor": "$sensor_info.nombre",
-                    "nombre_campo": "$sensor_info.campos.nombre_campo",
-                    "valor": "$valor",
+                    "sensor": {"$arrayElemAt": ["$sensor_info.nombre", 0]},
+                    "nombre_campo": {"$arrayElemAt": [{
+                        "$map": {
+                            "input": {"$filter": {
+                                "input": {"$ifNull": [{"$arrayElemAt": ["$sensor_info.campos", 0]}, []]},
+                                "cond": {"$eq": ["$$this._id", "$campo_id"]}
+                            }},
+                            "in": "$$this.nombre_campo"
+                        }
+                    }, 0]},
+                    "valor": VALOR_COMO_TEXTO,
                     "timestamp": "$timestamp"
                 }
             }
         ]
-        medidas = list(medidas_collection.aggregate(pipeline))
-        
-        # Convertir timestamp a formato ISO para JSON y asegurar que los booleanos se muestren correctamente
-        for medida in medidas:
-            if 'timestamp' in medida and medida['timestamp']:
-                medida['timestamp'] = medida['timestamp'].isoformat()
-            
-            # Convertir valores booleanos a string para que el frontend los muestre correctamente
-            if 'valor' in medida and isinstance(medida['valor'], bool):
-                medida['valor'] = str(medida['valor']).lower()  # true/false en minúsculas
-        
-        return jsonify(medidas)
+    return [{
+        "$project": {
+            "_id": {"$toString": "$_id"},
+            "sensor_id": 1,
+            "campo_id": 1,
+            "valor": VALOR_COMO_TEXTO,
+            "timestamp": 1
+        }
+    }]
+
+def _seguir_progreso(cursor, progreso):
+    """Recorre el cursor anotando cuántas lecturas se leyeron y la última (para el cursor de página)."""
+    for medida in cursor:
+        progreso["leidas"] += 1
+        progreso["ultima"] = (medida['timestamp'], medida['_id'])
+        yield medida
+
+def nombrar_medidas(filas, nombres):
+    """Agrega sensor y nombre_campo a cada lectura usando el índice por id del catálogo.
+
+    Como el $lookup original, omite las lecturas cuyo sensor o campo ya no existe.
+    """
+    for medida in filas:
+        sensor = nombres.get(medida['sensor_id'])
+        nombre_campo = sensor["campos"].get(medida['campo_id']) if sensor else None
+        if nombre_campo is None:
+            continue
+        yield {
+            "_id": medida['_id'],
+            "sensor": sensor["nombre"],
+            "nombre_campo": nombre_campo,
+            "valor": medida['valor'],
+            "timestamp": medida['timestamp'],
+        }
+
+def omitir_sin_nombre(filas):
+    """Descarta las lecturas que el $lookup dejó sin sensor o campo (MEDIDAS_RESOLUCION=lookup)."""
+    for medida in filas:
+        if medida.get('sensor') is not None and medida.get('nombre_campo') is not None:
+            yield medida
+
+@medidas_bp.route('/medidas', methods=['GET'])
+def obtener_medidas():
+    """Obtiene medidas filtradas por parámetros opcionales: limite, sensor_id, campo_id, desde, hasta.
+
+    Paginación por clave: si la página se llena, la cabecera X-Siguiente-Cursor
+    trae el cursor a enviar en el parámetro `cursor` para la página siguiente.
+    Con formato=ndjson la respuesta se transmite línea a línea desde el cursor
+    de MongoDB y el cursor siguiente llega en una última línea
+    {"siguiente_cursor": "..."}.
+    """
+    medidas_collection = get_medidas_collection()
+    if medidas_collection is None:
+        return jsonify({"error": "Conexión a la base de datos no disponible"}), 503
+    try:
+        limite = int(request.args.get('limite', 100))
+        formato = request.args.get('formato', 'json')
+        if limite < 1:
+            return jsonify({"error": "'limite' debe ser mayor que 0"}), 400
+        if formato not in ('json', 'ndjson'):
+            return jsonify({"error": "Formato inválido. Opciones: json, ndjson"}), 400
+        try:
+            despues_de = decodificar_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        query = filtro_medidas(request.args)
+        nombres = None
+        if MEDIDAS_RESOLUCION != 'lookup':
+            nombres = obtener_indice_por_id()
+            if nombres is None:
+                return jsonify({"error": "Catálogo de sensores no disponible"}), 503
+        cursor = almacen.coleccion().aggregate(
+            almacen.etapas_consulta(query, orden=-1, limite=limite, despues_de=despues_de) + etapas_resolucion(),
+            batchSize=1000
+        )
+        progreso = {"leidas": 0, "ultima": None}
+        # El progreso se anota antes de omitir lecturas huérfanas: la página se
+        # considera llena por las lecturas leídas, no por las devueltas
+        filas = _seguir_progreso(cursor, progreso)
+        if MEDIDAS_RESOLUCION != 'lookup':
+            filas = nombrar_medidas(filas, nombres)
+        else:
+            filas = omitir_sin_nombre(filas)
+
+        if formato == 'ndjson':
+            def generar():
+                for medida in filas:
+                    yield current_app.json.dumps(medida) + "\n"
+                if progreso["leidas"] == limite:
+                    yield json.dumps({"siguiente_cursor": codificar_cursor(*progreso["ultima"])}) + "\n"
+            return Response(stream_with_context(generar()), mimetype='application/x-ndjson')
+
+        # Las fechas se serializan en el proveedor JSON de la app, sin recorrer las filas aquí
+        medidas = list(filas)
+        siguiente = codificar_cursor(*progreso["ultima"]) if progreso["leidas"] == limite else None
+
+        respuesta = jsonify(medidas)
+        if siguiente:
+            respuesta.headers['X-Siguiente-Cursor'] = siguiente
+        return respuesta
     except Exception as e:
         log_error(e, "obtener_medidas")
         return jsonify({"error": str(e)}), 500
 
+@medidas_bp.route('/medidas/exportar', methods=['GET'])
+def exportar_medidas():
+    """Exporta medidas en bloque como CSV, Parquet o Arrow IPC.
+
+    Parámetros: formato (csv, parquet o arrow; por defecto csv), sensor_id,
+    campo_id, dispositivo_id (id de MongoDB del dispositivo), desde, hasta y
+    bloque (filas por bloque escrito, por defecto 10000). Los nombres de
+    sensores y campos se resuelven una sola vez desde el catálogo en memoria.
+    """
+    medidas_collection = get_medidas_collection()
+    if medidas_collection is None:
+        return jsonify({"error": "Conexión a la base de datos no disponible"}), 503
+    try:
+        formato = request.args.get('formato', 'csv')
+        if formato not in FORMATOS:
+            return jsonify({"error": f"Formato inválido. Opciones: {', '.join(FORMATOS)}"}), 400
+        if not formato_disponible(formato):
+            return jsonify({"error": f"El formato '{formato}' requiere pyarrow instalado en el servidor"}), 501
+        tam_bloque = int(request.args.get('bloque', 10000))
+        if tam_bloque < 1:
+            return jsonify({"error": "'bloque' debe ser mayor que 0"}), 400
+
+        nombres = obtener_indice_por_id()
+        if nombres is None:
+            return jsonify({"error": "Catálogo de sensores no disponible"}), 503
+
+        query = filtro_medidas(request.args)
+        dispositivo_id = request.args.get('dispositivo_id')
+        if dispositivo_id:
+            sensores_dispositivo = [
+                sensor_id for sensor_id, sensor in nombres.items()
+                if sensor["dispositivo_id"] == ObjectId(dispositivo_id)
+            ]
+            if "sensor_id" in query:
+                # Sensor y dispositivo a la vez: el sensor debe pertenecer al dispositivo
+                sensores_dispositivo = [s for s in sensores_dispositivo if s == query["sensor_id"]]
+            query["sensor_id"] = {"$in": sensores_dispositivo}
+
+        cursor = almacen.coleccion().aggregate(
+            almacen.etapas_consulta(query, orden=1), batchSize=tam_bloque, allowDiskUse=True
+        )
+        tipo, extension = FORMATOS[formato]
+        nombre_archivo = f"medidas_{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.{extension}"
+        return Response(
+            stream_with_context(GENERADORES[formato](cursor, nombres, tam_bloque)),
+            mimetype=tipo,
+            headers={"Content-Disposition": f"attachment; filename={nombre_archivo}"}
+        )
+    except Exception as e:
+        log_error(e, "exportar_medidas")
+        return jsonify({"error": str(e)}), 500
+
+@medidas_bp.route('/medidas/archivo', methods=['GET'])
+def obtener_medidas_archivadas():
+    """Lee lecturas ya archivadas por la política de retención (ver retencion.py).
+
+    Parámetros: sensor_id, desde y hasta (obligatorios) y campo_id. Responde en
+    NDJSON, una lectura por línea con la forma de /medidas, en orden cronológico.
+    """
+    if not request.args.get('sensor_id') or not request.args.get('desde') or not request.args.get('hasta'):
+        return jsonify({"error": "Parámetros requeridos: sensor_id, desde, hasta"}), 400
+    try:
+        sensor_id = ObjectId(request.args['sensor_id'])
+        campo_id = ObjectId(request.args['campo_id']) if request.args.get('campo_id') else None
+        desde = parsear_fecha_utc(request.args['desde'])
+        hasta = parsear_fecha_utc(request.args['hasta'])
+        nombres = obtener_indice_por_id()
+        if nombres is None:
+            return jsonify({"error": "Catálogo de sensores no disponible"}), 503
+
+        def generar():
+            for medida in nombrar_medidas(leer_archivo(sensor_id, desde, hasta, campo_id), nombres):
+                if isinstance(medida['valor'], bool):
+                    medida['valor'] = str(medida['valor']).lower()
+                yield current_app.json.dumps(medida) + "\n"
+        return Response(stream_with_context(generar()), mimetype='application/x-ndjson')
+    except Exception as e:
+        log_error(e, "obtener_medidas_archivadas")
+        return jsonify({"error": str(e)}), 500
+
+@medidas_bp.route('/medidas/serie', methods=['GET'])
+def obtener_serie_medidas():
+    """Serie agregada de un sensor/campo para gráficas históricas.
+
+    Parámetros: sensor_id y campo_id (requeridos), desde, hasta (ISO, por
+    defecto las últimas 24 h), puntos (máximo de puntos deseados, por defecto
+    300) y resolucion (minuto, hora o dia) para forzar una resolución.
+    """
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "Conexión a la base de datos no disponible"}), 503
+    try:
+        sensor_id = request.args.get('sensor_id')
+        campo_id = request.args.get('campo_id')
+        if not sensor_id or not campo_id:
+            return jsonify({"error": "Se requiere 'sensor_id' y 'campo_id'"}), 400
+        puntos = int(request.args.get('puntos', 300))
+        if puntos < 1:
+            return jsonify({"error": "'puntos' debe ser mayor que 0"}), 400
+
+        hasta = datetime.utcnow()
+        if request.args.get('hasta'):
+            hasta = parsear_fecha_utc(request.args['hasta'])
+        desde = hasta - timedelta(hours=24)
+        if request.args.get('desde'):
+            desde = parsear_fecha_utc(request.args['desde'])
+
+        resolucion = request.args.get('resolucion') or elegir_resolucion(desde, hasta, puntos)
+        if resolucion not in RESOLUCIONES:
+            return jsonify({"error": f"Resolución inválida. Opciones: {', '.join(RESOLUCIONES)}"}), 400
+
+        return jsonify({
+            "sensor_id": sensor_id,
+            "campo_id": campo_id,
+            "desde": desde.isoformat(),
+            "hasta": hasta.isoformat(),
+            "resolucion": resolucion,
+            "puntos": obtener_serie(ObjectId(sensor_id), ObjectId(campo_id), desde, hasta, resolucion)
+        })
+    except Exception as e:
+        log_error(e, "obtener_serie_medidas")
+        return jsonify({"error": str(e)}), 500
+
+def armar_datos_dispositivo(posicion, dispositivo_doc, sensores_vinculados, ultimas):
+    """Arma la respuesta de un dispositivo lógico a partir de datos ya consultados.
+
+    Args:
+        posicion: Número lógico del dispositivo (1, 2, 3...)
+        dispositivo_doc: Documento de la colección "dispositivos"
+        sensores_vinculados: Sensores activos vinculados al dispositivo
+        ultimas: Mapa {(sensor_id, campo_id): ultima_medida} de ultimas_medidas
+    """
+    datos_dispositivo = {}
+    sensores_info = []
+
+    for sensor in sensores_vinculados:
+        sensor_id = sensor["_id"]
+        campos = sensor.get("campos", [])
+        sensor_nombre = sensor.get("nombre")
+
+        sensor_campos = {}
+        for campo in campos:
+            if not campo.get("activo", True):
+                continue
+            campo_id = campo["_id"]
+            nombre_campo = campo["nombre_campo"]
+
+            ultima_medida = ultimas.get((sensor_id, campo_id))
+
+            if ultima_medida:
+                valor = ultima_medida["valor"]
+                if isinstance(valor, bool):
+                    valor = str(valor).lower()
+                sensor_campos[nombre_campo] = valor
+                datos_dispositivo[nombre_campo] = valor
+            else:
+                sensor_campos[nombre_campo] = None
+                datos_dispositivo.setdefault(nombre_campo, None)
+
+        sensores_info.append({
+            "sensor_id": str(sensor_id),
+            "nombre": sensor_nombre,
+            "campos": sensor_campos
+        })
+
+    return {
+        "dispositivo": posicion,
+        "dispositivo_mongo_id": str(dispositivo_doc.get("_id")),
+        "dispositivo_nombre": dispositivo_doc.get("nombre"),
+        "datos": datos_dispositivo,
+        "sensores": sensores_info
+    }
+
+def listar_dispositivos_ordenados():
+    """Retorna los dispositivos ordenados por fecha de creación (posición lógica)."""
+    db = get_db()
+    return list(db.dispositivos.find({}, {"nombre": 1, "created_at": 1}).sort("created_at", 1))
+
 @medidas_bp.route('/dispositivo/<int:device_id>', methods=['GET'])
+@condicional("medidas", "sensores", "dispositivos")
 def obtener_datos_dispositivo(device_id):
     """Obtiene los últimos valores de sensores para un dispositivo lógico (1, 2 o 3).
 
@@ -192,102 +481,189 @@ def obtener_datos_dispositivo(device_id):
     de creación. Luego se agregan los últimos valores de todos los sensores
     vinculados a ese dispositivo (por campo).
     """
+    medidas_collection = get_medidas_collection()
+    sensores_collection = get_sensores_collection()
+    db = get_db()
     if medidas_collection is None or sensores_collection is None or db is None:
         return jsonify({"error": "Conexión a la base de datos no disponible"}), 503
     try:
-        dispositivos_collection = db.dispositivos
-
         # Obtener dispositivos ordenados por fecha de creación (más antiguos primero)
-        dispositivos = list(dispositivos_collection.find().sort("created_at", 1))
+        dispositivos = listar_dispositivos_ordenados()
         if not dispositivos or device_id < 1 or device_id > len(dispositivos):
             return jsonify({"error": f"No existe el dispositivo lógico {device_id}. Total disponibles: {len(dispositivos)}"}), 404
 
         dispositivo_doc = dispositivos[device_id - 1]
-        dispositivo_mongo_id = dispositivo_doc.get("_id")
 
         # Buscar todos los sensores vinculados a este dispositivo
         sensores_vinculados = list(sensores_collection.find({
-            "dispositivo_id": dispositivo_mongo_id,
+            "dispositivo_id": dispositivo_doc.get("_id"),
             "activo": True
         }))
+        ultimas = obtener_ultimas([s["_id"] for s in sensores_vinculados])
 
-        if not sensores_vinculados:
-            return jsonify({
-                "dispositivo": device_id,
-                "dispositivo_mongo_id": str(dispositivo_mongo_id),
-                "dispositivo_nombre": dispositivo_doc.get("nombre"),
-                "datos": {},
-                "sensores": []
-            })
+        return jsonify(armar_datos_dispositivo(device_id, dispositivo_doc, sensores_vinculados, ultimas))
+    except Exception as e:
+        log_error(e, "obtener_datos_dispositivo")
+        return jsonify({"error": str(e)}), 500
 
-        datos_dispositivo = {}
-        sensores_info = []
-
-        for sensor in sensores_vinculados:
-            sensor_id = sensor["_id"]
-            campos = sensor.get("campos", [])
-            sensor_nombre = sensor.get("nombre")
-
-            sensor_campos = {}
-            for campo in campos:
-                if not campo.get("activo", True):
-                    continue
-                campo_id = campo["_id"]
-                nombre_campo = campo["nombre_campo"]
-
-                ultima_medida = medidas_collection.find_one(
-                    {"sensor_id": sensor_id, "campo_id": campo_id},
-                    sort=[("timestamp", -1)]
-                )
-
-                if ultima_medida:
-                    valor = ultima_medida["valor"]
-                    if isinstance(valor, bool):
-                        valor = str(valor).lower()
-                    sensor_campos[nombre_campo] = valor
-                    datos_dispositivo[nombre_campo] = valor
-                else:
-                    sensor_campos[nombre_campo] = None
-                    datos_dispositivo.setdefault(nombre_campo, None)
-
-            sensores_info.append({
-                "sensor_id": str(sensor_id),
-                "nombre": sensor_nombre,
-                "campos": sensor_campos
-            })
+def resumir_dispositivos():
+    """Últimos valores de todos los dispositivos lógicos con un número constante de consultas."""
+    sensores_collection = get_sensores_collection()
+    dispositivos = listar_dispositivos_ordenados()
+    ids_dispositivos = [d["_id"] for d in dispositivos]
 
-        return jsonify({
-            "dispositivo": device_id,
-            "dispositivo_mongo_id": str(dispositivo_mongo_id),
-            "dispositivo_nombre": dispositivo_doc.get("nombre"),
-            "datos": datos_dispositivo,
-            "sensores": sensores_info
-        })
+    sensores_por_dispositivo = {}
+    sensores_vinculados = list(sensores_collection.find({
+        "dispositivo_id": {"$in": ids_dispositivos},
+        "activo": True
+    })) if ids_dispositivos else []
+    for sensor in sensores_vinculados:
+        sensores_por_dispositivo.setdefault(sensor["dispositivo_id"], []).append(sensor)
+
+    ultimas = obtener_ultimas([s["_id"] for s in sensores_vinculados])
+
+    return [
+        armar_datos_dispositivo(posicion, dispositivo_doc, sensores_por_dispositivo.get(dispositivo_doc["_id"], []), ultimas)
+        for posicion, dispositivo_doc in enumerate(dispositivos, start=1)
+    ]
+
+@medidas_bp.route('/dispositivos/resumen', methods=['GET'])
+@condicional("medidas", "sensores", "dispositivos")
+def obtener_resumen_dispositivos():
+    """Obtiene los últimos valores de todos los dispositivos lógicos en una sola respuesta.
+
+    Usa un número constante de consultas sin importar cuántos dispositivos
+    existan: una para los dispositivos, una para todos los sensores vinculados
+    y una para sus últimos valores.
+    """
+    medidas_collection = get_medidas_collection()
+    sensores_collection = get_sensores_collection()
+    db = get_db()
+    if medidas_collection is None or sensores_collection is None or db is None:
+        return jsonify({"error": "Conexión a la base de datos no disponible"}), 503
+    try:
+        resumen = resumir_dispositivos()
+        return jsonify({"total": len(resumen), "dispositivos": resumen})
     except Exception as e:
-        log_error(e, "obtener_datos_dispositivo")
+        log_error(e, "obtener_resumen_dispositivos")
+        return jsonify({"error": str(e)}), 500
+
+# Recomendaciones calculadas para la última versión de medidas/sensores/dispositivos
+_cache_recomendaciones = {"version": None, "resultado": None}
+
+@medidas_bp.route('/recomendaciones', methods=['GET'])
+@condicional("medidas", "sensores", "dispositivos")
+def obtener_recomendaciones():
+    """Compatibilidad de todos los cultivos con cada dispositivo lógico.
+
+    Parámetros opcionales: dispositivo (número lógico) y cultivo (id, p. ej.
+    "maiz"). El cálculo de todos los dispositivos se hace en una pasada de
+    NumPy y se reutiliza hasta que cambian los últimos valores, los sensores o
+    los dispositivos.
+    """
+    medidas_collection = get_medidas_collection()
+    sensores_collection = get_sensores_collection()
+    db = get_db()
+    if medidas_collection is None or sensores_collection is None or db is None:
+        return jsonify({"error": "Conexión a la base de datos no disponible"}), 503
+    try:
+        dispositivo = request.args.get('dispositivo', type=int)
+        cultivo = request.args.get('cultivo')
+        if cultivo and cultivo not in IDS_CULTIVOS:
+            return jsonify({"error": f"Cultivo desconocido: {cultivo}. Opciones: {', '.join(IDS_CULTIVOS)}"}), 400
+
+        version = etiqueta(("medidas", "sensores", "dispositivos"))
+        resultado = _cache_recomendaciones["resultado"]
+        if resultado is None or _cache_recomendaciones["version"] != version:
+            resultado = recomendaciones(resumir_dispositivos())
+            _cache_recomendaciones.update(version=version, resultado=resultado)
+
+        if dispositivo is not None:
+            resultado = [d for d in resultado if d["dispositivo"] == dispositivo]
+            if not resultado:
+                return jsonify({"error": f"No existe el dispositivo lógico {dispositivo}"}), 404
+        if cultivo:
+            resultado = [dict(d, cultivos=[c for c in d["cultivos"] if c["cultivo"] == cultivo]) for d in resultado]
+        return jsonify({"total": len(resultado), "dispositivos": resultado})
+    except Exception as e:
+        log_error(e, "obtener_recomendaciones")
+        return jsonify({"error": str(e)}), 500
+
+def respuesta_eventos(temas):
+    """Respuesta SSE que entrega las lecturas publicadas en los temas indicados."""
+    seguidor_difusion.asegurar()
+    suscripcion = centro_eventos.suscribir(temas)
+
+    def generar():
+        try:
+            # Tiempo de reconexión sugerido al navegador (ms)
+            yield "retry: 3000\n\n"
+            yield from suscripcion.mensajes(EVENTOS_LATIDO_S)
+        finally:
+            # Se ejecuta cuando el cliente se desconecta
+            centro_eventos.cancelar(suscripcion)
+
+    return Response(generar(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
+@medidas_bp.route('/eventos', methods=['GET'])
+def eventos_medidas():
+    """Stream SSE con todas las lecturas nuevas (evento "medida", misma forma que /medidas)."""
+    return respuesta_eventos([TEMA_TODAS])
+
+@medidas_bp.route('/eventos/sensor/<sensor_id>', methods=['GET'])
+def eventos_sensor(sensor_id):
+    """Stream SSE con las lecturas nuevas de un sensor."""
+    try:
+        ObjectId(sensor_id)
+    except Exception:
+        return jsonify({"error": "sensor_id inválido"}), 400
+    return respuesta_eventos([tema_sensor(sensor_id)])
+
+@medidas_bp.route('/eventos/dispositivo/<int:device_id>', methods=['GET'])
+def eventos_dispositivo(device_id):
+    """Stream SSE con las lecturas nuevas de los sensores de un dispositivo lógico."""
+    db = get_db()
+    if db is None:
+        return jsonify({"error": "Conexión a la base de datos no disponible"}), 503
+    try:
+        dispositivos = listar_dispositivos_ordenados()
+        if not dispositivos or device_id < 1 or device_id > len(dispositivos):
+            return jsonify({"error": f"No existe el dispositivo lógico {device_id}. Total disponibles: {len(dispositivos)}"}), 404
+        return respuesta_eventos([tema_dispositivo(dispositivos[device_id - 1]["_id"])])
+    except Exception as e:
+        log_error(e, "eventos_dispositivo")
         return jsonify({"error": str(e)}), 500
 
 @medidas_bp.route('/estado', methods=['GET'])
 def estado_sistema():
     """Retorna el estado del sistema: conexión, total sensores, total medidas, última medida."""
+    medidas_collection = get_medidas_collection()
+    sensores_collection = get_sensores_collection()
     try:
-        total_sensores = sensores_collection.count_documents({}) if sensores_collection is not None else 0
-        total_medidas = medidas_collection.count_documents({}) if medidas_collection is not None else 0
-        ultima_medida = medidas_collection.find_one(
-            {},
-            {"sort": [("timestamp", -1)], "projection": {"timestamp": 1}}
-        ) if medidas_collection is not None else None
+        # Sensores desde el catálogo en memoria y medidas desde los contadores mantenidos en la ingesta
+        indice = obtener_indice_por_id() if sensores_collection is not None else None
+        total_sensores = len(indice) if indice is not None else 0
+        contadores = obtener_contadores() if medidas_collection is not None else {"total": 0, "ultima": None, "origen": None}
+        ultima_medida = contadores["ultima"]
 
         # Convertir timestamp si existe
-        ultima_medida_timestamp = None
-        if ultima_medida and 'timestamp' in ultima_medida:
-            ultima_medida_timestamp = ultima_medida['timestamp'].isoformat()
+        ultima_medida_timestamp = ultima_medida.isoformat() if ultima_medida else None
 
         return jsonify({
             "estado": "conectado" if medidas_collection is not None else "desconectado",
             "total_sensores": total_sensores,
-            "total_medidas": total_medidas,
-            "ultima_medida": ultima_medida_timestamp
+            "total_medidas": contadores["total"],
+            "origen_total_medidas": contadores["origen"],
+            "ultima_medida": ultima_medida_timestamp,
+            "almacenamiento": almacen.modo,
+            "catalogo_sensores": estadisticas_catalogo(),
+            "buffer_medidas": buffer_medidas.estadisticas() if buffer_medidas is not None else None,
+            "lotes": estadisticas_lotes(),
+            "eventos": centro_eventos.estadisticas(),
+            "get_condicional": estadisticas_versiones()
         })
     except Exception as e:
         log_error(e, "estado_sistema")
@@ -0,0 +1,337 @@
+"""
+Métricas en formato de texto de Prometheus
+Contadores, indicadores e histogramas en memoria del proceso, expuestos en
+GET /metrics sin dependencias externas:
+
+- HTTP: peticiones, latencia y peticiones en curso por blueprint y ruta (la
+  plantilla de la ruta, p. ej. /medidas/serie, no la URL concreta).
+- MongoDB: duración de cada comando por colección y operación, tomada de los
+  eventos de pymongo (monitoring.CommandListener), y comandos fallidos.
+- Ingesta: lecturas aceptadas, rechazadas por validación de tipo, sensores y
+  campos desconocidos ignorados, y lotes duplicados descartados (lotes.py).
+
+Cada proceso mide en memoria. Con un solo proceso las muestras llevan la
+etiqueta pid. Con varios workers (gunicorn, uvicorn --workers) cada scrape lo
+atiende un worker cualquiera, así que con METRICAS_DIR cada proceso vuelca
+sus valores a METRICAS_DIR/<pid>.json cada METRICAS_VOLCADO_S segundos y
+/metrics responde la suma de todos los archivos, sin etiqueta pid (el mismo
+esquema que el modo multiproceso de prometheus_client). Los contadores e
+histogramas de workers terminados se conservan para que las series no
+retrocedan; los indicadores solo suman procesos vivos. gunicorn.conf.py
+define y vacía el directorio al arrancar.
+Con METRICAS=0 no se instala nada y /metrics responde 404.
+"""
+
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, request
+from pymongo import monitoring
+
+METRICAS = os.getenv("METRICAS", "1") == "1"
+
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+BUCKETS_HTTP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_MONGO = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+# Directorio compartido por los procesos de un mismo servicio (vacío = métricas del proceso)
+METRICAS_DIR = os.getenv("METRICAS_DIR", "")
+METRICAS_VOLCADO_S = float(os.getenv("METRICAS_VOLCADO_S", "5"))
+
+_registro = []
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = "untyped"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+        _registro.append(self)
+
+    def _etiquetas(self, valores, extra=()):
+        pares = list(zip(self.etiquetas, valores)) + list(extra)
+        if not METRICAS_DIR:
+            pares.append(("pid", os.getpid()))
+        return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in pares) + "}"
+
+    def valores(self):
+        """Copia de {etiquetas: valor} de este proceso."""
+        with self._lock:
+            return {clave: list(valor) if isinstance(valor, list) else valor for clave, valor in self._valores.items()}
+
+    @staticmethod
+    def _sumar(a, b):
+        return [x + y for x, y in zip(a, b)] if isinstance(a, list) else a + b
+
+    def exponer(self, valores=None):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        if valores is None:
+            valores = self.valores()
+        for clave, valor in sorted(valores.items()):
+            lineas.extend(self._lineas(clave, valor))
+        return lineas
+
+    def _lineas(self, clave, valor):
+        return [f"{self.nombre}{self._etiquetas(clave)} {_numero(valor)}"]
+
+
+class Contador(_Metrica):
+    """Valor que solo crece (p. ej. peticiones atendidas)."""
+
+    tipo = "counter"
+
+    def inc(self, *etiquetas, n=1):
+        with self._lock:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + n
+
+
+class Indicador(Contador):
+    """Valor que sube y baja (p. ej. peticiones en curso)."""
+
+    tipo = "gauge"
+
+    def dec(self, *etiquetas, n=1):
+        self.inc(*etiquetas, n=-n)
+
+
+class Histograma(_Metrica):
+    """Distribución de valores (latencias) en buckets acumulados, con suma y total."""
+
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_HTTP):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor, *etiquetas):
+        # Conteo por bucket sin acumular; se acumula al exponer
+        posicion = bisect_left(self.buckets, valor)
+        with self._lock:
+            datos = self._valores.get(etiquetas)
+            if datos is None:
+                datos = self._valores[etiquetas] = [0] * (len(self.buckets) + 1) + [0.0]
+            datos[posicion] += 1
+            datos[-1] += valor
+
+    def _lineas(self, clave, datos):
+        lineas = []
+        acumulado = 0
+        for limite, cantidad in zip(self.buckets + (float("inf"),), datos[:-1]):
+            acumulado += cantidad
+            lineas.append(f"{self.nombre}_bucket{self._etiquetas(clave, [('le', _numero(limite))])} {acumulado}")
+        lineas.append(f"{self.nombre}_sum{self._etiquetas(clave)} {_numero(datos[-1])}")
+        lineas.append(f"{self.nombre}_count{self._etiquetas(clave)} {acumulado}")
+        return lineas
+
+
+def exponer():
+    """Texto de todas las métricas en el formato de exposición de Prometheus."""
+    if METRICAS_DIR:
+        return _exponer_compartidas()
+    lineas = []
+    for metrica in _registro:
+        lineas.extend(metrica.exponer())
+    return "\n".join(lineas) + "\n"
+
+
+# --- Varios procesos (METRICAS_DIR) ---
+
+_volcado = {"pid": None}
+
+
+def volcar():
+    """Escribe los valores de este proceso en METRICAS_DIR/<pid>.json (reemplazo atómico)."""
+    datos = {m.nombre: [[list(clave), valor] for clave, valor in m.valores().items()] for m in _registro}
+    destino = os.path.join(METRICAS_DIR, f"{os.getpid()}.json")
+    temporal = destino + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(datos, f)
+    os.replace(temporal, destino)
+
+
+def _bucle_volcado():
+    while True:
+        time.sleep(METRICAS_VOLCADO_S)
+        try:
+            volcar()
+        except OSError as e:
+            print(f"[WARN] No se pudieron volcar las metricas en {METRICAS_DIR}: {e}")
+
+
+def asegurar_volcado():
+    """Arranca el volcado periódico una vez por proceso (también tras un fork)."""
+    if not METRICAS or not METRICAS_DIR or _volcado["pid"] == os.getpid():
+        return
+    _volcado["pid"] = os.getpid()
+    os.makedirs(METRICAS_DIR, exist_ok=True)
+    threading.Thread(target=_bucle_volcado, name="volcar-metricas", daemon=True).start()
+    # Lo contado en los últimos segundos de un worker que termina no se pierde
+    atexit.register(_volcar_al_salir, os.getpid())
+
+
+def _volcar_al_salir(pid):
+    if pid == os.getpid():
+        try:
+            volcar()
+        except OSError:
+            pass
+
+
+def _vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _exponer_compartidas():
+    # El proceso que responde vuelca primero lo suyo para no servir sus valores atrasados
+    volcar()
+    sumas = {m.nombre: {} for m in _registro}
+    tipos = {m.nombre: m.tipo for m in _registro}
+    for archivo in glob.glob(os.path.join(METRICAS_DIR, "*.json")):
+        try:
+            pid = int(os.path.basename(archivo)[:-5])
+            with open(archivo, encoding="utf-8") as f:
+                datos = json.load(f)
+        except (ValueError, OSError):
+            continue
+        vivo = _vivo(pid)
+        for nombre, muestras in datos.items():
+            if nombre not in sumas or (tipos[nombre] == "gauge" and not vivo):
+                continue
+            for clave, valor in muestras:
+                clave = tuple(clave)
+                actual = sumas[nombre].get(clave)
+                sumas[nombre][clave] = valor if actual is None else _Metrica._sumar(actual, valor)
+    lineas = []
+    for metrica in _registro:
+        lineas.extend(metrica.exponer(sumas[metrica.nombre]))
+    return "\n".join(lineas) + "\n"
+
+
+# --- Métricas ---
+
+HTTP_PETICIONES = Contador(
+    "http_peticiones_total", "Peticiones HTTP atendidas", ("blueprint", "ruta", "metodo", "estado"))
+HTTP_DURACION = Histograma(
+    "http_duracion_segundos", "Tiempo hasta la respuesta (sin el envío del cuerpo en streaming)",
+    ("blueprint", "ruta", "metodo"), BUCKETS_HTTP)
+HTTP_EN_CURSO = Indicador(
+    "http_en_curso", "Peticiones en curso, incluidas las conexiones SSE abiertas", ("blueprint", "ruta"))
+
+MONGO_DURACION = Histograma(
+    "mongodb_comando_duracion_segundos", "Duración de los comandos de MongoDB",
+    ("coleccion", "comando"), BUCKETS_MONGO)
+MONGO_FALLIDOS = Contador(
+    "mongodb_comandos_fallidos_total", "Comandos de MongoDB con error", ("coleccion", "comando"))
+
+INGESTA_ACEPTADAS = Contador("ingesta_lecturas_aceptadas_total", "Lecturas válidas listas para guardar")
+INGESTA_RECHAZADAS = Contador(
+    "ingesta_lecturas_rechazadas_total", "Lecturas rechazadas (tipo = validar_valor_por_tipo, formato = línea mal formada, timestamp = en el futuro)",
+    ("motivo",))
+INGESTA_SENSORES_DESCONOCIDOS = Contador(
+    "ingesta_sensores_desconocidos_total", "Sensores inexistentes o inactivos ignorados (uno por lote)")
+INGESTA_CAMPOS_DESCONOCIDOS = Contador(
+    "ingesta_campos_desconocidos_total", "Campos inexistentes o inactivos ignorados (uno por lectura o columna)")
+INGESTA_LOTES_DUPLICADOS = Contador(
+    "ingesta_lotes_duplicados_total", "Reintentos de lotes ya recibidos descartados (deteccion = memoria o base)",
+    ("deteccion",))
+
+
+# --- MongoDB ---
+
+class EscuchaComandos(monitoring.CommandListener):
+    """Registra la duración de cada comando por colección y operación."""
+
+    def __init__(self):
+        # (conexión, request_id) -> colección, entre el inicio y el fin del comando
+        self._en_curso = {}
+
+    def started(self, event):
+        comando = event.command
+        coleccion = comando.get("collection") if event.command_name == "getMore" else comando.get(event.command_name)
+        self._en_curso[(event.connection_id, event.request_id)] = coleccion if isinstance(coleccion, str) else "-"
+
+    def _coleccion(self, event):
+        return self._en_curso.pop((event.connection_id, event.request_id), "-")
+
+    def succeeded(self, event):
+        MONGO_DURACION.observar(event.duration_micros / 1e6, self._coleccion(event), event.command_name)
+
+    def failed(self, event):
+        coleccion = self._coleccion(event)
+        MONGO_DURACION.observar(event.duration_micros / 1e6, coleccion, event.command_name)
+        MONGO_FALLIDOS.inc(coleccion, event.command_name)
+
+
+_instalado = {"mongo": False}
+
+
+def registrar_escucha_mongo():
+    """Registra la escucha de comandos para los clientes de MongoDB que se creen después."""
+    if METRICAS and not _instalado["mongo"]:
+        monitoring.register(EscuchaComandos())
+        _instalado["mongo"] = True
+
+
+# --- Flask ---
+
+def instrumentar(app):
+    """Mide cada petición de la app y agrega GET /metrics."""
+    if not METRICAS:
+        return
+    registrar_escucha_mongo()
+
+    @app.before_request
+    def _metricas_inicio():
+        asegurar_volcado()
+        regla = request.url_rule
+        g.metricas = (time.perf_counter(), request.blueprint or "app", regla.rule if regla else "sin_ruta")
+        HTTP_EN_CURSO.inc(g.metricas[1], g.metricas[2])
+
+    @app.after_request
+    def _metricas_respuesta(respuesta):
+        inicio, blueprint, ruta = g.pop("metricas", None) or (None, None, None)
+        if inicio is not None:
+            HTTP_PETICIONES.inc(blueprint, ruta, request.method, str(respuesta.status_code))
+            HTTP_DURACION.observar(time.perf_counter() - inicio, blueprint, ruta, request.method)
+            # teardown_request llega apenas la vista retorna, también en
+            # streaming (SSE): la petición termina cuando el servidor cierra la respuesta
+            respuesta.call_on_close(lambda: HTTP_EN_CURSO.dec(blueprint, ruta))
+        return respuesta
+
+    @app.teardown_request
+    def _metricas_fin(_error):
+        # Solo si after_request no alcanzó a entregar la petición a la respuesta
+        datos = g.pop("metricas", None)
+        if datos is not None:
+            HTTP_EN_CURSO.dec(datos[1], datos[2])
+
+    @app.route("/metrics")
+    def metrics():
+        """Métricas del proceso en formato de texto de Prometheus."""
+        return Response(exponer(), mimetype=None, content_type=TIPO_CONTENIDO)
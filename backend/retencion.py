@@ -0,0 +1,201 @@
+"""
+Retención y archivo de medidas crudas
+Mueve las lecturas más antiguas que RETENCION_DIAS a archivos NDJSON
+comprimidos (gzip o zstd) particionados por sensor y mes, y luego las borra de
+MongoDB día por día, para que la colección caliente y sus índices quepan en
+memoria. Los agregados por minuto/hora/día y los últimos valores no se tocan.
+
+Estructura del archivo:
+
+    ARCHIVO_DIR/<sensor_id>/<AAAA-MM>.ndjson.gz   (o .ndjson.zst)
+
+Cada día archivado se agrega al final como un bloque comprimido independiente.
+Después se borran de MongoDB exactamente las lecturas escritas (por _id), no
+el rango del día: una lectura con fecha atrasada que llegue durante la copia
+queda para la siguiente ejecución. Si el proceso se interrumpe entre escribir
+y borrar un día, al repetirlo ese día queda dos veces en el archivo; la
+lectura descarta los duplicados por _id y timestamp.
+"""
+
+import gzip
+import io
+import json
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bson import ObjectId
+
+from database import log_error
+from almacen_medidas import almacen
+
+try:
+    import zstandard
+except ImportError:  # zstandard es opcional: solo se necesita con ARCHIVO_COMPRESION=zstd
+    zstandard = None
+
+# Días de lecturas crudas que se conservan en MongoDB (0 desactiva la retención)
+RETENCION_DIAS = int(os.getenv("RETENCION_DIAS", "0"))
+ARCHIVO_DIR = Path(os.getenv("ARCHIVO_DIR", str(Path(__file__).parent / "archivo")))
+ARCHIVO_COMPRESION = os.getenv("ARCHIVO_COMPRESION", "gzip")
+
+EXTENSIONES = {"gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+
+
+def _inicio_dia(fecha):
+    return fecha.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _inicio_mes(fecha):
+    return _inicio_dia(fecha).replace(day=1)
+
+
+def _ruta(sensor_id, mes, compresion):
+    return ARCHIVO_DIR / str(sensor_id) / f"{mes:%Y-%m}{EXTENSIONES[compresion]}"
+
+
+def _agregar_bloque(ruta, lineas, compresion):
+    """Agrega un bloque comprimido al final del archivo y lo fuerza a disco."""
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    datos = "".join(lineas).encode("utf-8")
+    if compresion == "zstd":
+        datos = zstandard.ZstdCompressor(level=10).compress(datos)
+    else:
+        datos = gzip.compress(datos, compresslevel=6)
+    with open(ruta, "ab") as archivo:
+        archivo.write(datos)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+
+
+def _linea(medida):
+    return json.dumps({
+        "_id": str(medida["_id"]),
+        "campo_id": str(medida["campo_id"]),
+        "valor": medida["valor"],
+        "timestamp": medida["timestamp"].isoformat(),
+    }) + "\n"
+
+
+def fecha_corte(dias=None, ahora=None):
+    """Inicio del día (UTC) antes del cual las lecturas se archivan."""
+    dias = RETENCION_DIAS if dias is None else dias
+    return _inicio_dia((ahora or datetime.utcnow()) - timedelta(days=dias))
+
+
+def _primer_timestamp(sensor_id, hasta):
+    etapas = almacen.etapas_consulta({"sensor_id": sensor_id, "timestamp": {"$lt": hasta}}, orden=1, limite=1)
+    primera = next(iter(almacen.coleccion().aggregate(etapas)), None)
+    return primera["timestamp"] if primera else None
+
+
+def archivar_sensor(sensor_id, corte, compresion, simular=False):
+    """Archiva y borra, día por día, las lecturas de un sensor anteriores a `corte`.
+
+    Retorna (lecturas archivadas, lecturas borradas).
+    """
+    dia = _primer_timestamp(sensor_id, corte)
+    if dia is None:
+        return 0, 0
+    dia = _inicio_dia(dia)
+    archivadas = borradas = 0
+    while dia < corte:
+        siguiente = dia + timedelta(days=1)
+        cursor = almacen.coleccion().aggregate(
+            almacen.etapas_consulta({"sensor_id": sensor_id, "timestamp": {"$gte": dia, "$lt": siguiente}}, orden=1),
+            batchSize=5000
+        )
+        medidas = list(cursor)
+        if medidas:
+            archivadas += len(medidas)
+            if not simular:
+                _agregar_bloque(_ruta(sensor_id, _inicio_mes(dia), compresion), [_linea(m) for m in medidas], compresion)
+                # Solo se borra lo archivado: una lectura con fecha atrasada que llegue
+                # durante la copia queda para la siguiente ejecución
+                borradas_dia = almacen.borrar_ids([m["_id"] for m in medidas])
+                borradas += borradas_dia
+                if borradas_dia != len(medidas):
+                    print(f"[WARN] retencion: sensor {sensor_id}, dia {dia.date()}: {len(medidas)} archivadas "
+                          f"y {borradas_dia} borradas; se detiene este sensor para revisarlo")
+                    break
+        dia = siguiente
+    return archivadas, borradas
+
+
+def aplicar_retencion(dias=None, compresion=None, simular=False):
+    """Archiva las lecturas de todos los sensores más antiguas que `dias` días.
+
+    Sin argumentos usa RETENCION_DIAS y ARCHIVO_COMPRESION. Retorna
+    {"corte", "archivadas", "borradas", "sensores"}.
+    """
+    dias = RETENCION_DIAS if dias is None else dias
+    compresion = compresion or ARCHIVO_COMPRESION
+    if dias <= 0:
+        raise ValueError("La retención está desactivada: indique un número de días mayor que 0")
+    if compresion not in EXTENSIONES:
+        raise ValueError(f"Compresión inválida: {compresion}. Opciones: {', '.join(EXTENSIONES)}")
+    if compresion == "zstd" and zstandard is None:
+        raise RuntimeError("ARCHIVO_COMPRESION=zstd requiere el paquete zstandard")
+    if almacen.coleccion() is None:
+        raise RuntimeError("Conexión a la base de datos no disponible")
+
+    corte = fecha_corte(dias)
+    resultado = {"corte": corte, "archivadas": 0, "borradas": 0, "sensores": 0}
+    for sensor_id in almacen.sensores_con_medidas(corte):
+        archivadas, borradas = archivar_sensor(sensor_id, corte, compresion, simular)
+        resultado["archivadas"] += archivadas
+        resultado["borradas"] += borradas
+        resultado["sensores"] += 1
+    if resultado["borradas"]:
+        try:
+            from contadores import registrar_borrado_medidas
+            registrar_borrado_medidas(resultado["borradas"])
+        except Exception as e:
+            log_error(e, "retencion.registrar_borrado_medidas")
+    return resultado
+
+
+def _abrir(ruta):
+    if ruta.suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError(f"Leer {ruta.name} requiere el paquete zstandard")
+        lector = zstandard.ZstdDecompressor().stream_reader(open(ruta, "rb"), read_across_frames=True)
+        return io.TextIOWrapper(lector, encoding="utf-8")
+    # gzip lee de seguido los bloques concatenados
+    return gzip.open(ruta, "rt", encoding="utf-8")
+
+
+def leer_archivo(sensor_id, desde, hasta, campo_id=None):
+    """Lecturas archivadas de un sensor con desde <= timestamp <= hasta, en orden cronológico.
+
+    Cada lectura es {_id, sensor_id, campo_id, valor, timestamp} con ids de
+    MongoDB y timestamp datetime, igual que las de la colección.
+    """
+    mes = _inicio_mes(desde)
+    while mes <= hasta:
+        rutas = [_ruta(sensor_id, mes, c) for c in EXTENSIONES]
+        vistos = set()
+        for ruta in rutas:
+            if not ruta.exists():
+                continue
+            with _abrir(ruta) as archivo:
+                for linea in archivo:
+                    medida = json.loads(linea)
+                    # En modo buckets el _id es "<bucket>:<índice>" y un bucket recortado
+                    # reutiliza índices: la marca de tiempo distingue esas muestras
+                    clave = (medida["_id"], medida["timestamp"])
+                    if clave in vistos:
+                        continue
+                    vistos.add(clave)
+                    if campo_id is not None and medida["campo_id"] != str(campo_id):
+                        continue
+                    timestamp = datetime.fromisoformat(medida["timestamp"])
+                    if desde <= timestamp <= hasta:
+                        yield {
+                            "_id": medida["_id"],
+                            "sensor_id": ObjectId(sensor_id),
+                            "campo_id": ObjectId(medida["campo_id"]),
+                            "valor": medida["valor"],
+                            "timestamp": timestamp,
+                        }
+        mes = (mes + timedelta(days=32)).replace(day=1)
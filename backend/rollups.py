@@ -0,0 +1,238 @@
+"""
+Agregados temporales de medidas (minuto, hora y día)
+Mantiene por cada (sensor_id, campo_id, inicio) el número de lecturas, suma,
+mínimo, máximo y último valor, para que las gráficas históricas lean pocos
+documentos pre-agregados en lugar de la serie cruda.
+"""
+
+from datetime import timedelta
+from numbers import Number
+
+from pymongo import UpdateOne, ReplaceOne
+
+from database import get_db
+from almacen_medidas import almacen
+
+# Resolución -> (segundos por intervalo, colección), de la más fina a la más gruesa
+RESOLUCIONES = {
+    "minuto": (60, "medidas_minuto"),
+    "hora": (3600, "medidas_hora"),
+    "dia": (86400, "medidas_dia"),
+}
+
+
+def truncar(timestamp, resolucion):
+    """Retorna el inicio del intervalo de la resolución que contiene el timestamp."""
+    if resolucion == "minuto":
+        return timestamp.replace(second=0, microsecond=0)
+    if resolucion == "hora":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _es_numerico(valor):
+    return isinstance(valor, Number) and not isinstance(valor, bool)
+
+
+def _acumular(grupos, clave, count, suma, minimo, maximo, ultimo, ultimo_ts):
+    actual = grupos.get(clave)
+    if actual is None:
+        grupos[clave] = [count, suma, minimo, maximo, ultimo, ultimo_ts]
+        return
+    actual[0] += count
+    actual[1] += suma
+    actual[2] = min(actual[2], minimo)
+    actual[3] = max(actual[3], maximo)
+    if ultimo_ts >= actual[5]:
+        actual[4], actual[5] = ultimo, ultimo_ts
+
+
+def operaciones_rollups(documentos):
+    """Genera, por colección de agregados, los upserts incrementales de un lote.
+
+    Los valores no numéricos (booleanos, textos) no se agregan.
+    """
+    operaciones = {}
+    for resolucion, (_, coleccion) in RESOLUCIONES.items():
+        grupos = {}
+        for doc in documentos:
+            valor = doc["valor"]
+            if not _es_numerico(valor):
+                continue
+            clave = (doc["sensor_id"], doc["campo_id"], truncar(doc["timestamp"], resolucion))
+            _acumular(grupos, clave, 1, valor, valor, valor, valor, doc["timestamp"])
+
+        for (sensor_id, campo_id, inicio), (count, suma, minimo, maximo, ultimo, ultimo_ts) in grupos.items():
+            es_mas_reciente = {"$gte": [ultimo_ts, {"$ifNull": ["$ultimo_ts", ultimo_ts]}]}
+            operaciones.setdefault(coleccion, []).append(UpdateOne(
+                {"sensor_id": sensor_id, "campo_id": campo_id, "inicio": inicio},
+                [{"$set": {
+                    "count": {"$add": [{"$ifNull": ["$count", 0]}, count]},
+                    "suma": {"$add": [{"$ifNull": ["$suma", 0]}, suma]},
+                    "min": {"$min": ["$min", minimo]},
+                    "max": {"$max": ["$max", maximo]},
+                    "ultimo": {"$cond": [es_mas_reciente, ultimo, "$ultimo"]},
+                    "ultimo_ts": {"$max": ["$ultimo_ts", ultimo_ts]},
+                }}],
+                upsert=True
+            ))
+    return operaciones
+
+
+def actualizar_rollups(documentos):
+    """Aplica un lote de medidas a las colecciones de agregados."""
+    db = get_db()
+    if db is None:
+        return
+    for coleccion, operaciones in operaciones_rollups(documentos).items():
+        db[coleccion].bulk_write(operaciones, ordered=False)
+
+
+def borrar_rollups_sensor(sensor_id):
+    """Elimina los agregados de un sensor (al borrarlo definitivamente)."""
+    db = get_db()
+    if db is None:
+        return
+    for _, coleccion in RESOLUCIONES.values():
+        db[coleccion].delete_many({"sensor_id": sensor_id})
+
+
+def elegir_resolucion(desde, hasta, puntos):
+    """Elige la resolución más fina cuyo número de intervalos no supera `puntos`.
+
+    Si ninguna cabe en el presupuesto se usa la más gruesa (día).
+    """
+    segundos_rango = max((hasta - desde).total_seconds(), 1)
+    for resolucion, (segundos, _) in RESOLUCIONES.items():
+        if segundos_rango / segundos <= puntos:
+            return resolucion
+    return "dia"
+
+
+def obtener_serie(sensor_id, campo_id, desde, hasta, resolucion):
+    """Retorna los agregados de un sensor/campo en el rango, en orden cronológico."""
+    db = get_db()
+    _, coleccion = RESOLUCIONES[resolucion]
+    cursor = db[coleccion].find(
+        {
+            "sensor_id": sensor_id,
+            "campo_id": campo_id,
+            "inicio": {"$gte": truncar(desde, resolucion), "$lte": hasta},
+        },
+        {"_id": 0, "inicio": 1, "count": 1, "suma": 1, "min": 1, "max": 1, "ultimo": 1}
+    ).sort("inicio", 1)
+    return [
+        {
+            "timestamp": r["inicio"].isoformat(),
+            "count": r["count"],
+            "min": r["min"],
+            "max": r["max"],
+            "avg": r["suma"] / r["count"] if r["count"] else None,
+            "ultimo": r["ultimo"],
+        }
+        for r in cursor
+    ]
+
+
+def _escribir_reemplazos(coleccion, grupos, tam_lote):
+    escritos = 0
+    lote = []
+    for (sensor_id, campo_id, inicio), (count, suma, minimo, maximo, ultimo, ultimo_ts) in grupos:
+        clave = {"sensor_id": sensor_id, "campo_id": campo_id, "inicio": inicio}
+        lote.append(ReplaceOne(clave, dict(
+            clave, count=count, suma=suma, min=minimo, max=maximo, ultimo=ultimo, ultimo_ts=ultimo_ts
+        ), upsert=True))
+        if len(lote) >= tam_lote:
+            coleccion.bulk_write(lote, ordered=False)
+            escritos += len(lote)
+            lote = []
+    if lote:
+        coleccion.bulk_write(lote, ordered=False)
+        escritos += len(lote)
+    return escritos
+
+
+def reconstruir_rollups(desde=None, hasta=None, tam_lote=1000):
+    """Recalcula los agregados a partir de la colección de medidas.
+
+    Los minutos se calculan desde las medidas crudas; las horas desde los
+    minutos y los días desde las horas. El rango se amplía a días completos
+    (desde hacia atrás, hasta hacia adelante) para no reemplazar una hora o un
+    día con solo parte de sus lecturas, y los agregados del rango se borran
+    antes de reescribirlos para que no queden intervalos sin lecturas.
+
+    El borrado se limita además al rango que cubren las medidas crudas
+    (primera y última lectura, truncadas a cada resolución): los agregados de
+    periodos ya archivados por retencion.py no se pueden recalcular y se
+    conservan. Retorna {resolucion: documentos}.
+    """
+    db = get_db()
+    medidas_collection = almacen.coleccion()
+    if db is None or medidas_collection is None:
+        raise RuntimeError("Conexión a la base de datos no disponible")
+
+    primero, ultimo = almacen.primer_timestamp(), almacen.ultimo_timestamp()
+    if primero is None:
+        # Sin medidas crudas no hay nada que recalcular ni que borrar
+        return {resolucion: 0 for resolucion in RESOLUCIONES}
+
+    filtro = {}
+    if desde or hasta:
+        filtro["timestamp"] = {}
+        if desde:
+            filtro["timestamp"]["$gte"] = truncar(desde, "dia")
+        if hasta:
+            fin = truncar(hasta, "dia")
+            filtro["timestamp"]["$lt"] = fin if fin == hasta else fin + timedelta(days=1)
+
+    pipeline = almacen.etapas_consulta(filtro, orden=1) + [
+        {"$match": {"valor": {"$type": ["double", "int", "long", "decimal"]}}},
+        {"$group": {
+            "_id": {
+                "sensor_id": "$sensor_id",
+                "campo_id": "$campo_id",
+                "inicio": {"$dateTrunc": {"date": "$timestamp", "unit": "minute"}},
+            },
+            "count": {"$sum": 1},
+            "suma": {"$sum": "$valor"},
+            "min": {"$min": "$valor"},
+            "max": {"$max": "$valor"},
+            "ultimo": {"$last": "$valor"},
+            "ultimo_ts": {"$last": "$timestamp"},
+        }},
+    ]
+    resultado = {}
+    grupos_minuto = (
+        ((g["_id"]["sensor_id"], g["_id"]["campo_id"], g["_id"]["inicio"]),
+         (g["count"], g["suma"], g["min"], g["max"], g["ultimo"], g["ultimo_ts"]))
+        for g in medidas_collection.aggregate(pipeline, allowDiskUse=True)
+    )
+
+    def consulta(resolucion):
+        """Intervalos de la resolución dentro del rango pedido y cubiertos por medidas crudas."""
+        segundos = RESOLUCIONES[resolucion][0]
+        inicio = truncar(primero, resolucion)
+        fin = truncar(ultimo, resolucion) + timedelta(seconds=segundos)
+        rango = filtro.get("timestamp", {})
+        if "$gte" in rango:
+            inicio = max(inicio, rango["$gte"])
+        if "$lt" in rango:
+            fin = min(fin, rango["$lt"])
+        return {"inicio": {"$gte": inicio, "$lt": fin}}
+
+    db[RESOLUCIONES["minuto"][1]].delete_many(consulta("minuto"))
+    resultado["minuto"] = _escribir_reemplazos(db[RESOLUCIONES["minuto"][1]], grupos_minuto, tam_lote)
+
+    # Las horas se derivan de los minutos recién escritos y los días de las
+    # horas; en los bordes del rango entran también los intervalos conservados
+    anterior = RESOLUCIONES["minuto"][1]
+    for resolucion in ("hora", "dia"):
+        grupos = {}
+        for r in db[anterior].find(consulta(resolucion)):
+            clave = (r["sensor_id"], r["campo_id"], truncar(r["inicio"], resolucion))
+            _acumular(grupos, clave, r["count"], r["suma"], r["min"], r["max"], r["ultimo"], r["ultimo_ts"])
+        anterior = RESOLUCIONES[resolucion][1]
+        db[anterior].delete_many(consulta(resolucion))
+        resultado[resolucion] = _escribir_reemplazos(db[anterior], grupos.items(), tam_lote)
+    return resultado
+
@@ -4,6 +4,12 @@ from datetime import datetime
 
 # Importar desde database en lugar de servidor (EVITA CIRCULAR IMPORT)
 from database import get_sensores_collection, get_medidas_collection, log_error
+from catalogo import invalidar_catalogo
+from versiones import condicional, marcar_cambio
+from ultimas_medidas import borrar_ultimas_sensor
+from rollups import borrar_rollups_sensor
+from almacen_medidas import almacen
+from contadores import registrar_borrado_medidas
 
 def validar_booleano(valor, campo_nombre="activo", valor_defecto=True):
     """
@@ -38,10 +44,6 @@ def validar_booleano(valor, campo_nombre="activo", valor_defecto=True):
 
 sensores_bp = Blueprint('sensores', __name__)
 
-# Obtener colecciones desde database
-sensores_collection = get_sensores_collection()
-medidas_collection = get_medidas_collection()
-
 def convertir_sensor_a_json(sensor):
     """Convierte un documento de sensor de MongoDB a JSON serializable"""
     if not sensor:
@@ -80,6 +82,7 @@ def convertir_sensor_a_json(sensor):
 @sensores_bp.route('/agregar_sensor', methods=['POST'])
 def agregar_sensor():
     """Agrega o actualiza un sensor con sus campos. Espera JSON con sensor, tipo_sensor, activo, campos."""
+    sensores_collection = get_sensores_collection()
     if sensores_collection is None:
         return jsonify({"error": "Conexión a la base de datos no disponible"}), 503
     try:
@@ -180,10 +183,15 @@ def agregar_sensor():
     except Exception as e:
         log_error(e, "agregar_sensor")
         return jsonify({"error": str(e)}), 500
+    finally:
+        # Incluso una actualización parcial pudo modificar el catálogo
+        invalidar_catalogo()
+        marcar_cambio("sensores")
 
 @sensores_bp.route('/editar_sensor/<string:sensor_id>', methods=['PUT'])
 def editar_sensor(sensor_id):
     """Edita un sensor existente por ID. Puede activar/desactivar o actualizar nombre, tipo y campos."""
+    sensores_collection = get_sensores_collection()
     if sensores_collection is None:
         return jsonify({"error": "Conexión a la base de datos no disponible"}), 503
     try:
@@ -262,17 +270,30 @@ def editar_sensor(sensor_id):
     except Exception as e:
         log_error(e, "editar_sensor")
         return jsonify({"error": str(e)}), 500
+    finally:
+        invalidar_catalogo()
+        marcar_cambio("sensores")
 
 @sensores_bp.route('/eliminar_sensor_definitivo/<string:sensor_id>', methods=['DELETE'])
 def eliminar_sensor_definitivo(sensor_id):
     """Elimina definitivamente un sensor y todas sus medidas asociadas."""
+    medidas_collection = get_medidas_collection()
+    sensores_collection = get_sensores_collection()
     if sensores_collection is None:
         return jsonify({"error": "Conexión a la base de datos no disponible"}), 503
     try:
         obj_id = ObjectId(sensor_id)
         if medidas_collection is not None:
-            medidas_collection.delete_many({"sensor_id": obj_id})
+            borradas = almacen.borrar_sensor(obj_id)
+            try:
+                registrar_borrado_medidas(borradas)
+            except Exception as e:
+                log_error(e, "eliminar_sensor_definitivo.registrar_borrado_medidas")
+        borrar_ultimas_sensor(obj_id)
+        borrar_rollups_sensor(obj_id)
         result = sensores_collection.delete_one({"_id": obj_id})
+        invalidar_catalogo()
+        marcar_cambio("sensores", "medidas")
         if result.deleted_count == 0:
             return jsonify({"error": "Sensor no encontrado"}), 404
         return jsonify({"status": "ok", "mensaje": f"Sensor {sensor_id} y sus medidas eliminados definitivamente"})
@@ -281,8 +302,10 @@ def eliminar_sensor_definitivo(sensor_id):
         return jsonify({"error": str(e)}), 500
 
 @sensores_bp.route('/listar_sensores_campos', methods=['GET'])
+@condicional("sensores")
 def listar_sensores_campos():
     """Lista todos los sensores con sus campos, convirtiendo a formato JSON serializable."""
+    sensores_collection = get_sensores_collection()
     if sensores_collection is None:
         return jsonify({"error": "Conexión a la base de datos no disponible"}), 503
     try:
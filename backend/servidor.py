@@ -1,74 +1,36 @@
 import os
 import sys
-from flask import Flask, jsonify, json
+from flask import Flask, jsonify
 from flask_cors import CORS
-from bson import ObjectId
 
 # Importar configuración de base de datos
-from database import inicializar_base_datos, get_sensores_collection, get_medidas_collection, get_db, get_client, log_error
+from database import al_conectar, iniciar_supervisor, esperar_conexion, estado_conexion, get_client, log_error
 
 # Importar Blueprints
 from sensores import sensores_bp
 from medidas import medidas_bp
 from votaciones import votaciones_bp
 from dispositivos import dispositivos_bp
+from indices import configurar_base_datos
+from json_proveedor import crear_proveedor
+from metricas import instrumentar
 
 # --- Configuración Inicial ---
 app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
+# Serialización JSON en una sola pasada (ObjectId y fechas incluidos)
+app.json = crear_proveedor(app)
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=["X-Siguiente-Cursor"])
+# Métricas de Prometheus en /metrics (peticiones, comandos de MongoDB, ingesta)
+instrumentar(app)
 
-# Obtener referencias a las colecciones
-sensores_collection = get_sensores_collection()
-medidas_collection = get_medidas_collection()
-db = get_db()
-client = get_client()
-
-# --- Helpers ---
-# Función para convertir ObjectId a string
-def convert_objectids(obj):
-    """Convierte recursivamente ObjectId en strings para serialización JSON."""
-    if isinstance(obj, ObjectId):
-        return str(obj)
-    elif isinstance(obj, list):
-        return [convert_objectids(item) for item in obj]
-    elif isinstance(obj, dict):
-        return {key: convert_objectids(value) for key, value in obj.items()}
-    return obj
-
-# Middleware para procesar respuestas JSON
-@app.after_request
-def after_request(response):
-    """Middleware que convierte ObjectId en respuestas JSON a strings."""
-    if response.is_json:
-        try:
-            data = response.get_json()
-            if data is not None:
-                response.set_data(json.dumps(convert_objectids(data)))
-        except:
-            pass  # Si no es JSON válido, no hacer nada
-    return response
+# La conexión a MongoDB no se espera al importar: un hilo supervisor conecta en
+# segundo plano (al arrancar con `python servidor.py`, en cada worker de
+# gunicorn tras el fork, o con el primer uso de un getter) y reintenta sin
+# límite. Hasta entonces los endpoints responden 503 y /ready también.
 
 # --- Configuración de Índices y Validaciones ---
-def configurar_base_datos():
-    """Configura índices en las colecciones de la base de datos para optimizar consultas."""
-    if db is None:
-        print("[WARN] No se puede configurar base de datos: sin conexion")
-        return
-    try:
-        # Indices para coleccion sensores
-        sensores_collection.create_index([("nombre", 1)], unique=True, background=True)
-        sensores_collection.create_index([("activo", 1), ("tipo_sensor", 1)], background=True)
-        sensores_collection.create_index([("campos.nombre_campo", 1)], background=True)
-        # Indices para coleccion medidas
-        medidas_collection.create_index([("sensor_id", 1), ("campo_id", 1), ("timestamp", -1)], background=True)
-        medidas_collection.create_index([("timestamp", -1)], background=True)
-        medidas_collection.create_index([("sensor_id", 1), ("timestamp", 1)], background=True)
-        print("[OK] Indices de la base de datos creados correctamente")
-    except Exception as e:
-        print(f"[WARN] Error al configurar indices: {e}. La app funcionara pero con rendimiento reducido.")
-
-# Configurar la base de datos
-configurar_base_datos()
+# Colecciones e índices declarados en indices.py, tras cada conexión nueva
+al_conectar(configurar_base_datos)
 
 # --- Registro de Blueprints ---
 app.register_blueprint(sensores_bp)
@@ -81,10 +43,23 @@ def home():
     """Endpoint raíz del servidor que confirma que el API está funcionando."""
     return "Servidor Flask con MongoDB Atlas"
 
+# --- Sonda de disponibilidad ---
+@app.route("/ready")
+def ready():
+    """Responde 200 solo si este proceso tiene conexión a MongoDB y el último ping respondió.
+
+    Para balanceadores y orquestadores: el proceso sigue vivo (GET / responde)
+    aunque no esté listo, y el supervisor reconecta solo.
+    """
+    iniciar_supervisor()
+    estado = estado_conexion()
+    return jsonify(estado), 200 if estado["listo"] else 503
+
 # --- Endpoint de prueba de conexión ---
 @app.route("/test-db")
 def test_db():
     """Endpoint para probar la conexión a la base de datos MongoDB."""
+    client = get_client()
     if client is not None:  # CORRECCIÓN: También aquí usar 'is not None'
         try:
             db_status = client.admin.command('serverStatus')
@@ -117,13 +92,13 @@ if __name__ == "__main__":
     debug_flag = os.getenv("FLASK_DEBUG", "0") == "1"
     allow_without_db = os.getenv("ALLOW_START_WITHOUT_DB", "1") == "1"
 
-    if client is None:
-        if allow_without_db:
-            print("[INFO] Iniciando en MODO DEGRADADO: no hay conexion con la base de datos. Endpoints de escritura/lectura devolveran error 503.")
-        else:
-            print("[ERROR] No hay conexion a la base de datos y ALLOW_START_WITHOUT_DB=0. Abortando inicio.")
-            import time; time.sleep(3)
-            raise SystemExit(1)
+    if allow_without_db:
+        iniciar_supervisor()
+        print("[INFO] Conectando a MongoDB en segundo plano. Hasta que conecte los endpoints de datos devolveran 503 (ver /ready).")
+    elif not esperar_conexion():
+        print("[ERROR] No hay conexion a la base de datos y ALLOW_START_WITHOUT_DB=0. Abortando inicio.")
+        import time; time.sleep(3)
+        raise SystemExit(1)
 
     # Forzar UTF-8 para evitar errores de encoding al correr como servicio
     try:
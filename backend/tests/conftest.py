@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos del backend son planos: se importan desde la carpeta backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,81 @@
+"""
+Pruebas de indices.planificar_indices contra los índices que creaban las
+versiones anteriores del servidor. No requieren MongoDB: la colección es un
+objeto con `name` e `index_information()`.
+"""
+
+from almacen_medidas import AlmacenDocumentos
+from indices import INDICES, planificar_indices
+
+
+class ColeccionFalsa:
+    def __init__(self, nombre, indices):
+        self.name = nombre
+        self._indices = {"_id_": {"key": [("_id", 1)], "v": 2}}
+        for nombre_indice, (claves, opciones) in indices.items():
+            self._indices[nombre_indice] = {"key": claves, "v": 2, **opciones}
+
+    def index_information(self):
+        return self._indices
+
+
+# Índices que creaba configurar_base_datos antes de indices.py
+MEDIDAS_BASE = {
+    "sensor_id_1_campo_id_1_timestamp_-1": ([("sensor_id", 1), ("campo_id", 1), ("timestamp", -1)], {}),
+    "timestamp_-1": ([("timestamp", -1)], {}),
+    "sensor_id_1_timestamp_1": ([("sensor_id", 1), ("timestamp", 1)], {}),
+}
+SENSORES_BASE = {
+    "nombre_1": ([("nombre", 1)], {"unique": True}),
+    "activo_1_tipo_sensor_1": ([("activo", 1), ("tipo_sensor", 1)], {}),
+    "campos.nombre_campo_1": ([("campos.nombre_campo", 1)], {}),
+}
+
+
+def _eliminados(plan):
+    return {nombre: motivo for nombre, _, motivo in plan["eliminar"]}
+
+
+def test_medidas_base_elimina_los_redundantes():
+    plan = planificar_indices(ColeccionFalsa("medidas", MEDIDAS_BASE), AlmacenDocumentos.indices)
+    assert _eliminados(plan) == {
+        "timestamp_-1": "redundante",
+        "sensor_id_1_timestamp_1": "redundante",
+        "sensor_id_1_campo_id_1_timestamp_-1": "redundante",
+    }
+    assert plan["no_declarados"] == []
+    assert [claves for claves, _ in plan["crear"]] == [claves for claves, _ in AlmacenDocumentos.indices]
+
+
+def test_sensores_base_elimina_los_obsoletos():
+    plan = planificar_indices(ColeccionFalsa("sensores", SENSORES_BASE), INDICES["sensores"])
+    assert _eliminados(plan) == {
+        "activo_1_tipo_sensor_1": "obsoleto",
+        "campos.nombre_campo_1": "obsoleto",
+    }
+    assert plan["no_declarados"] == []
+    assert [claves for claves, _ in plan["crear"]] == [[("dispositivo_id", 1), ("activo", 1)]]
+
+
+def test_unico_no_declarado_nunca_se_elimina():
+    # Prefijo de un índice declarado, pero único: puede sostener una restricción
+    existentes = dict(MEDIDAS_BASE, sensor_id_1_campo_id_1=([("sensor_id", 1), ("campo_id", 1)], {"unique": True}))
+    plan = planificar_indices(ColeccionFalsa("medidas", existentes), AlmacenDocumentos.indices)
+    assert "sensor_id_1_campo_id_1" not in _eliminados(plan)
+    assert plan["no_declarados"] == [("sensor_id_1_campo_id_1", (("sensor_id", 1), ("campo_id", 1)))]
+
+
+def test_no_declarado_sin_prefijo_solo_se_informa():
+    existentes = dict(MEDIDAS_BASE, valor_1=([("valor", 1)], {}))
+    plan = planificar_indices(ColeccionFalsa("medidas", existentes), AlmacenDocumentos.indices)
+    assert "valor_1" not in _eliminados(plan)
+    assert plan["no_declarados"] == [("valor_1", (("valor", 1),))]
+
+
+def test_indices_declarados_no_se_tocan():
+    existentes = {
+        "_".join(f"{k}_{v}" for k, v in claves): (claves, opciones)
+        for claves, opciones in AlmacenDocumentos.indices
+    }
+    plan = planificar_indices(ColeccionFalsa("medidas", existentes), AlmacenDocumentos.indices)
+    assert plan == {"crear": [], "eliminar": [], "no_declarados": []}
@@ -0,0 +1,107 @@
+"""
+Último valor por campo de sensor
+Mantiene la colección "ultimas_medidas" con el valor más reciente de cada par
+(sensor_id, campo_id) para que las lecturas de dispositivos no tengan que
+buscar en toda la colección de medidas.
+"""
+
+from pymongo import UpdateOne, ReplaceOne
+
+from database import get_db
+from almacen_medidas import almacen
+
+COLECCION = "ultimas_medidas"
+
+
+def get_ultimas_collection():
+    db = get_db()
+    return db[COLECCION] if db is not None else None
+
+
+def operaciones_ultimas(documentos):
+    """Genera las operaciones de upsert para un lote de documentos de medidas.
+
+    Dentro del lote se conserva solo la lectura más reciente de cada par. La
+    actualización es condicional: una lectura más antigua que la guardada
+    (llegada fuera de orden) no sobrescribe el valor.
+    """
+    recientes = {}
+    for doc in documentos:
+        clave = (doc["sensor_id"], doc["campo_id"])
+        actual = recientes.get(clave)
+        if actual is None or doc["timestamp"] >= actual["timestamp"]:
+            recientes[clave] = doc
+
+    operaciones = []
+    for (sensor_id, campo_id), doc in recientes.items():
+        es_mas_reciente = {"$gte": [doc["timestamp"], {"$ifNull": ["$timestamp", doc["timestamp"]]}]}
+        operaciones.append(UpdateOne(
+            {"sensor_id": sensor_id, "campo_id": campo_id},
+            [{"$set": {
+                "valor": {"$cond": [es_mas_reciente, {"$literal": doc["valor"]}, "$valor"]},
+                "timestamp": {"$cond": [es_mas_reciente, doc["timestamp"], "$timestamp"]},
+            }}],
+            upsert=True
+        ))
+    return operaciones
+
+
+def actualizar_ultimas(documentos):
+    """Actualiza la colección de últimos valores con un lote de medidas."""
+    ultimas_collection = get_ultimas_collection()
+    operaciones = operaciones_ultimas(documentos)
+    if ultimas_collection is None or not operaciones:
+        return
+    ultimas_collection.bulk_write(operaciones, ordered=False)
+
+
+def obtener_ultimas(sensor_ids):
+    """Retorna {(sensor_id, campo_id): {"valor", "timestamp"}} en una sola consulta."""
+    ultimas_collection = get_ultimas_collection()
+    if ultimas_collection is None or not sensor_ids:
+        return {}
+    cursor = ultimas_collection.find(
+        {"sensor_id": {"$in": list(sensor_ids)}},
+        {"_id": 0, "sensor_id": 1, "campo_id": 1, "valor": 1, "timestamp": 1}
+    )
+    return {(u["sensor_id"], u["campo_id"]): u for u in cursor}
+
+
+def borrar_ultimas_sensor(sensor_id):
+    """Elimina los últimos valores de un sensor (al borrarlo definitivamente)."""
+    ultimas_collection = get_ultimas_collection()
+    if ultimas_collection is not None:
+        ultimas_collection.delete_many({"sensor_id": sensor_id})
+
+
+def reconstruir_ultimas(tam_lote=1000):
+    """Recalcula la colección completa a partir de la colección de medidas.
+
+    Retorna el número de pares (sensor, campo) escritos.
+    """
+    medidas_collection = almacen.coleccion()
+    ultimas_collection = get_ultimas_collection()
+    if medidas_collection is None or ultimas_collection is None:
+        raise RuntimeError("Conexión a la base de datos no disponible")
+
+    pipeline = almacen.etapas_consulta({}, orden=None) + [
+        {"$sort": {"sensor_id": 1, "campo_id": 1, "timestamp": -1}},
+        {"$group": {
+            "_id": {"sensor_id": "$sensor_id", "campo_id": "$campo_id"},
+            "valor": {"$first": "$valor"},
+            "timestamp": {"$first": "$timestamp"},
+        }},
+    ]
+    escritos = 0
+    lote = []
+    for grupo in medidas_collection.aggregate(pipeline, allowDiskUse=True):
+        clave = {"sensor_id": grupo["_id"]["sensor_id"], "campo_id": grupo["_id"]["campo_id"]}
+        lote.append(ReplaceOne(clave, dict(clave, valor=grupo["valor"], timestamp=grupo["timestamp"]), upsert=True))
+        if len(lote) >= tam_lote:
+            ultimas_collection.bulk_write(lote, ordered=False)
+            escritos += len(lote)
+            lote = []
+    if lote:
+        ultimas_collection.bulk_write(lote, ordered=False)
+        escritos += len(lote)
+    return escritos
@@ -0,0 +1,173 @@
+"""
+Versiones de recursos y GET condicional (ETag / 304)
+Los endpoints consultados por polling calculan su ETag antes de consultar sus
+colecciones, y responden 304 si coincide con el If-None-Match del cliente.
+
+El ETag sale solo de una huella compartida por todos los procesos (workers de
+gunicorn, ingesta_async.py, ingesta_udp.py, mantenimiento.py), leída de la
+colección "contadores" cada VERSIONES_TTL_S segundos, así que dos workers
+responden el mismo ETag para los mismos datos:
+
+- medidas: total y última lectura del documento de contadores, que todas las
+  vías de ingesta y el borrado por retención ya actualizan;
+- todos los recursos: el documento "versiones", que marcar_cambio incrementa
+  en cada escritura de sensores, dispositivos y votaciones y en las tareas de
+  mantenimiento (reconstrucción de últimos valores, agregados, estadísticas).
+
+Una escritura de este proceso descarta la huella en memoria (la siguiente
+petición la relee); un 304 desactualizado por una escritura de otro proceso
+dura como mucho VERSIONES_TTL_S segundos.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import request, make_response
+
+from database import get_db, log_error
+from contadores import COLECCION as COLECCION_CONTADORES, ID_MEDIDAS
+
+# Si ETAG_VENTANA_S > 0 el ETag cambia además cada tantos segundos, aunque no
+# haya escrituras (red de seguridad si el estado compartido no está disponible)
+ETAG_VENTANA_S = int(os.getenv("ETAG_VENTANA_S", "0"))
+# Segundos que se reutiliza la huella compartida antes de releerla de MongoDB
+VERSIONES_TTL_S = float(os.getenv("VERSIONES_TTL_S", "2"))
+
+RECURSOS = ("medidas", "sensores", "dispositivos", "votaciones")
+ID_VERSIONES = "versiones"
+
+_INICIO = datetime.now(timezone.utc).replace(microsecond=0)
+
+_lock = threading.Lock()
+_versiones = {recurso: 0 for recurso in RECURSOS}
+_modificados = {recurso: _INICIO for recurso in RECURSOS}
+_contadores = {"304": 0, "200": 0}
+_compartido = {"huella": {}, "leido_en": 0.0}
+
+
+def marcar_cambio(*recursos, compartir=True):
+    """Registra una escritura en los recursos indicados.
+
+    Descarta la huella compartida en memoria para que este proceso vea su
+    propia escritura en la siguiente petición. Con `compartir` también incrementa el documento "versiones" para que los
+    demás procesos la vean. La ingesta de medidas usa compartir=False: los
+    contadores de medidas ya cumplen esa función sin una escritura más.
+    """
+    ahora = datetime.now(timezone.utc)
+    with _lock:
+        for recurso in recursos:
+            _versiones[recurso] += 1
+            _modificados[recurso] = ahora
+        _compartido["leido_en"] = 0.0
+    if not compartir:
+        return
+    db = get_db()
+    if db is None:
+        return
+    try:
+        db[COLECCION_CONTADORES].update_one(
+            {"_id": ID_VERSIONES}, {"$inc": {recurso: 1 for recurso in recursos}}, upsert=True
+        )
+    except Exception as e:
+        log_error(e, "versiones.marcar_cambio")
+
+
+def _leer_huella():
+    huella = {}
+    for doc in get_db()[COLECCION_CONTADORES].find({"_id": {"$in": [ID_MEDIDAS, ID_VERSIONES]}}):
+        if doc["_id"] == ID_VERSIONES:
+            for recurso in RECURSOS:
+                huella[recurso] = huella.get(recurso, "") + f"v{doc.get(recurso, 0)}"
+        else:
+            ultima = doc.get("ultima")
+            marca = int(ultima.timestamp() * 1000) if ultima else 0
+            huella["medidas"] = f"t{doc.get('total', 0)}u{marca}" + huella.get("medidas", "")
+    return huella
+
+
+def huella_compartida():
+    """{recurso: texto} con el estado compartido entre procesos, releído cada VERSIONES_TTL_S s."""
+    if time.monotonic() - _compartido["leido_en"] < VERSIONES_TTL_S or get_db() is None:
+        return _compartido["huella"]
+    try:
+        huella = _leer_huella()
+    except Exception as e:
+        log_error(e, "versiones.huella_compartida")
+        huella = _compartido["huella"]
+    ahora = datetime.now(timezone.utc)
+    with _lock:
+        anterior = _compartido["huella"]
+        # Un cambio hecho por otro proceso también mueve Last-Modified
+        for recurso in RECURSOS:
+            if anterior and huella.get(recurso) != anterior.get(recurso):
+                _modificados[recurso] = max(_modificados[recurso], ahora)
+        _compartido["huella"] = huella
+        _compartido["leido_en"] = time.monotonic()
+    return huella
+
+
+def etiqueta(recursos):
+    """ETag de un conjunto de recursos en su versión actual (igual en todos los procesos)."""
+    huella = huella_compartida()
+    partes = [f"{r[0]}{huella.get(r, '0')}" for r in recursos]
+    if ETAG_VENTANA_S > 0:
+        partes.append(str(int(time.time() // ETAG_VENTANA_S)))
+    return "-".join(partes)
+
+
+def ultima_modificacion(recursos):
+    return max(_modificados[r] for r in recursos)
+
+
+def _no_modificado(etag, modificado):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    # Sin ventana If-Modified-Since solo se respeta si el último cambio es de un
+    # segundo anterior (la cabecera no tiene más precisión)
+    if request.if_modified_since and ETAG_VENTANA_S <= 0:
+        return modificado.replace(microsecond=0) < request.if_modified_since
+    return False
+
+
+def condicional(*recursos):
+    """Decorador de GET condicional para endpoints que dependen de `recursos`.
+
+    La versión se lee antes de ejecutar la vista: si una escritura ocurre
+    mientras tanto, la respuesta lleva el ETag anterior y el siguiente GET
+    simplemente vuelve a descargarla.
+    """
+    def decorador(vista):
+        @wraps(vista)
+        def envoltura(*args, **kwargs):
+            # La huella compartida puede leer MongoDB: fuera del lock
+            etag = etiqueta(recursos)
+            with _lock:
+                modificado = ultima_modificacion(recursos)
+            if _no_modificado(etag, modificado):
+                _contadores["304"] += 1
+                respuesta = make_response("", 304)
+            else:
+                respuesta = make_response(vista(*args, **kwargs))
+                if respuesta.status_code != 200:
+                    return respuesta
+                _contadores["200"] += 1
+            respuesta.set_etag(etag)
+            respuesta.last_modified = modificado
+            # El navegador debe revalidar siempre, pero puede reutilizar su copia
+            respuesta.headers["Cache-Control"] = "no-cache"
+            return respuesta
+        return envoltura
+    return decorador
+
+
+def estadisticas_versiones():
+    return {
+        "versiones": dict(_versiones),
+        "respuestas_304": _contadores["304"],
+        "respuestas_200": _contadores["200"],
+        "ventana_s": ETAG_VENTANA_S,
+        "compartido": dict(_compartido["huella"]),
+    }
@@ -5,7 +5,10 @@ Maneja el almacenamiento y gestión de calificaciones de usuarios
 
 from flask import Blueprint, request, jsonify
 from datetime import datetime
-from database import get_db
+from database import get_db, log_error
+from versiones import condicional, marcar_cambio
+from estadisticas_votaciones import registrar_voto, reiniciar_estadisticas, obtener_estadisticas as leer_estadisticas
+from json_proveedor import fechas_http
 
 votaciones_bp = Blueprint('votaciones', __name__)
 
@@ -57,6 +60,12 @@ def guardar_votacion():
         # Guardar en la base de datos
         votaciones_collection = get_votaciones_collection()
         resultado = votaciones_collection.insert_one(votacion)
+        try:
+            registrar_voto(votacion)
+        except Exception as e:
+            # El voto ya quedó guardado; las estadísticas se pueden reconstruir
+            log_error(e, "guardar_votacion.registrar_voto")
+        marcar_cambio('votaciones')
         
         return jsonify({
             'mensaje': 'Votación guardada exitosamente',
@@ -76,6 +85,7 @@ def guardar_votacion():
         }), 500
 
 @votaciones_bp.route('/votaciones', methods=['GET'])
+@condicional('votaciones')
 def obtener_votaciones():
     """
     Obtener todas las votaciones o filtrar por parámetros
@@ -116,6 +126,7 @@ def obtener_votaciones():
         # Convertir ObjectId a string
         for votacion in votaciones:
             votacion['_id'] = str(votacion['_id'])
+            fechas_http(votacion, 'fecha')
         
         return jsonify({
             'total': len(votaciones),
@@ -128,64 +139,18 @@ def obtener_votaciones():
         }), 500
 
 @votaciones_bp.route('/votaciones/estadisticas', methods=['GET'])
+@condicional('votaciones')
 def obtener_estadisticas():
     """
     Obtener estadísticas de las votaciones
+
+    Se leen del documento pre-agregado de votaciones_estadisticas (una sola
+    lectura). Además de los totales globales incluye por_cultivo, por_medio y
+    por_dispositivo, cada uno con total_votaciones, promedio_rating y
+    distribucion.
     """
     try:
-        votaciones_collection = get_votaciones_collection()
-        
-        # Calcular estadísticas usando agregación
-        pipeline = [
-            {
-                '$group': {
-                    '_id': None,
-                    'total_votaciones': {'$sum': 1},
-                    'promedio_rating': {'$avg': '$rating'},
-                    'rating_1': {
-                        '$sum': {'$cond': [{'$eq': ['$rating', 1]}, 1, 0]}
-                    },
-                    'rating_2': {
-                        '$sum': {'$cond': [{'$eq': ['$rating', 2]}, 1, 0]}
-                    },
-                    'rating_3': {
-                        '$sum': {'$cond': [{'$eq': ['$rating', 3]}, 1, 0]}
-                    },
-                    'rating_4': {
-                        '$sum': {'$cond': [{'$eq': ['$rating', 4]}, 1, 0]}
-                    },
-                    'rating_5': {
-                        '$sum': {'$cond': [{'$eq': ['$rating', 5]}, 1, 0]}
-                    }
-                }
-            }
-        ]
-        
-        resultado = list(votaciones_collection.aggregate(pipeline))
-        
-        if not resultado:
-            return jsonify({
-                'total_votaciones': 0,
-                'promedio_rating': 0,
-                'distribucion': {
-                    '1': 0, '2': 0, '3': 0, '4': 0, '5': 0
-                }
-            }), 200
-        
-        stats = resultado[0]
-        
-        return jsonify({
-            'total_votaciones': stats['total_votaciones'],
-            'promedio_rating': round(stats['promedio_rating'], 2),
-            'distribucion': {
-                '1': stats['rating_1'],
-                '2': stats['rating_2'],
-                '3': stats['rating_3'],
-                '4': stats['rating_4'],
-                '5': stats['rating_5']
-            }
-        }), 200
-        
+        return jsonify(leer_estadisticas()), 200
     except Exception as e:
         return jsonify({
             'error': f'Error al obtener estadísticas: {str(e)}'
@@ -200,12 +165,19 @@ def eliminar_votacion(votacion_id):
         from bson import ObjectId
         votaciones_collection = get_votaciones_collection()
         
-        resultado = votaciones_collection.delete_one({'_id': ObjectId(votacion_id)})
+        # find_one_and_delete retorna el voto borrado para descontarlo de las estadísticas
+        votacion = votaciones_collection.find_one_and_delete({'_id': ObjectId(votacion_id)})
         
-        if resultado.deleted_count == 0:
+        if votacion is None:
             return jsonify({
                 'error': 'Votación no encontrada'
             }), 404
+
+        try:
+            registrar_voto(votacion, signo=-1)
+        except Exception as e:
+            log_error(e, "eliminar_votacion.registrar_voto")
+        marcar_cambio('votaciones')
         
         return jsonify({
             'mensaje': 'Votación eliminada exitosamente'
@@ -222,6 +194,8 @@ def eliminar_todas_las_votaciones():
     try:
         votaciones_collection = get_votaciones_collection()
         resultado = votaciones_collection.delete_many({})
+        reiniciar_estadisticas()
+        marcar_cambio('votaciones')
 
         return jsonify({
             'mensaje': 'Todas las votaciones fueron eliminadas exitosamente',
@@ -0,0 +1,19 @@
+"""
+Punto de entrada WSGI para producción
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+`python servidor.py` sigue siendo el arranque de desarrollo (y el de Windows,
+donde gunicorn no funciona).
+"""
+
+from database import esperar_conexion, ALLOW_START_WITHOUT_DB
+from servidor import app
+
+# Con ALLOW_START_WITHOUT_DB=1 (por defecto) no se espera: cada worker arranca su
+# supervisor y conecta en segundo plano (hook post_worker_init de gunicorn.conf.py)
+if not ALLOW_START_WITHOUT_DB and not esperar_conexion():
+    # Bajo gunicorn esto detiene el arranque en lugar de levantar workers sin base de datos
+    raise SystemExit("[ERROR] No hay conexion a la base de datos y ALLOW_START_WITHOUT_DB=0")
+
+__all__ = ["app"]
@@ -1,4 +1,4 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { SensorCard } from "./SensorCard";
 import { Alert, AlertDescription } from "./ui/alert";
 import { Badge } from "./ui/badge";
@@ -37,6 +37,7 @@ export function DashboardData() {
   });
 
   const API_BASE_URL = "http://200.91.211.22:8860";
+  const medidasRef = useRef<Medida[]>([]);
 
   const checkServerConnection = async () => {
     try {
@@ -58,130 +59,151 @@ export function DashboardData() {
 
       // Obtener medidas más recientes
       const medidasResponse = await fetch(`${API_BASE_URL}/medidas`);
-      const medidas: Medida[] = await medidasResponse.json();
+      medidasRef.current = await medidasResponse.json();
+      procesarMedidas(medidasRef.current);
+    } catch (error) {
+      console.error("Error loading dashboard data:", error);
+      setDashboardData(prev => ({ 
+        ...prev, 
+        connected: false,
+        sensorData: []
+      }));
+    }
+  };
 
-      // Procesar los datos para el dashboard
-      const sensorMap = new Map();
+  // Construye las tarjetas a partir de las medidas (de la más reciente a la más antigua)
+  const procesarMedidas = (medidas: Medida[]) => {
+    // Procesar los datos para el dashboard
+    const sensorMap = new Map();
+    
+    medidas.forEach(medida => {
+      const key = medida.sensor;
+      if (!sensorMap.has(key)) {
+        sensorMap.set(key, {
+          sensor: key,
+          campos: new Map(),
+          lastUpdate: medida.fecha
+        });
+      }
       
-      medidas.forEach(medida => {
-        const key = medida.sensor;
-        if (!sensorMap.has(key)) {
-          sensorMap.set(key, {
-            sensor: key,
-            campos: new Map(),
-            lastUpdate: medida.fecha
-          });
-        }
-        
+      // Conservar el valor más reciente de cada campo
+      if (!sensorMap.get(key).campos.has(medida.nombre_campo)) {
         sensorMap.get(key).campos.set(medida.nombre_campo, {
           valor: medida.valor,
           fecha: medida.fecha
         });
-      });
-
-      // Convertir a formato para SensorCard
-      const sensorData = Array.from(sensorMap.values()).map(sensor => {
-        const campos = sensor.campos;
-        
-        // Mapear campos comunes a sensores del dashboard
-        const getSensorCardData = () => {
-          if (campos.has("humedad_suelo")) {
-            const humedad = parseFloat(campos.get("humedad_suelo").valor);
-            return {
-              title: "Humedad del Suelo",
-              value: humedad.toFixed(1),
-              unit: "%",
-              status: humedad >= 60 && humedad <= 80 ? "good" : humedad >= 40 ? "warning" : "danger",
-              icon: Droplets,
-              description: `Sensor: ${sensor.sensor}`
-            };
-          } else if (campos.has("temperatura")) {
-            const temp = parseFloat(campos.get("temperatura").valor);
-            return {
-              title: "Temperatura",
-              value: temp.toFixed(1),
-              unit: "°C",
-              status: temp >= 20 && temp <= 30 ? "good" : temp >= 15 && temp <= 35 ? "warning" : "danger",
-              icon: Thermometer,
-              description: `Sensor: ${sensor.sensor}`
-            };
-          } else if (campos.has("ph_nivel")) {
-            const ph = parseFloat(campos.get("ph_nivel").valor);
-            return {
-              title: "pH del Suelo",
-              value: ph.toFixed(1),
-              unit: "",
-              status: ph >= 6.0 && ph <= 7.5 ? "good" : ph >= 5.5 && ph <= 8.0 ? "warning" : "danger",
-              icon: TestTube,
-              description: `Sensor: ${sensor.sensor}`
-            };
-          } else if (campos.has("nitrogeno")) {
-            const nitrogeno = parseFloat(campos.get("nitrogeno").valor);
-            return {
-              title: "Nitrógeno",
-              value: nitrogeno.toFixed(0),
-              unit: "ppm",
-              status: nitrogeno >= 40 && nitrogeno <= 80 ? "good" : nitrogeno >= 20 ? "warning" : "danger",
-              icon: TestTube,
-              description: `Sensor: ${sensor.sensor}`
-            };
-          } else {
-            // Sensor genérico
-            const primerCampo = Array.from(campos.entries())[0] as [string, { valor: string }];
-            return {
-              title: primerCampo[0].replace(/_/g, ' ').toUpperCase(),
-              value: primerCampo[1].valor.toString(),
-              unit: "",
-              status: "good" as const,
-              icon: MapPin,
-              description: `Sensor: ${sensor.sensor}`
-            };
-          }
-        };
-
-        return getSensorCardData();
-      });
+      }
+    });
 
-      // Agregar sensores de estado del sistema
-      const systemSensors = [
-        {
-          title: "Conectividad",
-          value: "100",
-          unit: "%",
-          status: "good" as const,
-          icon: Wifi,
-          description: "Conexión al servidor activa"
-        },
-        {
-          title: "Sensores Activos",
-          value: sensorData.length.toString(),
-          unit: "",
-          status: sensorData.length > 0 ? "good" as const : "warning" as const,
-          icon: Activity,
-          description: `${sensorData.length} sensores reportando datos`
+    // Convertir a formato para SensorCard
+    const sensorData = Array.from(sensorMap.values()).map(sensor => {
+      const campos = sensor.campos;
+      
+      // Mapear campos comunes a sensores del dashboard
+      const getSensorCardData = () => {
+        if (campos.has("humedad_suelo")) {
+          const humedad = parseFloat(campos.get("humedad_suelo").valor);
+          return {
+            title: "Humedad del Suelo",
+            value: humedad.toFixed(1),
+            unit: "%",
+            status: humedad >= 60 && humedad <= 80 ? "good" : humedad >= 40 ? "warning" : "danger",
+            icon: Droplets,
+            description: `Sensor: ${sensor.sensor}`
+          };
+        } else if (campos.has("temperatura")) {
+          const temp = parseFloat(campos.get("temperatura").valor);
+          return {
+            title: "Temperatura",
+            value: temp.toFixed(1),
+            unit: "°C",
+            status: temp >= 20 && temp <= 30 ? "good" : temp >= 15 && temp <= 35 ? "warning" : "danger",
+            icon: Thermometer,
+            description: `Sensor: ${sensor.sensor}`
+          };
+        } else if (campos.has("ph_nivel")) {
+          const ph = parseFloat(campos.get("ph_nivel").valor);
+          return {
+            title: "pH del Suelo",
+            value: ph.toFixed(1),
+            unit: "",
+            status: ph >= 6.0 && ph <= 7.5 ? "good" : ph >= 5.5 && ph <= 8.0 ? "warning" : "danger",
+            icon: TestTube,
+            description: `Sensor: ${sensor.sensor}`
+          };
+        } else if (campos.has("nitrogeno")) {
+          const nitrogeno = parseFloat(campos.get("nitrogeno").valor);
+          return {
+            title: "Nitrógeno",
+            value: nitrogeno.toFixed(0),
+            unit: "ppm",
+            status: nitrogeno >= 40 && nitrogeno <= 80 ? "good" : nitrogeno >= 20 ? "warning" : "danger",
+            icon: TestTube,
+            description: `Sensor: ${sensor.sensor}`
+          };
+        } else {
+          // Sensor genérico
+          const primerCampo = Array.from(campos.entries())[0] as [string, { valor: string }];
+          return {
+            title: primerCampo[0].replace(/_/g, ' ').toUpperCase(),
+            value: primerCampo[1].valor.toString(),
+            unit: "",
+            status: "good" as const,
+            icon: MapPin,
+            description: `Sensor: ${sensor.sensor}`
+          };
         }
-      ];
+      };
 
-      setDashboardData({
-        connected: true,
-        sensorData: [...sensorData, ...systemSensors],
-        lastUpdate: new Date().toLocaleString()
-      });
+      return getSensorCardData();
+    });
 
-    } catch (error) {
-      console.error("Error loading dashboard data:", error);
-      setDashboardData(prev => ({ 
-        ...prev, 
-        connected: false,
-        sensorData: []
-      }));
-    }
+    // Agregar sensores de estado del sistema
+    const systemSensors = [
+      {
+        title: "Conectividad",
+        value: "100",
+        unit: "%",
+        status: "good" as const,
+        icon: Wifi,
+        description: "Conexión al servidor activa"
+      },
+      {
+        title: "Sensores Activos",
+        value: sensorData.length.toString(),
+        unit: "",
+        status: sensorData.length > 0 ? "good" as const : "warning" as const,
+        icon: Activity,
+        description: `${sensorData.length} sensores reportando datos`
+      }
+    ];
+
+    setDashboardData({
+      connected: true,
+      sensorData: [...sensorData, ...systemSensors],
+      lastUpdate: new Date().toLocaleString()
+    });
   };
 
   useEffect(() => {
     loadDashboardData();
-    const interval = setInterval(loadDashboardData, 5000); // Actualizar cada 5 segundos
-    return () => clearInterval(interval);
+
+    // Las lecturas nuevas llegan por SSE en lugar de consultar cada 5 segundos
+    const eventos = new EventSource(`${API_BASE_URL}/eventos`);
+    eventos.addEventListener('medida', (evento) => {
+      const medida = JSON.parse((evento as MessageEvent).data);
+      if (!medida.nombre_campo) return;
+      medidasRef.current = [{ ...medida, fecha: medida.timestamp }, ...medidasRef.current].slice(0, 100);
+      procesarMedidas(medidasRef.current);
+    });
+    // Si se pierde la conexión se marca desconectado; al reconectar se recargan las medidas
+    eventos.onerror = () => setDashboardData(prev => ({ ...prev, connected: false }));
+    let conectadoAntes = false;
+    eventos.onopen = () => {
+      if (conectadoAntes) loadDashboardData();
+      conectadoAntes = true;
+    };
+    return () => eventos.close();
   }, []);
 
   return (
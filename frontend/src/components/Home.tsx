@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useMemo } from 'react';
+import React, { useState, useEffect, useMemo, useRef } from 'react';
 import { Sprout, Wheat, Droplet, Heart, Cloud, Leaf, Check, Star, Thermometer, Zap, FlaskConical, Activity } from 'lucide-react';
 import { Button } from './ui/button';
 import { Skeleton } from './ui/skeleton';
@@ -123,6 +123,8 @@ export default function Home() {
   const [isInitialLoading, setIsInitialLoading] = useState(true);
   const [isUpdatingDevice, setIsUpdatingDevice] = useState<Partial<Record<DeviceId, boolean>>>({});
   const [dataAge, setDataAge] = useState<Record<DeviceId, Date | null>>({ 1: null, 2: null, 3: null, 4: null });
+  // Relación id de MongoDB del dispositivo -> número lógico (se llena con el resumen)
+  const deviceIdsRef = useRef<Record<string, DeviceId>>({});
 
   const API_BASE_URL = "http://200.91.211.22:8860";
 
@@ -134,6 +136,18 @@ export default function Home() {
     setSelectedCrop(null);
   }, []);
 
+  // Aplica la respuesta de un dispositivo al estado (reutiliza los últimos datos si viene vacía)
+  const applyDeviceData = (deviceId: DeviceId, data: any) => {
+    if (data.datos && Object.keys(data.datos).length > 0) {
+      setSensorData(prev => ({ ...prev, [deviceId]: data.datos }));
+      setLastSensorData(prev => ({ ...prev, [deviceId]: data.datos }));
+      setDataAge(prev => ({ ...prev, [deviceId]: new Date() }));
+    } else if (lastSensorData[deviceId]) {
+      // Si la respuesta no trae datos nuevos, reutilizar los últimos registrados
+      setSensorData(prev => ({ ...prev, [deviceId]: lastSensorData[deviceId] }));
+    }
+  };
+
   // Función para obtener datos del dispositivo
   const fetchDeviceData = (deviceId: DeviceId) => {
     setIsUpdatingDevice(prev => ({ ...prev, [deviceId]: true }));
@@ -144,16 +158,7 @@ export default function Home() {
         }
         return res.json();
       })
-      .then(data => {
-        if (data.datos && Object.keys(data.datos).length > 0) {
-          setSensorData(prev => ({ ...prev, [deviceId]: data.datos }));
-          setLastSensorData(prev => ({ ...prev, [deviceId]: data.datos }));
-          setDataAge(prev => ({ ...prev, [deviceId]: new Date() }));
-        } else if (lastSensorData[deviceId]) {
-          // Si la respuesta no trae datos nuevos, reutilizar los últimos registrados
-          setSensorData(prev => ({ ...prev, [deviceId]: lastSensorData[deviceId] }));
-        }
-      })
+      .then(data => applyDeviceData(deviceId, data))
       .catch(err => {
         console.error(`Error fetching data for device ${deviceId}:`, err);
         // Si hay error pero tenemos datos previos, los conservamos
@@ -167,17 +172,54 @@ export default function Home() {
       });
   };
 
+  // Obtiene los datos de todos los dispositivos en una sola petición
+  const fetchAllDevicesData = () => {
+    fetch(`${API_BASE_URL}/dispositivos/resumen`)
+      .then(res => {
+        if (!res.ok) {
+          throw new Error(`HTTP error! status: ${res.status}`);
+        }
+        return res.json();
+      })
+      .then(data => {
+        (data.dispositivos || []).forEach((dispositivo: any) => {
+          if ([1, 2, 3, 4].includes(dispositivo.dispositivo)) {
+            deviceIdsRef.current[dispositivo.dispositivo_mongo_id] = dispositivo.dispositivo as DeviceId;
+            applyDeviceData(dispositivo.dispositivo as DeviceId, dispositivo);
+          }
+        });
+      })
+      .catch(err => {
+        console.error('Error fetching devices summary:', err);
+      })
+      .finally(() => {
+        setIsInitialLoading(false);
+      });
+  };
+
   // Cargar datos de TODOS los dispositivos al inicio para análisis de cultivos
   useEffect(() => {
     // Cargar datos iniciales de todos los dispositivos
-    ( [1, 2, 3, 4] as DeviceId[]).forEach(id => fetchDeviceData(id));
-    
-    // Configurar polling cada 30 segundos para todos los dispositivos
-    const intervalId = setInterval(() => {
-      ( [1, 2, 3, 4] as DeviceId[]).forEach(id => fetchDeviceData(id));
-    }, 30000);
-    
-    return () => clearInterval(intervalId);
+    fetchAllDevicesData();
+
+    // Las lecturas nuevas llegan por SSE en lugar de consultar cada 30 segundos
+    const eventos = new EventSource(`${API_BASE_URL}/eventos`);
+    eventos.addEventListener('medida', (evento) => {
+      const medida = JSON.parse((evento as MessageEvent).data);
+      const deviceId = deviceIdsRef.current[medida.dispositivo_id];
+      if (!deviceId || !medida.nombre_campo) return;
+      setSensorData(prev => ({ ...prev, [deviceId]: { ...prev[deviceId], [medida.nombre_campo]: medida.valor } }));
+      setLastSensorData(prev => ({ ...prev, [deviceId]: { ...prev[deviceId], [medida.nombre_campo]: medida.valor } }));
+      setDataAge(prev => ({ ...prev, [deviceId]: new Date() }));
+    });
+    // Tras una reconexión se pudieron perder lecturas: resincronizar con el resumen
+    let conectadoAntes = false;
+    eventos.onopen = () => {
+      if (conectadoAntes) fetchAllDevicesData();
+      conectadoAntes = true;
+    };
+
+    return () => eventos.close();
   }, []);
 
   // Fetch real sensor data when device is selected (polling más frecuente para el seleccionado)
@@ -129,8 +129,21 @@ export function SensorManagement() {
   useEffect(() => {
     cargarDatos();
     cargarMedidas();
-    const intervalo = setInterval(cargarMedidas, 10000); // 10 segundos para no sobrecargar
-    return () => clearInterval(intervalo);
+
+    // Las lecturas nuevas llegan por SSE en lugar de consultar cada 10 segundos
+    const eventos = new EventSource(`${API_BASE_URL}/eventos`);
+    eventos.addEventListener('medida', (evento) => {
+      const medida: Medida = JSON.parse((evento as MessageEvent).data);
+      if (!medida.nombre_campo) return;
+      setMedidas(prev => [medida, ...prev].slice(0, 20));
+    });
+    // Tras una reconexión se pudieron perder lecturas: recargar la tabla
+    let conectadoAntes = false;
+    eventos.onopen = () => {
+      if (conectadoAntes) cargarMedidas();
+      conectadoAntes = true;
+    };
+    return () => eventos.close();
   }, []);
 
   const handleVinculacionChange = (sensorId: number, dispositivoId: string | null) => {